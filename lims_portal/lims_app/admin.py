@@ -7,6 +7,7 @@ from django.utils.html import format_html
 from django.http import HttpResponse
 from django.core.management import call_command
 from django.contrib import messages
+from django.db import transaction
 import csv
 from io import StringIO, BytesIO
 import barcode
@@ -167,20 +168,21 @@ class historyAdmin(admin.ModelAdmin):
     def mark_returned_view(self, request, history_id):
         """Handle the 'Mark as Returned' action."""
         history = get_object_or_404(BorrowHistory, pk=history_id)
-        history.returned = True
-        history.save()
+        with transaction.atomic():
+            history.returned = True
+            history.save()
 
-        # Update BookCopy model
-        try:
-            book_copy = BookCopy.objects.get(accessionNumber=history.bookID)
-            book_copy.status = "Available"
-            book_copy.borrowed_by = None
-            book_copy.student_id = None
-            book_copy.borrow_date = None
-            book_copy.return_date = None
-            book_copy.save()
-        except BookCopy.DoesNotExist:
-            pass
+            # Update BookCopy model
+            try:
+                book_copy = BookCopy.objects.get(accessionNumber=history.bookID)
+                book_copy.status = "Available"
+                book_copy.borrowed_by = None
+                book_copy.student_id = None
+                book_copy.borrow_date = None
+                book_copy.return_date = None
+                book_copy.save()
+            except BookCopy.DoesNotExist:
+                pass
 
         # Redirect back to the BorrowHistory changelist
         return redirect('admin:lims_app_borrowhistory_changelist')
@@ -194,10 +196,12 @@ class BookAdmin(admin.ModelAdmin):
     def total_copies_display(self, obj):
         return obj.get_total_copies()
     total_copies_display.short_description = 'Total Copies'
+    total_copies_display.admin_order_field = 'total_copies'
     
     def available_copies_display(self, obj):
         return obj.get_available_copies()
     available_copies_display.short_description = 'Available'
+    available_copies_display.admin_order_field = 'available_copies'
 
 class BookCopyAdmin(admin.ModelAdmin):
     change_list_template = "admin/book_change_list.html"
@@ -297,7 +301,9 @@ class BookCopyAdmin(admin.ModelAdmin):
             copy_instance.borrow_date = None
             copy_instance.return_date = None
 
-        copy_instance.save()
+        # Book's available/borrowed counters follow in the same transaction
+        with transaction.atomic():
+            copy_instance.save()
         return redirect("/admin/lims_app/bookcopy/")  # Redirect after approval
 
 # Register your models and custom admin
@@ -0,0 +1,749 @@
+"""
+The analytics dashboard: aggregate helpers, the panel providers that
+compute each section of the page, and the cache that holds their results.
+
+Everything here is computed in the database and returns small, already
+aggregated results, so the cost of a page view does not grow with the
+size of the borrow history.
+
+Each panel (ANALYTICS_PANELS) is cached separately on only the parameters
+it depends on. Keys also carry the catalog version (bumped by Book/BookCopy
+writes), a circulation version (bumped by BorrowHistory/students writes,
+see signals.py) and the local date, so any write makes the old entries
+unreachable and they age out with their TTL.
+
+Panels can also be precomputed by `python manage.py refresh_analytics`
+into AnalyticsSnapshot rows; a cache miss then starts from the latest
+snapshot and only recomputes what changed since it was taken.
+
+compute_panels() runs several providers at once on a bounded thread pool
+(settings.ANALYTICS_MAX_WORKERS). Each worker thread gets its own database
+connection, which works well with SQLite in WAL mode since readers do not
+block each other, and reports how long it spent waiting on SQL.
+"""
+import hashlib
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, Func, IntegerField, Max, OuterRef, Q, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import rollups
+from .profiling import QueryTimer, record_queries
+from .catalog import get_availability_version, get_catalog_version
+from .models import AnalyticsSnapshot, Book, BookCopy, BorrowHistory, students
+
+ANALYTICS_PARAMS = ('period', 'start_date', 'end_date', 'heatmap_range', 'heatmap_offset')
+ANALYTICS_CACHE_TIMEOUT = 5 * 60
+
+CIRCULATION_VERSION_KEY = 'lims:circulation_version'
+
+
+def get_circulation_version():
+    version = cache.get(CIRCULATION_VERSION_KEY)
+    if version is None:
+        version = int(time.time() * 1000)
+        if not cache.add(CIRCULATION_VERSION_KEY, version, timeout=None):
+            version = cache.get(CIRCULATION_VERSION_KEY, version)
+    return version
+
+
+def bump_circulation_version():
+    try:
+        return cache.incr(CIRCULATION_VERSION_KEY)
+    except ValueError:
+        version = int(time.time() * 1000)
+        cache.set(CIRCULATION_VERSION_KEY, version, timeout=None)
+        return version
+
+
+def analytics_cache_key(panel, params):
+    """Cache key for one panel computed from `params` (only the ones it uses)."""
+    query = urlencode(sorted(params.items()))
+    digest = hashlib.md5(query.encode()).hexdigest()
+    return (
+        f'lims:analytics:{panel}:{get_catalog_version()}:{get_availability_version()}:{get_circulation_version()}:'
+        f'{timezone.localdate().isoformat()}:{digest}'
+    )
+
+# (label, lowest day, highest day) - None means open-ended
+DURATION_BUCKETS = (
+    ('Same day', 0, 0),
+    ('1 day', 1, 1),
+    ('2 days', 2, 2),
+    ('3 days', 3, 3),
+    ('4-7 days', 4, 7),
+    ('8-14 days', 8, 14),
+    ('15-30 days', 15, 30),
+    ('31+ days', 31, None),
+)
+
+
+class DurationDays(Func):
+    """Whole days between two datetime expressions, like `(end - start).days`."""
+    arity = 2  # (start, end)
+    output_field = IntegerField()
+
+    def _compile_bounds(self, compiler):
+        start_sql, start_params = compiler.compile(self.source_expressions[0])
+        end_sql, end_params = compiler.compile(self.source_expressions[1])
+        return start_sql, start_params, end_sql, end_params
+
+    def as_sql(self, compiler, connection, **extra_context):
+        start_sql, start_params, end_sql, end_params = self._compile_bounds(compiler)
+        return f'EXTRACT(DAY FROM ({end_sql} - {start_sql}))', (*end_params, *start_params)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        start_sql, start_params, end_sql, end_params = self._compile_bounds(compiler)
+        # Round to whole seconds first so julianday() float error cannot
+        # push an exact N-day loan down to N-1
+        sql = f'(CAST(ROUND((julianday({end_sql}) - julianday({start_sql})) * 86400) AS INTEGER) / 86400)'
+        return sql, (*end_params, *start_params)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        start_sql, start_params, end_sql, end_params = self._compile_bounds(compiler)
+        return f'TIMESTAMPDIFF(DAY, {start_sql}, {end_sql})', (*start_params, *end_params)
+
+
+def _percentile(duration_counts, total, fraction):
+    """Nearest-rank percentile over sorted (days, count) pairs."""
+    if not total:
+        return 0
+    rank = max(1, math.ceil(total * fraction))
+    seen = 0
+    for days, count in duration_counts:
+        seen += count
+        if seen >= rank:
+            return days
+    return duration_counts[-1][0]
+
+
+def borrow_duration_counts(queryset=None):
+    """[(days, count)] for completed loans, sorted by days, in one grouped query."""
+    if queryset is None:
+        queryset = BorrowHistory.objects.all()
+    return list(
+        queryset.filter(returned=True, return_date__isnull=False, borrow_date__isnull=False)
+        .annotate(days=DurationDays(F('borrow_date'), F('return_date')))
+        .values('days')
+        .annotate(count=Count('id'))
+        .order_by('days')
+        .values_list('days', 'count')
+    )
+
+
+def borrow_duration_stats(queryset=None, duration_counts=None):
+    """Average, median, p90 and a histogram of completed loan durations (in days).
+
+    One grouped query returns how many loans lasted each whole number of
+    days; the statistics are derived from those few rows in Python. Pass
+    `duration_counts` (from borrow_duration_counts) to skip the query.
+    """
+    if duration_counts is None:
+        duration_counts = borrow_duration_counts(queryset)
+    total = sum(count for _, count in duration_counts)
+
+    histogram = []
+    for label, low, high in DURATION_BUCKETS:
+        histogram.append({
+            'label': label,
+            'count': sum(
+                count for days, count in duration_counts
+                if days >= low and (high is None or days <= high)
+            ),
+        })
+
+    return {
+        'count': total,
+        'avg_days': sum(days * count for days, count in duration_counts) / total if total else 0.0,
+        'median_days': _percentile(duration_counts, total, 0.5),
+        'p90_days': _percentile(duration_counts, total, 0.9),
+        'histogram': histogram,
+    }
+
+
+# ---------------------------------
+# PANEL PROVIDERS
+# ---------------------------------
+# Each provider computes one independent section of the analytics page from
+# the request parameters and returns a JSON-serializable dict. The page
+# renders the KPI panel itself and fetches the others in parallel from the
+# analytics_panel endpoint; the export merges all of them.
+
+def shift_month(year, month, delta):
+    month += delta
+    while month > 12:
+        month -= 12
+        year += 1
+    while month < 1:
+        month += 12
+        year -= 1
+    return year, month
+
+
+def resolve_period(params, now):
+    """(period, start_date, end_date, label) for the period selector parameters."""
+    period = params.get('period') or 'month'
+    today = now.date()
+
+    if period == 'range':
+        start_candidate = parse_date(params.get('start_date') or '') if params.get('start_date') else None
+        end_candidate = parse_date(params.get('end_date') or '') if params.get('end_date') else None
+        if start_candidate and end_candidate:
+            if start_candidate > end_candidate:
+                start_candidate, end_candidate = end_candidate, start_candidate
+            label = f"{start_candidate.strftime('%b %d, %Y')} - {end_candidate.strftime('%b %d, %Y')}"
+            return period, start_candidate, end_candidate, label
+        period = 'month'
+
+    if period == 'day':
+        return period, today, today, "Today"
+    if period == 'week':
+        return period, (now - timedelta(days=now.weekday())).date(), today, "This Week"
+    if period == 'quarter':
+        quarter_month = ((now.month - 1) // 3) * 3 + 1
+        return period, now.replace(month=quarter_month, day=1).date(), today, "This Quarter"
+    if period == 'year':
+        return period, now.replace(month=1, day=1).date(), today, "This Year"
+    return 'month', now.replace(day=1).date(), today, "This Month"
+
+
+def kpis_panel(params, now, duration_stats=None):
+    # ========== CORE METRICS ==========
+    total_books_count = Book.objects.count()
+    # Count all students
+    total_accounts = students.objects.count()
+    total_borrows_all_time = BorrowHistory.objects.count()
+    # count book copies marked as Borrowed in BookCopy.status
+    currently_borrowed = BookCopy.objects.filter(status='Borrowed').count()
+    available_books = BookCopy.objects.filter(status='Available').count()
+
+    # Overdue books (borrow records not returned and past return_date)
+    overdue_books = BorrowHistory.objects.filter(returned=False, return_date__lt=now).count()
+
+    # ========== TIME-BASED FILTERS ==========
+    period, period_start_date, period_end_date, period_label = resolve_period(params, now)
+
+    # Period-specific metrics, summed from the daily rollup
+    period_totals = rollups.period_totals(period_start_date, period_end_date)
+
+    # ========== RETURN RATE CALCULATION ==========
+    returned_count = BorrowHistory.objects.filter(returned=True).count()
+    return_rate = (returned_count / total_borrows_all_time * 100) if total_borrows_all_time > 0 else 0.0
+
+    # ========== BORROW DURATION ==========
+    if duration_stats is None:
+        duration_stats = borrow_duration_stats()
+    avg_borrow_days = duration_stats['avg_days']
+
+    return {
+        # Core counts
+        "total_books_count": total_books_count,
+        "total_accounts": total_accounts,
+        "total_users_count": total_accounts,
+        "total_borrows_all_time": total_borrows_all_time,
+        "currently_borrowed": currently_borrowed,
+        "available_books": available_books,
+        "available_books_count": available_books,
+        "overdue_books": overdue_books,
+
+        # Percent / UI helpers (avoid template math)
+        "utilization_percent": int(currently_borrowed / total_books_count * 100) if total_books_count > 0 else 0,
+        "avg_borrow_percent": int(min((avg_borrow_days / 14) * 100, 100)),  # relative to a 14-day baseline
+        "return_rate": round(return_rate, 1),
+
+        # Period-specific
+        "period_borrows": period_totals['borrows'],
+        "period_returns": period_totals['returns'],
+        "period_new_accounts": period_totals['new_students'],
+        "period_overdue": period_totals['overdue'] + rollups.open_overdue(period_start_date, period_end_date, now),
+        "period_label": period_label,
+        "period_value": period,
+        "period_start": period_start_date,
+        "period_end": period_end_date,
+        "range_start": period_start_date if period == 'range' else None,
+        "range_end": period_end_date if period == 'range' else None,
+
+        # Borrow duration
+        "avg_borrow_days": avg_borrow_days,
+        "median_borrow_days": duration_stats['median_days'],
+        "p90_borrow_days": duration_stats['p90_days'],
+        "durationLabels": [bucket['label'] for bucket in duration_stats['histogram']],
+        "durationData": [bucket['count'] for bucket in duration_stats['histogram']],
+    }
+
+
+def trends_panel(params, now):
+    # ========== MONTHLY BORROWS (Last 7 months) ==========
+    monthly_labels = []
+    monthly_data = []
+    months_back = 6
+    first_year, first_month = shift_month(now.year, now.month, -months_back)
+    monthly = rollups.monthly_counts(datetime(first_year, first_month, 1).date())
+    for offset in range(months_back, -1, -1):
+        y, m = shift_month(now.year, now.month, -offset)
+        monthly_labels.append(datetime(y, m, 1).strftime('%b %Y'))
+        monthly_data.append(monthly.get((y, m), 0))
+
+    # ========== WEEKLY ACTIVITY (Last 7 days) ==========
+    weekly_labels = []
+    weekly_data = []
+    for day, count in rollups.daily_counts((now - timedelta(days=6)).date(), now.date()):
+        weekly_labels.append(day.strftime('%a %m/%d'))
+        weekly_data.append(count)
+
+    return {
+        "monthlyLabels": monthly_labels,
+        "monthlyData": monthly_data,
+        "weeklyLabels": weekly_labels,
+        "weeklyData": weekly_data,
+    }
+
+
+def collection_panel(params, now):
+    # ========== BOOK TYPE DISTRIBUTION ==========
+    type_qs = Book.objects.values('Type').annotate(count=Count('id')).order_by('-count')
+
+    # ========== LANGUAGE DISTRIBUTION ==========
+    language_qs = Book.objects.values('Language').annotate(count=Count('id')).order_by('-count')[:5]
+
+    # ========== LOCATION STATISTICS ==========
+    location_stats = BookCopy.objects.values('Location').annotate(
+        total=Count('id'),
+        borrowed=Count('id', filter=Q(status='Borrowed')),
+        available=Count('id', filter=Q(status='Available'))
+    ).order_by('-total')
+
+    return {
+        "typeLabels": [t['Type'] for t in type_qs],
+        "typeData": [t['count'] for t in type_qs],
+        "languageLabels": [lang['Language'] for lang in language_qs],
+        "languageData": [lang['count'] for lang in language_qs],
+        "location_stats": list(location_stats),
+    }
+
+
+LEADER_KEYS = {
+    'top_borrowers': ('accountName', 'accountID'),
+    'most_borrowed': ('bookTitle', 'bookID'),
+}
+
+
+def leaders_panel(params, now):
+    # ========== TOP BORROWERS & MOST BORROWED ==========
+    top_borrowers = BorrowHistory.objects.values(*LEADER_KEYS['top_borrowers']).annotate(borrow_count=Count('id')).order_by('-borrow_count')[:10]
+    most_borrowed = BorrowHistory.objects.values(*LEADER_KEYS['most_borrowed']).annotate(borrow_count=Count('id')).order_by('-borrow_count')[:10]
+    return {
+        "top_borrowers": list(top_borrowers),
+        "most_borrowed": list(most_borrowed),
+    }
+
+
+def demographics_panel(params, now):
+    # ========== GENDER STATISTICS ==========
+    # One grouped query for every grade x gender cell; the overall and
+    # per-batch figures below are both summed from it
+    grade_gender_counts = {
+        (row['grade_Level'], row['gender']): row['count']
+        for row in students.objects.values('grade_Level', 'gender').annotate(count=Count('id')).order_by()
+    }
+
+    # Overall gender proportions
+    overall_gender = {
+        gender: sum(count for (_, g), count in grade_gender_counts.items() if g == gender)
+        for gender in ('Male', 'Female', 'Other')
+    }
+    total_students = sum(overall_gender.values())
+    overall_gender_proportions = {k: round((v / total_students * 100), 1) if total_students > 0 else 0 for k, v in overall_gender.items()}
+
+    # Pie chart data
+    overall_gender_labels = []
+    overall_gender_data = []
+    for label, value in overall_gender_proportions.items():
+        if value > 0:
+            overall_gender_labels.append(label)
+            overall_gender_data.append(value)
+
+    # Gender proportions per batch
+    batch_gender_stats = {}
+    for grade_num in range(7, 13):
+        gender_counts = {
+            gender: grade_gender_counts.get((grade_num, gender), 0)
+            for gender in ('Male', 'Female', 'Other')
+        }
+        total = sum(gender_counts.values())
+        batch_gender_stats[f'Grade {grade_num}'] = {
+            **gender_counts,
+            'total': total,
+            'proportions': {k: round((v / total * 100), 1) if total > 0 else 0 for k, v in gender_counts.items()},
+        }
+
+    # Pie chart data for batches
+    batch_gender_pie_data = {}
+    for batch, stats in batch_gender_stats.items():
+        filtered = [(label, value) for label, value in stats['proportions'].items() if value > 0]
+        batch_gender_pie_data[batch] = {
+            'labels': [label for label, _ in filtered],
+            'data': [value for _, value in filtered],
+        }
+
+    # Batch activity (borrows per batch), grouped by the borrower's current grade
+    # in one query; accountID is matched to students.school_id
+    borrower_grade = students.objects.filter(school_id=OuterRef('accountID')).values('grade_Level')[:1]
+    grade_borrow_counts = dict(
+        BorrowHistory.objects.annotate(grade=Subquery(borrower_grade))
+        .values('grade')
+        .annotate(count=Count('id'))
+        .order_by()
+        .values_list('grade', 'count')
+    )
+    batch_activity = {f'Grade {grade_num}': grade_borrow_counts.get(grade_num, 0) for grade_num in range(7, 13)}
+    # Sort batch_activity by borrow count descending
+    sorted_batch_activity = []
+    for batch, count in sorted(batch_activity.items(), key=lambda x: x[1], reverse=True):
+        sorted_batch_activity.append({
+            'batch': batch,
+            'borrows': count,
+            'gender_proportions': batch_gender_stats[batch]['proportions'],
+            'total_students': batch_gender_stats[batch]['total']
+        })
+
+    return {
+        "overall_gender_proportions": overall_gender_proportions,
+        "overall_gender_labels": overall_gender_labels,
+        "overall_gender_data": overall_gender_data,
+        "batch_gender_stats": batch_gender_stats,
+        "batch_gender_pie_data": batch_gender_pie_data,
+        "sorted_batch_activity": sorted_batch_activity,
+    }
+
+
+def _loan_summary(loan):
+    return {
+        "book_title": loan.bookTitle,
+        "account_name": loan.accountName,
+        "account_id": loan.accountID,
+        "borrow_date": loan.borrow_date,
+        "return_date": loan.return_date,
+        "returned": loan.returned,
+    }
+
+
+def activity_panel(params, now):
+    # ========== RECENT ACTIVITY & OVERDUE DETAILS ==========
+    recent_activity = BorrowHistory.objects.order_by('-borrow_date')[:15]
+    overdue_list = BorrowHistory.objects.filter(returned=False, return_date__lt=now).order_by('return_date')[:10]
+
+    overdue = []
+    for loan in overdue_list:
+        summary = _loan_summary(loan)
+        summary["days_overdue"] = (now.date() - loan.return_date.date()).days
+        overdue.append(summary)
+    return {
+        "recent_activity": [_loan_summary(loan) for loan in recent_activity],
+        "overdue_list": overdue,
+    }
+
+
+def heatmap_panel(params, now):
+    # ========== CALENDAR HEATMAP DATA (Configurable Range & Navigation) ==========
+    heatmap_range = params.get('heatmap_range') or 'year'  # 'week', 'month', 'year'
+    try:
+        heatmap_offset = max(int(params.get('heatmap_offset') or 0), 0)
+    except ValueError:
+        heatmap_offset = 0
+    today = now.date()
+
+    if heatmap_range == 'week':
+        heatmap_start_date = today - timedelta(days=(today.weekday() + 7 * heatmap_offset))
+        heatmap_end_date = heatmap_start_date + timedelta(days=6)
+        if heatmap_offset == 0:
+            heatmap_period_label = 'This Week'
+        else:
+            heatmap_period_label = f"Week of {heatmap_start_date.strftime('%b %d, %Y')}"
+    elif heatmap_range == 'month':
+        # Go back N months
+        year, month = shift_month(today.year, today.month, -heatmap_offset)
+        heatmap_start_date = datetime(year, month, 1).date()
+        next_year, next_month = shift_month(year, month, 1)
+        heatmap_end_date = datetime(next_year, next_month, 1).date() - timedelta(days=1)
+        heatmap_period_label = heatmap_start_date.strftime('%B %Y')
+    else:  # 'year' or default
+        heatmap_range = 'year'
+        # Go back N years
+        year = today.year - heatmap_offset
+        heatmap_start_date = datetime(year, 1, 1).date()
+        heatmap_end_date = datetime(year, 12, 31).date()
+        heatmap_period_label = str(year)
+
+    heatmap_data = [
+        {'date': day.strftime('%Y-%m-%d'), 'count': count}
+        for day, count in rollups.daily_counts(heatmap_start_date, heatmap_end_date)
+    ]
+
+    return {
+        "heatmapData": heatmap_data,
+        "heatmapRange": heatmap_range,
+        "heatmapOffset": heatmap_offset,
+        "heatmapPeriodLabel": heatmap_period_label,
+        "heatmapCanGoNext": heatmap_offset > 0,
+        "heatmapPrevOffset": heatmap_offset + 1,
+        "heatmapNextOffset": max(heatmap_offset - 1, 0),
+    }
+
+
+# name -> (provider, the ANALYTICS_PARAMS it depends on)
+ANALYTICS_PANELS = {
+    'kpis': (kpis_panel, ('period', 'start_date', 'end_date')),
+    'trends': (trends_panel, ()),
+    'collection': (collection_panel, ()),
+    'leaders': (leaders_panel, ()),
+    'demographics': (demographics_panel, ()),
+    'activity': (activity_panel, ()),
+    'heatmap': (heatmap_panel, ('heatmap_range', 'heatmap_offset')),
+}
+
+
+# What an absent parameter means, so "no parameters" and the explicit
+# defaults share cache entries and snapshots
+ANALYTICS_PARAM_DEFAULTS = {'period': 'month', 'heatmap_range': 'year', 'heatmap_offset': '0'}
+
+
+def panel_params(name, params):
+    """The parameters panel `name` depends on, with defaults filled in."""
+    return {
+        param: params.get(param) or ANALYTICS_PARAM_DEFAULTS.get(param, '')
+        for param in ANALYTICS_PANELS[name][1]
+    }
+
+
+def get_panel(name, params, refresh=False):
+    """One panel's data, cached on only the parameters that panel depends on.
+
+    On a cache miss the panel is rebuilt from its latest snapshot when one
+    exists (see take_snapshots), otherwise computed from scratch. refresh
+    skips both the cache and the snapshots.
+    """
+    provider, _ = ANALYTICS_PANELS[name]
+    params = {**params, **panel_params(name, params)}
+    key = analytics_cache_key(name, panel_params(name, params))
+    data = None if refresh else cache.get(key)
+    if data is None:
+        now = timezone.now()
+        data = None if refresh else panel_from_snapshot(name, params, now)
+        if data is None:
+            data = provider(params, now)
+        data['computed_at'] = now
+        cache.set(key, data, ANALYTICS_CACHE_TIMEOUT)
+    return data
+
+
+# ---------------------------------
+# SNAPSHOTS
+# ---------------------------------
+# `python manage.py refresh_analytics` stores the default views as
+# AnalyticsSnapshot rows. A panel listed here is then served from its latest
+# snapshot plus a delta covering only what happened after the snapshot:
+#   * kpis: the duration histogram is kept in the snapshot and topped up
+#     with loans returned since; the remaining counts are cheap COUNTs.
+#   * leaders: the top LEADER_CANDIDATES borrowers/books are kept and
+#     topped up with loans whose id is above the snapshot's watermark.
+#   * heatmap: only the days from the snapshot's date onwards are re-read.
+# Edits to or deletions of loans from before the snapshot are not seen
+# until the next refresh (or a ?refresh=1 request).
+SNAPSHOT_DEFAULT_VIEWS = (
+    ('kpis', {'period': 'month'}),
+    ('heatmap', {'heatmap_range': 'year', 'heatmap_offset': '0'}),
+    ('leaders', {}),
+)
+SNAPSHOT_MAX_AGE = timedelta(days=1)
+LEADER_CANDIDATES = 100
+
+
+def _kpis_state(params, now):
+    return {'durations': borrow_duration_counts()}
+
+
+def _kpis_from_snapshot(snapshot, params, now):
+    durations = dict((days, count) for days, count in snapshot.state['durations'])
+    recent = BorrowHistory.objects.filter(return_date__gt=snapshot.computed_at)
+    for days, count in borrow_duration_counts(recent):
+        durations[days] = durations.get(days, 0) + count
+    duration_stats = borrow_duration_stats(duration_counts=sorted(durations.items()))
+    return kpis_panel(params, now, duration_stats=duration_stats)
+
+
+def _leaders_state(params, now):
+    return {
+        name: list(
+            BorrowHistory.objects.values(*keys).annotate(borrow_count=Count('id'))
+            .order_by('-borrow_count')[:LEADER_CANDIDATES]
+        )
+        for name, keys in LEADER_KEYS.items()
+    }
+
+
+def _leaders_from_snapshot(snapshot, params, now):
+    data = {}
+    new_loans = BorrowHistory.objects.filter(id__gt=snapshot.loan_watermark)
+    for name, keys in LEADER_KEYS.items():
+        counts = {tuple(row[key] for key in keys): row['borrow_count'] for row in snapshot.state[name]}
+        for row in new_loans.values(*keys).annotate(borrow_count=Count('id')).order_by():
+            key = tuple(row[key] for key in keys)
+            counts[key] = counts.get(key, 0) + row['borrow_count']
+        ranked = sorted(counts.items(), key=lambda item: -item[1])[:10]
+        data[name] = [{**dict(zip(keys, key)), 'borrow_count': count} for key, count in ranked]
+    return data
+
+
+def _heatmap_from_snapshot(snapshot, params, now):
+    data = dict(snapshot.data)
+    days = data['heatmapData']
+    today = timezone.localtime(now).date()
+    since = timezone.localtime(snapshot.computed_at).date()
+    if not days or not days[0]['date'] <= today.isoformat() <= days[-1]['date']:
+        return None  # the snapshot's range is over (e.g. a new year began)
+    last_day = parse_date(days[-1]['date'])
+    recent = {day.isoformat(): count for day, count in rollups.daily_counts(since, last_day)}
+    data['heatmapData'] = [
+        {'date': day['date'], 'count': recent.get(day['date'], day['count'])} for day in days
+    ]
+    return data
+
+
+# name -> (state builder or None, delta function)
+SNAPSHOT_PANELS = {
+    'kpis': (_kpis_state, _kpis_from_snapshot),
+    'leaders': (_leaders_state, _leaders_from_snapshot),
+    'heatmap': (None, _heatmap_from_snapshot),
+}
+
+
+def _params_key(name, params):
+    return urlencode(sorted(panel_params(name, params).items()))
+
+
+def panel_from_snapshot(name, params, now):
+    """Panel `name` rebuilt from its latest usable snapshot, or None."""
+    if name not in SNAPSHOT_PANELS:
+        return None
+    snapshot = (
+        AnalyticsSnapshot.objects.filter(
+            panel=name, params=_params_key(name, params), computed_at__gte=now - SNAPSHOT_MAX_AGE,
+        ).order_by('-version').first()
+    )
+    if snapshot is None:
+        return None
+    data = SNAPSHOT_PANELS[name][1](snapshot, params, now)
+    if data is not None:
+        data['snapshot_version'] = snapshot.version
+    return data
+
+
+def take_snapshots(views=SNAPSHOT_DEFAULT_VIEWS, keep=3):
+    """Compute and store `views` ((panel, params) pairs) as a new snapshot version.
+
+    Everything is read inside one transaction, so the loan watermark and
+    the aggregates describe the same state of the database. Versions older
+    than the newest `keep` are deleted. Returns the new version number.
+    """
+    with transaction.atomic():
+        loan_watermark = BorrowHistory.objects.aggregate(last=Max('id'))['last'] or 0
+        now = timezone.now()
+        version = (AnalyticsSnapshot.objects.aggregate(last=Max('version'))['last'] or 0) + 1
+        snapshots = []
+        for name, params in views:
+            provider, _ = ANALYTICS_PANELS[name]
+            params = {**params, **panel_params(name, params)}
+            state_builder = SNAPSHOT_PANELS.get(name, (None, None))[0]
+            snapshots.append(AnalyticsSnapshot(
+                panel=name,
+                params=_params_key(name, params),
+                version=version,
+                computed_at=now,
+                loan_watermark=loan_watermark,
+                data=provider(params, now),
+                state=state_builder(params, now) if state_builder else {},
+            ))
+        AnalyticsSnapshot.objects.bulk_create(snapshots)
+        AnalyticsSnapshot.objects.filter(version__lte=version - keep).delete()
+    return version
+
+
+def _timed_panel(name, params, refresh, close_connection):
+    timer = QueryTimer()
+    start = time.perf_counter()
+    try:
+        with connection.execute_wrapper(timer):
+            data = get_panel(name, params, refresh=refresh)
+    finally:
+        if close_connection:
+            # Worker threads open their own connection; don't leak it
+            connection.close()
+    timing = {
+        'wall_ms': round((time.perf_counter() - start) * 1000, 1),
+        'query_ms': round(timer.seconds * 1000, 1),
+        'queries': timer.queries,
+    }
+    return data, timing
+
+
+def compute_panels(names, params, refresh=False, max_workers=None):
+    """Compute several panels concurrently; returns ({name: data}, timings).
+
+    timings holds the overall wall-clock time, the summed SQL time of every
+    panel (what a single connection would have spent back to back) and the
+    per-panel breakdown. Inside an open transaction (e.g. a test case, or a
+    request using ATOMIC_REQUESTS) other connections cannot see uncommitted
+    rows, so the panels are computed serially on the current connection.
+    """
+    if max_workers is None:
+        max_workers = getattr(settings, 'ANALYTICS_MAX_WORKERS', 1)
+    workers = min(max_workers, len(names))
+    if connection.in_atomic_block:
+        workers = 1
+
+    start = time.perf_counter()
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='analytics') as executor:
+            futures = {name: executor.submit(_timed_panel, name, params, refresh, True) for name in names}
+            results = {name: future.result() for name, future in futures.items()}
+        # The request's own query timer only sees this thread's connection
+        record_queries(
+            sum(timing['queries'] for _, timing in results.values()),
+            sum(timing['query_ms'] for _, timing in results.values()) / 1000,
+        )
+    else:
+        results = {name: _timed_panel(name, params, refresh, False) for name in names}
+
+    panels = {name: data for name, (data, _) in results.items()}
+    per_panel = {name: timing for name, (_, timing) in results.items()}
+    timings = {
+        'workers': workers,
+        'wall_ms': round((time.perf_counter() - start) * 1000, 1),
+        'query_ms': round(sum(timing['query_ms'] for timing in per_panel.values()), 1),
+        'queries': sum(timing['queries'] for timing in per_panel.values()),
+        'panels': per_panel,
+    }
+    return panels, timings
+
+
+def get_analytics_metrics(params, refresh=False):
+    """Every panel merged into one dict; computed_at is that of the oldest panel.
+
+    The panel timings from compute_panels() are included under 'timings'.
+    """
+    panels, timings = compute_panels(list(ANALYTICS_PANELS), params, refresh=refresh)
+    metrics = {}
+    for name in ANALYTICS_PANELS:
+        metrics.update(panels[name])
+    metrics['computed_at'] = min(panel['computed_at'] for panel in panels.values())
+    metrics['timings'] = timings
+    return metrics
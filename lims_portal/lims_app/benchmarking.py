@@ -0,0 +1,171 @@
+"""
+Request benchmarks for `python manage.py benchmark`.
+
+Each scenario is a request made through the Django test client as a staff
+user; run_scenarios() times it (perf_counter around client.get/post) and
+counts its SQL queries with a QueryTimer. By default the cache is cleared
+before every request so the figures describe the real work a view does,
+not a cache hit. seed_database() fills an empty database with a
+deterministic catalog, roster and loan history of a given size (see
+sample_data.py).
+"""
+import math
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+
+from . import sample_data
+from .models import BookCopy, students
+from .profiling import QueryTimer
+
+BENCHMARK_USER = 'benchmark'
+
+# (name, URL, query parameters); POST scenarios are handled separately
+GET_SCENARIOS = (
+    ('records', '/records/', {}),
+    ('records_browse', '/records/data/', {'draw': 1, 'start': 0, 'length': 25}),
+    ('records_filter', '/records/data/', {'draw': 1, 'start': 0, 'length': 25, 'language': 'English', 'location': 'Math Section - Shelf C1'}),
+    ('records_search', '/records/data/', {'draw': 1, 'start': 0, 'length': 25, 'search': 'physics'}),
+    # the public books/ view renders a books.html that is not in the tree;
+    # the staff book list is the catalog page that actually renders
+    ('books', '/library-admin/books/', {}),
+    ('books_search', '/library-admin/books/', {'search': 'chemistry'}),
+    *(
+        (f'analytics_{period}', '/library-admin/analytics/', {'period': period})
+        for period in ('day', 'week', 'month', 'quarter', 'year')
+    ),
+    *(
+        (f'analytics_heatmap_{heatmap_range}', '/library-admin/analytics/panel/heatmap/', {'heatmap_range': heatmap_range})
+        for heatmap_range in ('week', 'month', 'year')
+    ),
+    ('admin_dashboard', '/library-admin/', {}),
+)
+# each checkout is followed by a return of the same copy, so they run (and report) in pairs;
+# the dashboard form posts re-render the page, the JSON endpoints do not
+POST_SCENARIOS = (('checkout', 'return'), ('checkout_api', 'return_api'))
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[max(1, math.ceil(len(values) * fraction)) - 1]
+
+
+def _summarize(samples):
+    durations = [ms for ms, _ in samples]
+    queries = [count for _, count in samples]
+    return {
+        'runs': len(samples),
+        'p50_ms': round(_percentile(durations, 0.5), 2),
+        'p95_ms': round(_percentile(durations, 0.95), 2),
+        'mean_ms': round(sum(durations) / len(durations), 2),
+        'queries': max(queries),
+    }
+
+
+# ---------------------------------
+# SEEDING
+# ---------------------------------
+def seed_database(copies, seed=0):
+    """Fill an empty database with about `copies` copies (3 per title), one
+    student per 15 copies and two years of loans, via sample_data.generate().
+    Returns the row counts it reports.
+    """
+    return sample_data.generate(
+        books=max(copies // 3, 1),
+        copies_per_book=3,
+        student_count=max(copies // 15, 60),
+        years=2,
+        loans_per_copy=3,
+        seed=seed,
+    )
+
+
+# ---------------------------------
+# RUNNING
+# ---------------------------------
+def _timed(client, method, url, data, warm):
+    if not warm:
+        cache.clear()
+    timer = QueryTimer()
+    start = time.perf_counter()
+    with connection.execute_wrapper(timer):
+        response = getattr(client, method)(url, data)
+        if response.streaming:
+            b''.join(response.streaming_content)
+    elapsed = (time.perf_counter() - start) * 1000
+    if response.status_code >= 400:
+        raise RuntimeError(f'{method.upper()} {url} returned {response.status_code}')
+    return elapsed, timer.queries
+
+
+def run_scenarios(iterations=10, warm=False, scenarios=None):
+    """Run every scenario `iterations` times; returns {name: summary}."""
+    user, _ = User.objects.get_or_create(username=BENCHMARK_USER, defaults={'is_staff': True, 'is_superuser': True})
+    client = Client()
+    client.force_login(user)
+    wanted = set(scenarios) if scenarios else None
+
+    results = {}
+    for name, url, params in GET_SCENARIOS:
+        if wanted and name not in wanted:
+            continue
+        _timed(client, 'get', url, params, warm=True)  # warm-up: imports, template loading
+        results[name] = _summarize([_timed(client, 'get', url, params, warm) for _ in range(iterations)])
+
+    pairs = [pair for pair in POST_SCENARIOS if not wanted or wanted & set(pair)]
+    if pairs:
+        available = list(
+            BookCopy.objects.filter(status='Available').order_by('id').values_list('accessionNumber', flat=True)[:iterations]
+        )
+        student_id = students.objects.order_by('id').values_list('school_id', flat=True).first()
+        requests = {
+            'checkout': lambda accession: ('/library-admin/', {
+                'action': 'checkout', 'book_id': accession, 'student_id': student_id, 'active_view': 'checkout',
+            }),
+            'return': lambda accession: ('/library-admin/', {
+                'action': 'return_barcode', 'accession_number': accession, 'active_view': 'return',
+            }),
+            'checkout_api': lambda accession: ('/library-admin/circulation/checkout/', {
+                'book_id': accession, 'student_id': student_id,
+            }),
+            'return_api': lambda accession: ('/library-admin/circulation/return/', {
+                'accession_number': accession,
+            }),
+        }
+        for pair in pairs:
+            samples = {name: [] for name in pair}
+            for accession in available:
+                for name in pair:
+                    samples[name].append(_timed(client, 'post', *requests[name](accession), warm))
+            if available:
+                results.update({name: _summarize(samples[name]) for name in pair})
+    return results
+
+
+def compare(previous, current, threshold=0.2):
+    """Regressions between two benchmark reports (same format as the command's JSON).
+
+    A scenario regresses when its p50 grew by more than `threshold` (a
+    fraction) or it runs more queries than before. Returns a list of
+    human-readable lines.
+    """
+    old_scales = {scale['scale']: scale['results'] for scale in previous.get('scales', [])}
+    regressions = []
+    for scale in current['scales']:
+        old_results = old_scales.get(scale['scale'], {})
+        for name, result in scale['results'].items():
+            old = old_results.get(name)
+            if not old:
+                continue
+            if old['p50_ms'] and result['p50_ms'] > old['p50_ms'] * (1 + threshold):
+                regressions.append(
+                    f"{scale['scale']} copies / {name}: p50 {old['p50_ms']}ms -> {result['p50_ms']}ms"
+                )
+            if result['queries'] > old['queries']:
+                regressions.append(
+                    f"{scale['scale']} copies / {name}: queries {old['queries']} -> {result['queries']}"
+                )
+    return regressions
@@ -0,0 +1,299 @@
+"""
+Shared catalog helpers: the catalog version counter, cached facet value
+lists, the constant-query catalog serializer and the in-memory suggestion
+index used by the search typeahead.
+
+The version counters live in Django's cache and are bumped by the signal
+handlers in signals.py, so anything derived from the catalog can be keyed
+on them and go stale automatically. The catalog version changes when a
+Book or BookCopy is added, removed or re-described; a copy that only
+changes status (every checkout and return) bumps the availability version
+instead, so the facet lists and suggestion index survive circulation.
+Anything that shows copy status or counts keys on both.
+With the default LocMemCache the counters are per process; point CACHES at
+a shared backend (e.g. Memcached/Redis) when running several workers.
+"""
+import bisect
+import hashlib
+import json
+import re
+import threading
+import time
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Book, BookCopy
+
+CATALOG_VERSION_KEY = 'lims:catalog_version'
+AVAILABILITY_VERSION_KEY = 'lims:availability_version'
+CATALOG_MODIFIED_KEY = 'lims:catalog_modified'
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Seed with the clock so a restarted process never reuses an old number
+        version = int(time.time() * 1000)
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def _bump_version(key):
+    cache.set(CATALOG_MODIFIED_KEY, timezone.now(), timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Key missing (first write or evicted): start a fresh sequence
+        version = int(time.time() * 1000)
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def get_catalog_version():
+    return _get_version(CATALOG_VERSION_KEY)
+
+
+def get_availability_version():
+    return _get_version(AVAILABILITY_VERSION_KEY)
+
+
+def get_catalog_last_modified():
+    """When the catalog or a copy's status last changed (or when this process first looked)."""
+    modified = cache.get(CATALOG_MODIFIED_KEY)
+    if modified is None:
+        modified = timezone.now()
+        if not cache.add(CATALOG_MODIFIED_KEY, modified, timeout=None):
+            modified = cache.get(CATALOG_MODIFIED_KEY, modified)
+    return modified
+
+
+def bump_catalog_version():
+    return _bump_version(CATALOG_VERSION_KEY)
+
+
+def bump_availability_version():
+    return _bump_version(AVAILABILITY_VERSION_KEY)
+
+
+# ---------------------------------
+# FACET VALUE LISTS
+# ---------------------------------
+FACET_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _distinct_values(model, field):
+    return list(
+        model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+        .order_by(field).values_list(field, flat=True).distinct()
+    )
+
+
+def get_facet_values():
+    """Distinct filter values for the OPAC dropdowns, cached per catalog version.
+
+    Entries for old versions are never read again and simply age out.
+    """
+    key = f'lims:facets:{get_catalog_version()}'
+    facets = cache.get(key)
+    if facets is None:
+        facets = {
+            'languages': _distinct_values(Book, 'Language'),
+            'publishers': _distinct_values(Book, 'Publisher'),
+            'authors': _distinct_values(Book, 'mainAuthor'),
+            'coauthors': _distinct_values(Book, 'coAuthor'),
+            'locations': _distinct_values(BookCopy, 'Location'),
+        }
+        cache.set(key, facets, FACET_CACHE_TIMEOUT)
+    return facets
+
+
+def facet_counts_key(filters):
+    """Cache key for the records facet counts under `filters`.
+
+    Keyed on the catalog version like get_facet_values(). Free-text search
+    also matches copy status, so searched counts key on the availability
+    version as well.
+    """
+    version = get_catalog_version()
+    if filters.get('search'):
+        version = f'{version}:{get_availability_version()}'
+    digest = hashlib.md5(json.dumps(sorted(filters.items())).encode()).hexdigest()
+    return f'lims:facet_counts:{version}:{digest}'
+
+
+# ---------------------------------
+# CATALOG SERIALIZER
+# ---------------------------------
+BOOK_SUMMARY_FIELDS = (
+    'id', 'Title', 'mainAuthor', 'coAuthor', 'Publisher', 'Edition',
+    'callNumber', 'Language', 'Type',
+)
+BOOK_DETAIL_FIELDS = BOOK_SUMMARY_FIELDS + (
+    'placeofPublication', 'copyrightDate', 'publicationDate', 'Editors', 'acquisitionStatus',
+)
+COPY_SUMMARY_FIELDS = ('accessionNumber', 'Location', 'status')
+
+
+COPY_COUNT_FIELDS = ('total_copies', 'available_copies', 'borrowed_copies')
+
+
+def serialize_books(books_query=None, book_fields=BOOK_SUMMARY_FIELDS, copy_fields=COPY_SUMMARY_FIELDS,
+                    copy_filter=None, start=None, stop=None):
+    """Serialize books with copy counts and nested copies in exactly two queries.
+
+    One values() query returns the book rows with their stored copy counters;
+    a second values() query fetches the copies for those books, which are
+    attached in Python. `books_query` may already be filtered and ordered
+    (defaults to the whole catalog, newest first). `copy_filter` (BookCopy
+    lookups, e.g. {'Location': ...}) restricts the nested copies, and the
+    counts are then computed for that subset with Count(..., filter=Q(...))
+    instead of read from the counters. `start`/`stop` slice the book rows,
+    for paged callers.
+    """
+    if books_query is None:
+        books_query = Book.objects.order_by('-id')
+    copy_filter = copy_filter or {}
+
+    if copy_filter:
+        counted = Q(**{f'copies__{lookup}': value for lookup, value in copy_filter.items()})
+        rows_query = books_query.values(*book_fields).annotate(
+            subset_total=Count('copies', filter=counted),
+            subset_available=Count('copies', filter=counted & Q(copies__status='Available')),
+            subset_borrowed=Count('copies', filter=counted & Q(copies__status='Borrowed')),
+        )
+    else:
+        rows_query = books_query.values(*book_fields, *COPY_COUNT_FIELDS)
+    if start is not None or stop is not None:
+        rows = list(rows_query[start:stop])
+        copies_query = BookCopy.objects.filter(book_id__in=[row['id'] for row in rows])
+    else:
+        rows = list(rows_query)
+        copies_query = BookCopy.objects.filter(book_id__in=books_query.values('id'))
+
+    copies_by_book = {row['id']: [] for row in rows}
+    copy_rows = copies_query.filter(**copy_filter).order_by('accessionNumber').values('book_id', *copy_fields)
+    for copy in copy_rows:
+        copies_by_book[copy.pop('book_id')].append(copy)
+
+    for row in rows:
+        if copy_filter:
+            row['total_copies'] = row.pop('subset_total')
+            row['available_copies'] = row.pop('subset_available')
+            row['borrowed_copies'] = row.pop('subset_borrowed')
+        row['copies'] = copies_by_book[row['id']]
+    return rows
+
+
+# ---------------------------------
+# TYPEAHEAD SUGGESTION INDEX
+# ---------------------------------
+SUGGEST_FIELDS = (
+    # (key, label, rank) - lower rank wins when a book matches on several fields
+    ('Title', 'Title', 0),
+    ('mainAuthor', 'Author', 1),
+    ('coAuthor', 'Co-Author', 2),
+    ('callNumber', 'Call Number', 3),
+    ('accessionNumber', 'Accession', 4),
+)
+SUGGEST_FIELD_RANK = {label: rank for _, label, rank in SUGGEST_FIELDS}
+
+# Rebuilding is O(catalog); while the catalog keeps changing (e.g. during an
+# import) rebuild at most this often
+SUGGEST_INDEX_MIN_AGE = 30
+
+_WORD_START_RE = re.compile(r'(?<!\w)\w', re.UNICODE)
+
+
+def _normalize(text):
+    return ' '.join((text or '').lower().split())
+
+
+class SuggestionIndex:
+    """Sorted prefix index over titles, authors, call numbers and accession numbers.
+
+    Titles and author names are indexed at every word start, so "phys" finds
+    "Modern Physics"; call numbers and accession numbers only from the start.
+    Lookups are a bisect plus a short forward scan.
+    """
+
+    def __init__(self, entries):
+        entries.sort()
+        self.keys = [entry[0] for entry in entries]
+        self.entries = entries
+
+    @classmethod
+    def build(cls):
+        entries = []
+
+        def add(value, label, book_id, word_starts):
+            text = _normalize(value)
+            if not text:
+                return
+            starts = [m.start() for m in _WORD_START_RE.finditer(text)] if word_starts else [0]
+            for start in starts:
+                entries.append((text[start:], label, book_id, value))
+
+        book_rows = Book.objects.values_list('id', 'Title', 'mainAuthor', 'coAuthor', 'callNumber')
+        for book_id, title, main_author, co_author, call_number in book_rows.iterator():
+            add(title, 'Title', book_id, True)
+            add(main_author, 'Author', book_id, True)
+            add(co_author, 'Co-Author', book_id, True)
+            add(call_number, 'Call Number', book_id, False)
+        for book_id, accession in BookCopy.objects.values_list('book_id', 'accessionNumber').iterator():
+            add(accession, 'Accession', book_id, False)
+        return cls(entries)
+
+    def lookup(self, query, limit=8, scan_limit=500):
+        """Return up to `limit` (book_id, label, value) hits, one per book."""
+        prefix = _normalize(query)
+        if not prefix:
+            return []
+        best = {}
+        i = bisect.bisect_left(self.keys, prefix)
+        scanned = 0
+        while i < len(self.keys) and self.keys[i].startswith(prefix) and scanned < scan_limit:
+            _, label, book_id, value = self.entries[i]
+            rank = (SUGGEST_FIELD_RANK[label], len(value))
+            if book_id not in best or rank < best[book_id][0]:
+                best[book_id] = (rank, label, value)
+            i += 1
+            scanned += 1
+        ranked = sorted(best.items(), key=lambda item: (item[1][0], -item[0]))
+        return [(book_id, label, value) for book_id, (_, label, value) in ranked[:limit]]
+
+
+_suggest_lock = threading.Lock()
+_suggest_state = {'index': None, 'version': None, 'built_at': 0.0}
+
+
+def get_suggestion_index():
+    """Return the process-wide suggestion index, rebuilding it when the catalog changed."""
+    version = get_catalog_version()
+    state = _suggest_state
+    stale = state['version'] != version and time.monotonic() - state['built_at'] >= SUGGEST_INDEX_MIN_AGE
+    if state['index'] is None or stale:
+        with _suggest_lock:
+            if state['index'] is None or (
+                state['version'] != version and time.monotonic() - state['built_at'] >= SUGGEST_INDEX_MIN_AGE
+            ):
+                state['index'] = SuggestionIndex.build()
+                state['version'] = version
+                state['built_at'] = time.monotonic()
+    return state['index']
+
+
+def make_snippet(value, query, width=60):
+    """Cut `value` down to roughly `width` characters around the first match."""
+    value = value or ''
+    if len(value) <= width:
+        return value
+    pos = value.lower().find((query or '').lower())
+    if pos < 0:
+        return value[:width].rstrip() + '…'
+    start = max(0, pos - width // 3)
+    end = start + width
+    snippet = value[start:end].strip()
+    return ('…' if start > 0 else '') + snippet + ('…' if end < len(value) else '')
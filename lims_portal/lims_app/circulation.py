@@ -0,0 +1,306 @@
+"""
+Checkout and return, shared by the dashboard's form posts and the JSON
+circulation endpoints used by the desk scanner.
+
+Each operation either returns the affected BorrowHistory row or raises
+CirculationError with the message shown to staff. counters() returns the
+figures the dashboard displays, so a JSON caller can update the page in
+place instead of re-rendering it.
+
+Every write is a conditional UPDATE inside one transaction: a copy is
+claimed with UPDATE ... WHERE status='Available' and a loan is closed with
+UPDATE ... WHERE returned=0, and RETURNING id says exactly which rows this
+call changed. When two desks scan the same copy at once, only one UPDATE
+matches it and the other desk gets the usual "not available" / "no active
+borrow record" error, so a copy can never end up with two open loans.
+
+checkout_many()/return_many() handle a stack of books at once; the single
+operations are a batch of one. They validate with set-based lookups, write
+with bulk_create and conditional UPDATEs and report a result per accession
+number. Bulk writes skip the post_save signals, so they update the copy
+counters and rollup themselves and queue the search index and cache
+version updates for after the commit, as the signal handlers do.
+"""
+from collections import defaultdict
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import rollups, search
+from .analytics import bump_circulation_version
+from .catalog import bump_availability_version
+from .models import Book, BookCopy, BorrowHistory, students
+from .rollups import overdue_cutoff
+from .signals import after_commit
+
+
+class CirculationError(Exception):
+    """A checkout or return that cannot go ahead; str() is the message for staff."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _not_found(accession_number):
+    return CirculationError(f'Book copy with accession number {accession_number} not found.', status=404)
+
+
+def _not_available(book_copy):
+    return CirculationError(f'Book "{book_copy.book.Title}" is not available for checkout.')
+
+
+def _no_open_loan(accession_number):
+    return CirculationError(f'No active borrow record found for accession number: {accession_number}', status=404)
+
+
+def _accession_list(accession_numbers):
+    """Stripped, non-blank accession numbers, each once, in the order given."""
+    seen = {}
+    for accession_number in accession_numbers:
+        accession_number = (accession_number or '').strip()
+        if accession_number:
+            seen.setdefault(accession_number, None)
+    return list(seen)
+
+
+def _copies_by_accession(accession_numbers):
+    copies = BookCopy.objects.filter(accessionNumber__in=accession_numbers).select_related('book')
+    return {copy.accessionNumber: copy for copy in copies}
+
+
+def _update_won(model, ids, where, **values):
+    """UPDATE `model` SET `values` WHERE id IN `ids` AND every `where` field
+    still has its value; returns the set of ids this statement changed.
+
+    QuerySet.update() only reports how many rows matched, which cannot tell
+    which ones this call won once another desk has taken some of them.
+    """
+    meta = model._meta
+    quote = connection.ops.quote_name
+
+    def column(name):
+        return quote(meta.get_field(name).column)
+
+    assignments = ', '.join(f'{column(name)} = %s' for name in values)
+    conditions = ''.join(f' AND {column(name)} = %s' for name in where)
+    placeholders = ', '.join(['%s'] * len(ids))
+    params = [meta.get_field(name).get_db_prep_save(value, connection) for name, value in values.items()]
+    params += ids
+    params += [meta.get_field(name).get_db_prep_value(value, connection) for name, value in where.items()]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {quote(meta.db_table)} SET {assignments} '
+            f'WHERE {column("id")} IN ({placeholders}){conditions} RETURNING {column("id")}',
+            params,
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def _sync_after_bulk_write(book_ids, loan_changes):
+    """What the post_save signals would have done for the bulk writes."""
+    Book.recount_copies(Book.objects.filter(pk__in=book_ids))
+    rollups.apply_loan_changes(loan_changes)
+    after_commit(search.index_books, book_ids)
+    after_commit(bump_availability_version)
+    after_commit(bump_circulation_version)
+
+
+# ---------------------------------
+# CHECKOUT
+# ---------------------------------
+def _checkout(student_id, accession_numbers):
+    """[(accession_number, BorrowHistory or CirculationError)] for a batch checkout."""
+    student = students.objects.filter(school_id=student_id).values('name', 'grade_Level').first()
+    if student is None:
+        raise CirculationError(f"Error checking out book: No student found with school ID '{student_id}'.")
+
+    copies = _copies_by_accession(accession_numbers)
+    outcomes = {}
+    candidates = []
+    for accession_number in accession_numbers:
+        copy = copies.get(accession_number)
+        if copy is None:
+            outcomes[accession_number] = _not_found(accession_number)
+        elif copy.status != 'Available':
+            outcomes[accession_number] = _not_available(copy)
+        else:
+            candidates.append(copy)
+
+    if candidates:
+        now = timezone.now()
+        with transaction.atomic():
+            won = _update_won(
+                BookCopy, [copy.id for copy in candidates], {'status': 'Available'},
+                status='Borrowed', borrowed_by=student_id, student_id=student_id, borrow_date=now,
+            )
+            for copy in candidates:
+                if copy.id not in won:
+                    # Another desk checked it out since it was read
+                    outcomes[copy.accessionNumber] = _not_available(copy)
+            candidates = [copy for copy in candidates if copy.id in won]
+
+            borrows = BorrowHistory.objects.bulk_create([
+                BorrowHistory(
+                    book_copy=copy,
+                    bookID=copy.accessionNumber,  # Keep for backward compatibility
+                    accountID=student_id,
+                    bookTitle=copy.book.Title,
+                    accountName=student['name'],
+                    accountGrade=student['grade_Level'] or 0,
+                    bookType=copy.book.Type or '',
+                    bookLocation=copy.Location or '',
+                    borrow_date=now,
+                    return_date=BorrowHistory.due_date_for(now),
+                )
+                for copy in candidates
+            ])
+            _sync_after_bulk_write(
+                {copy.book_id for copy in candidates}, [(None, borrow.rollup_state()) for borrow in borrows],
+            )
+        outcomes.update((borrow.bookID, borrow) for borrow in borrows)
+
+    return [(accession_number, outcomes[accession_number]) for accession_number in accession_numbers]
+
+
+def checkout(accession_number, student_id):
+    """Lend the copy with `accession_number` to the student with `student_id`."""
+    [(_, outcome)] = _checkout(student_id, [accession_number])
+    if isinstance(outcome, CirculationError):
+        raise outcome
+    return outcome
+
+
+# ---------------------------------
+# RETURN
+# ---------------------------------
+def _close_loans(loans):
+    """Close open loans (with book_copy and book loaded); returns the ones this call closed."""
+    if not loans:
+        return []
+    now = timezone.now()
+    with transaction.atomic():
+        won = _update_won(
+            BorrowHistory, [loan.id for loan in loans], {'returned': False}, returned=True, return_date=now,
+        )
+        # The rest were returned by another desk since they were read
+        loans = [loan for loan in loans if loan.id in won]
+        if not loans:
+            return []
+
+        BookCopy.objects.filter(id__in={loan.book_copy_id for loan in loans}).update(
+            status='Available', borrowed_by=None, student_id=None, borrow_date=None, return_date=None,
+        )
+        changes = []
+        for loan in loans:
+            old_state = loan.rollup_state()
+            loan.returned = True
+            loan.return_date = now
+            changes.append((old_state, loan.rollup_state()))
+        _sync_after_bulk_write({loan.book_copy.book_id for loan in loans}, changes)
+    return loans
+
+
+def _return(accession_numbers):
+    """[(accession_number, BorrowHistory or CirculationError)] for a batch return."""
+    copies = _copies_by_accession(accession_numbers)
+    open_loans = defaultdict(list)
+    for loan in BorrowHistory.objects.filter(book_copy__in=list(copies.values()), returned=False).order_by('borrow_date'):
+        open_loans[loan.book_copy_id].append(loan)
+
+    outcomes = {}
+    returning = []
+    for accession_number in accession_numbers:
+        copy = copies.get(accession_number)
+        if copy is None:
+            outcomes[accession_number] = _not_found(accession_number)
+        elif not open_loans[copy.id]:
+            outcomes[accession_number] = _no_open_loan(accession_number)
+        else:
+            for loan in open_loans[copy.id]:
+                loan.book_copy = copy
+                returning.append(loan)
+
+    outcomes.update((loan.book_copy.accessionNumber, loan) for loan in _close_loans(returning))
+    return [
+        (accession_number, outcomes.get(accession_number) or _no_open_loan(accession_number))
+        for accession_number in accession_numbers
+    ]
+
+
+def return_by_accession(accession_number):
+    """Close the open loan of the copy with `accession_number`."""
+    [(_, outcome)] = _return([accession_number])
+    if isinstance(outcome, CirculationError):
+        raise outcome
+    return outcome
+
+
+def return_by_borrow_id(borrow_id):
+    """Close the open loan with primary key `borrow_id`."""
+    try:
+        borrow = BorrowHistory.objects.select_related('book_copy__book').get(id=borrow_id, returned=False)
+    except (BorrowHistory.DoesNotExist, ValueError, TypeError):
+        raise CirculationError('Borrow record not found.', status=404)
+    if not _close_loans([borrow]):
+        raise CirculationError('Borrow record not found.', status=404)
+    return borrow
+
+
+# ---------------------------------
+# BATCHES
+# ---------------------------------
+def _results(outcomes):
+    return [
+        {'accessionNumber': accession_number, 'ok': False, 'error': str(outcome)}
+        if isinstance(outcome, CirculationError) else
+        {'accessionNumber': accession_number, 'ok': True, 'loan': loan_data(outcome)}
+        for accession_number, outcome in outcomes
+    ]
+
+
+def checkout_many(student_id, accession_numbers):
+    """Lend several copies to one student.
+
+    Returns one result per distinct accession number, in order:
+    {'accessionNumber', 'ok': True, 'loan'} or {'accessionNumber', 'ok': False, 'error'}.
+    Raises CirculationError if the student does not exist.
+    """
+    return _results(_checkout(student_id, _accession_list(accession_numbers)))
+
+
+def return_many(accession_numbers):
+    """Close the open loans of several copies; results as for checkout_many()."""
+    return _results(_return(_accession_list(accession_numbers)))
+
+
+# ---------------------------------
+# JSON
+# ---------------------------------
+def loan_data(borrow):
+    return {
+        'id': borrow.id,
+        'accessionNumber': borrow.book_copy.accessionNumber,
+        'book_id': borrow.book_copy.book_id,
+        'bookTitle': borrow.bookTitle,
+        'accountID': borrow.accountID,
+        'accountName': borrow.accountName,
+        'borrow_date': borrow.borrow_date,
+        'return_date': borrow.return_date,
+        'returned': borrow.returned,
+        'is_overdue': bool(borrow.is_overdue()),
+    }
+
+
+def counters(book_id=None):
+    """The dashboard's circulation figures, plus the copy counters of `book_id`."""
+    open_loans = BorrowHistory.objects.filter(returned=False)
+    data = {
+        'borrowed': open_loans.count(),
+        'overdue': open_loans.filter(return_date__lt=overdue_cutoff()).count(),
+        'available': BookCopy.objects.filter(status='Available').count(),
+    }
+    if book_id is not None:
+        data['book'] = Book.objects.filter(pk=book_id).values(
+            'id', 'total_copies', 'available_copies', 'borrowed_copies',
+        ).first()
+    return data
@@ -0,0 +1,28 @@
+"""
+Rebuild the DailyCirculationStats rollup from BorrowHistory and students.
+Usage: python manage.py backfill_rollups [--chunk-size 5000]
+
+Run it once after adding the rollup table, and after any bulk import or
+raw SQL edit of BorrowHistory that bypassed the model signals.
+"""
+from django.core.management.base import BaseCommand
+from lims_app.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily circulation rollup used by the analytics dashboard'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Number of BorrowHistory rows read per query',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding daily circulation rollup...')
+        loans, rows = rebuild_rollups(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Folded {loans} loans into {rows} rollup rows.'
+        ))
@@ -0,0 +1,96 @@
+"""
+Time the main views against a seeded throwaway database at several scales.
+Usage: python manage.py benchmark [--scales 1000,10000,100000] [--iterations 10]
+                                  [--output bench.json] [--compare previous.json]
+
+For every scale (number of book copies) a fresh test database is seeded
+and each scenario in lims_app/benchmarking.py is requested through the
+Django test client. p50/p95 latency and query counts are printed and, with
+--output, written as JSON. --compare reports scenarios that got slower or
+run more queries than in an earlier report. The real database is never
+touched.
+"""
+import json
+import platform
+import time
+
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from lims_app import benchmarking
+
+
+class Command(BaseCommand):
+    help = 'Benchmark records, books, analytics and the admin dashboard at several database sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1000,10000', help='Comma-separated copy counts (default: 1000,10000)')
+        parser.add_argument('--iterations', type=int, default=10, help='Timed requests per scenario (default: 10)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the generated data')
+        parser.add_argument('--scenario', action='append', dest='scenarios', help='Only run this scenario (repeatable)')
+        parser.add_argument('--warm', action='store_true', help='Keep the cache between requests')
+        parser.add_argument('--output', help='Write the report as JSON to this file')
+        parser.add_argument('--compare', help='Earlier JSON report to compare against')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='p50 growth counted as a regression with --compare (default: 0.2 = 20%%)')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Exit with an error if --compare finds a regression')
+
+    def handle(self, *args, **options):
+        try:
+            scales = [int(scale) for scale in options['scales'].split(',') if scale.strip()]
+        except ValueError:
+            raise CommandError('--scales must be a comma-separated list of integers')
+        iterations = max(options['iterations'], 1)
+
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'iterations': iterations,
+            'warm_cache': options['warm'],
+            'seed': options['seed'],
+            'scales': [],
+        }
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            for scale in scales:
+                call_command('flush', interactive=False, verbosity=0)
+                self.stdout.write(f'Seeding {scale} copies...')
+                start = time.perf_counter()
+                counts = benchmarking.seed_database(scale, seed=options['seed'])
+                seed_seconds = round(time.perf_counter() - start, 2)
+
+                results = benchmarking.run_scenarios(iterations, warm=options['warm'], scenarios=options['scenarios'])
+                report['scales'].append({'scale': scale, **counts, 'seed_seconds': seed_seconds, 'results': results})
+                self._print_scale(scale, results)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as previous:
+                regressions = benchmarking.compare(json.load(previous), report, options['threshold'])
+            for line in regressions:
+                self.stdout.write(self.style.WARNING(f'  {line}'))
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS(f"No regressions against {options['compare']}."))
+            elif options['fail_on_regression']:
+                raise CommandError(f'{len(regressions)} regressions against {options["compare"]}')
+
+    def _print_scale(self, scale, results):
+        self.stdout.write(f'  {"scenario":<28}{"p50 ms":>10}{"p95 ms":>10}{"queries":>9}')
+        for name, result in results.items():
+            self.stdout.write(f'  {name:<28}{result["p50_ms"]:>10}{result["p95_ms"]:>10}{result["queries"]:>9}')
+        self.stdout.write(self.style.SUCCESS(f'Finished {scale} copies.'))
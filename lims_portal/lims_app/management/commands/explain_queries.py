@@ -0,0 +1,99 @@
+"""
+Print SQLite's EXPLAIN QUERY PLAN for the main view queries.
+Usage: python manage.py explain_queries [--query overdue_count] [--scans-only] [--create-missing]
+
+Shows whether the dashboard, circulation, records and analytics queries
+are answered from an index ("... USING INDEX") or by reading a whole
+table ("SCAN <table>"). Full table scans are highlighted. Indexes declared on the
+models but missing from the database (tables created before they were
+added) are listed first, since the plans cannot use them;
+--create-missing creates them (`upgrade_schema` also adds missing tables
+and columns).
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from lims_app import circulation, schema
+from lims_app.models import Book, BookCopy, BorrowHistory
+from lims_app.views import RECORDS_FILTER_KEYS, _filter_records_queryset, _order_records
+
+
+def _records(**filters):
+    filters = {key: filters.get(key) for key in RECORDS_FILTER_KEYS}
+    return _order_records(_filter_records_queryset(filters), filters, 'Title')
+
+
+def _queries():
+    """(name, queryset) for the queries the main views run, with sample values from the database."""
+    location = BookCopy.objects.values_list('Location', flat=True).first() or 'Shelf A'
+    account_id = BorrowHistory.objects.values_list('accountID', flat=True).first() or 'S-1'
+    book_copy_id = BookCopy.objects.values_list('id', flat=True).first() or 1
+    now = timezone.now()
+    open_loans = BorrowHistory.objects.filter(returned=False)
+    return (
+        ('dashboard_open_loans', open_loans),
+        ('overdue_count', open_loans.filter(return_date__lt=circulation.overdue_cutoff()).values('id')),
+        ('overdue_list', open_loans.filter(return_date__lt=now).order_by('return_date')[:10]),
+        ('recent_activity', BorrowHistory.objects.order_by('-borrow_date')[:10]),
+        ('available_copies', BookCopy.objects.filter(status='Available').values('id')),
+        ('open_loan_of_copy', open_loans.filter(book_copy_id=book_copy_id)),
+        ('student_loans', BorrowHistory.objects.filter(accountID=account_id).order_by('-borrow_date')),
+        ('period_borrows', BorrowHistory.objects.filter(borrow_date__gte=now - timedelta(days=30)).values('id')),
+        ('records_browse', _records()[:25]),
+        ('records_location', _records(location=location)[:25]),
+        ('location_copies', BookCopy.objects.filter(Location=location)),
+        ('book_copies', BookCopy.objects.filter(book_id=Book.objects.values_list('id', flat=True).first() or 1)),
+    )
+
+
+def _is_scan(line):
+    # "SCAN lims_app_book" reads the whole table; "SEARCH ... USING INDEX" and
+    # "SCAN ... USING INDEX" (walking an index in order, or a partial index) do not
+    return ' SCAN ' in f' {line} ' and 'INDEX' not in line
+
+
+class Command(BaseCommand):
+    help = 'Print EXPLAIN QUERY PLAN for the dashboard, circulation, records and analytics queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--query', action='append', dest='queries', help='Only explain this query (repeatable)')
+        parser.add_argument('--scans-only', action='store_true', help='Only show queries whose plan has a full table scan')
+        parser.add_argument('--create-missing', action='store_true', help='Create model indexes missing from the database')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('explain_queries prints SQLite query plans; the default database is not SQLite')
+
+        for model, index in schema.missing_indexes():
+            label = f'{model._meta.db_table}.{index.name} ({", ".join(index.fields)})'
+            if options['create_missing']:
+                with connection.schema_editor() as schema_editor:
+                    schema_editor.add_index(model, index)
+                self.stdout.write(self.style.SUCCESS(f'Created index {label}'))
+            else:
+                self.stdout.write(self.style.WARNING(f'Missing index {label}; rerun with --create-missing'))
+
+        queries = _queries()
+        wanted = set(options['queries'] or ())
+        unknown = wanted - {name for name, _ in queries}
+        if unknown:
+            raise CommandError(f'Unknown query: {", ".join(sorted(unknown))}')
+
+        scans = explained = 0
+        for name, queryset in queries:
+            if wanted and name not in wanted:
+                continue
+            plan = queryset.explain().splitlines()
+            explained += 1
+            has_scan = any(_is_scan(line) for line in plan)
+            scans += has_scan
+            if options['scans_only'] and not has_scan:
+                continue
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for line in plan:
+                self.stdout.write(self.style.WARNING(f'  {line}') if _is_scan(line) else f'  {line}')
+
+        summary = f'{scans} of {explained} queries read a whole table.'
+        self.stdout.write(self.style.WARNING(summary) if scans else self.style.SUCCESS(summary))
@@ -0,0 +1,28 @@
+"""
+Rebuild the FTS5 full-text index used by the records search.
+Usage: python manage.py rebuild_search_index
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from lims_app import search
+
+
+class Command(BaseCommand):
+    help = 'Drop and rebuild the full-text catalog search index (SQLite FTS5)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Number of books to index per batch (default: 2000)',
+        )
+
+    def handle(self, *args, **options):
+        if not search.search_enabled():
+            raise CommandError('Full-text search needs an SQLite database with FTS5 enabled.')
+
+        self.stdout.write('Rebuilding search index...')
+        with transaction.atomic():
+            indexed = search.rebuild_search_index(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} books.'))
@@ -0,0 +1,58 @@
+"""
+Recompute the denormalized copy counters on Book from BookCopy.
+Usage: python manage.py recount_copies [--dry-run]
+
+Run it once after adding the counter columns, and any time they drift
+(e.g. after raw SQL or queryset.update() edits to BookCopy.status).
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Q
+from lims_app.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Recompute Book.total_copies / available_copies / borrowed_copies from BookCopy'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report books whose counters have drifted',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        # a book has drifted if any of its three counters disagrees with BookCopy
+        drifted = Book.objects.annotate(
+            actual_total=Count('copies'),
+            actual_available=Count('copies', filter=Q(copies__status='Available')),
+            actual_borrowed=Count('copies', filter=Q(copies__status='Borrowed')),
+        ).exclude(
+            total_copies=F('actual_total'),
+            available_copies=F('actual_available'),
+            borrowed_copies=F('actual_borrowed'),
+        )
+
+        drifted_rows = list(drifted.values_list(
+            'callNumber', 'total_copies', 'actual_total',
+            'available_copies', 'actual_available', 'borrowed_copies', 'actual_borrowed',
+        ))
+        for call_number, total, actual_total, available, actual_available, borrowed, actual_borrowed in drifted_rows[:20]:
+            self.stdout.write(
+                f'  {call_number}: total {total}->{actual_total}, '
+                f'available {available}->{actual_available}, borrowed {borrowed}->{actual_borrowed}'
+            )
+        if len(drifted_rows) > 20:
+            self.stdout.write(f'  ... and {len(drifted_rows) - 20} more')
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'{len(drifted_rows)} books have drifted counters (dry run, nothing changed)'))
+            return
+
+        with transaction.atomic():
+            updated = Book.recount_copies()
+        self.stdout.write(self.style.SUCCESS(
+            f'Recounted {updated} books ({len(drifted_rows)} had drifted).'
+        ))
@@ -0,0 +1,37 @@
+"""
+Precompute the default analytics views and store them as a new snapshot version.
+Usage: python manage.py refresh_analytics [--keep 3]
+
+Meant for cron, e.g. every 15 minutes during opening hours:
+    */15 7-17 * * 1-5  cd /path/to/lims_portal && python manage.py refresh_analytics
+The analytics page then starts from these snapshots and only recomputes
+what changed since (see lims_app/analytics.py).
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from lims_app.analytics import SNAPSHOT_DEFAULT_VIEWS, take_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Store the default analytics views as a new snapshot version'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep',
+            type=int,
+            default=3,
+            help='Number of snapshot versions to keep (older ones are deleted)',
+        )
+
+    def handle(self, *args, **options):
+        keep = max(options['keep'], 1)
+        start = time.perf_counter()
+        version = take_snapshots(keep=keep)
+        elapsed = time.perf_counter() - start
+        for name, params in SNAPSHOT_DEFAULT_VIEWS:
+            label = ', '.join(f'{key}={value}' for key, value in params.items()) or 'all'
+            self.stdout.write(f'  {name} ({label})')
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored analytics snapshot v{version} ({len(SNAPSHOT_DEFAULT_VIEWS)} panels) in {elapsed:.2f}s.'
+        ))
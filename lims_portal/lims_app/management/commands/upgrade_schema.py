@@ -0,0 +1,68 @@
+"""
+Bring an existing database up to the current lims_app models.
+Usage: python manage.py upgrade_schema [--dry-run]
+
+lims_app has no migrations, so `migrate` leaves tables created by an older
+version as they were and the views fail with "no such column" / "no such
+table". This creates only what is missing (tables such as
+DailyCirculationStats and AnalyticsSnapshot, columns such as the Book copy
+counters, and the model indexes) and then fills in what it created:
+new counter columns are recounted (as recount_copies does), and a new
+rollup table or new loan columns mean the rollup is rebuilt (as
+backfill_rollups does). Running it again on an up-to-date database
+changes nothing.
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from lims_app import schema
+from lims_app.models import Book, BorrowHistory, DailyCirculationStats
+from lims_app.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Create missing lims_app tables, columns and indexes, then backfill them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only list what is missing')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        changed = set()
+
+        # Tables first: create_model() also creates their indexes and constraints
+        for model in schema.missing_tables():
+            if not dry_run:
+                with connection.schema_editor() as schema_editor:
+                    schema_editor.create_model(model)
+                changed.add(model)
+            self._report(dry_run, f'table {model._meta.db_table}')
+
+        for model, field in schema.missing_columns():
+            if not dry_run:
+                with connection.schema_editor() as schema_editor:
+                    schema_editor.add_field(model, field)
+                changed.add(model)
+            self._report(dry_run, f'column {model._meta.db_table}.{field.column}')
+
+        for model, index in schema.missing_indexes():
+            if not dry_run:
+                with connection.schema_editor() as schema_editor:
+                    schema_editor.add_index(model, index)
+            self._report(dry_run, f'index {model._meta.db_table}.{index.name} ({", ".join(index.fields)})')
+
+        if dry_run:
+            return
+        with transaction.atomic():
+            if Book in changed:
+                self.stdout.write(f'Recounted copies of {Book.recount_copies()} books.')
+            if DailyCirculationStats in changed or BorrowHistory in changed:
+                # also records the grade/type/location on loans that lack them
+                loans, rows = rebuild_rollups()
+                self.stdout.write(f'Folded {loans} loans into {rows} rollup rows.')
+        self.stdout.write(self.style.SUCCESS('Schema is up to date.'))
+
+    def _report(self, dry_run, label):
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'Missing {label}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Created {label}'))
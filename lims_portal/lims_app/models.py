@@ -1,7 +1,10 @@
 from django.db import models
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from datetime import timedelta, date
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 
 # ---------------------------------
 # ACCOUNT MODEL
@@ -23,6 +26,13 @@ class students(models.Model):
     section = models.CharField(max_length=50, null=True, blank=True, help_text="Section or class name (Ruby, Jasmin, Tesla, etc.)")
     def __str__(self):
         return f"{self.name} ({self.id})"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored grade so the rollup can follow a move-up
+        instance._stored_grade = instance.__dict__.get('grade_Level')
+        return instance
     
 # ---------------------------------
 # READER MODEL
@@ -48,11 +58,32 @@ class BorrowHistory(models.Model):
     )
     bookTitle = models.CharField(max_length=255, editable=False, blank=True)
     accountName = models.CharField(max_length=255, editable=False, blank=True)
+    # Where DailyCirculationStats counts this loan, as it was at checkout, so
+    # a later move-up or relocated copy doesn't move the loan's history
+    # (see capture_dimensions; None on loans saved before these existed)
+    accountGrade = models.IntegerField(null=True, blank=True, editable=False)
+    bookType = models.CharField(max_length=50, null=True, blank=True, editable=False)
+    bookLocation = models.CharField(max_length=255, null=True, blank=True, editable=False)
 
     borrow_date = models.DateTimeField(default=timezone.now)
     return_date = models.DateTimeField(null=True, blank=True)
     returned = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Django writes returned=False as NOT "returned", which SQLite cannot
+            # look up in a (returned, ...) index; partial indexes over the open
+            # loans match that condition and only hold the few loans still out.
+            # Open and overdue loans (return_date is the due date until returned)
+            models.Index(fields=['return_date'], condition=Q(returned=False), name='borrow_open_due_idx'),
+            # The open loan of a copy, looked up on return
+            models.Index(fields=['book_copy'], condition=Q(returned=False), name='borrow_copy_open_idx'),
+            # A student's loans, newest first
+            models.Index(fields=['accountID', 'borrow_date'], name='borrow_account_date_idx'),
+            # Recent activity and the analytics period filters
+            models.Index(fields=['borrow_date'], name='borrow_date_idx'),
+        ]
+
     def clean(self):
         """Validate that book_copy and accountID exist in their respective models."""
         # --- Validate BookCopy ---
@@ -96,21 +127,64 @@ class BorrowHistory(models.Model):
 
         # --- Compute return date if missing ---
         if self.borrow_date and not self.return_date:
-            proposed_return = self.borrow_date + timedelta(days=1)
+            self.return_date = self.due_date_for(self.borrow_date)
 
-            # If borrowed on Friday, move return date to Wednesday
-            if self.borrow_date.weekday() == 4:  # Friday
-                proposed_return += timedelta(days=4)
+        if self._state.adding and self.accountGrade is None:
+            self.capture_dimensions()
 
-            # If proposed return is weekend, shift to Monday
-            if proposed_return.weekday() == 5:  # Saturday
-                proposed_return += timedelta(days=2)
-            elif proposed_return.weekday() == 6:  # Sunday
-                proposed_return += timedelta(days=1)
+        super().save(*args, **kwargs)
 
-            self.return_date = proposed_return
+    def capture_dimensions(self):
+        """Record the borrower's grade and the copy's book type and location."""
+        grade = students.objects.filter(school_id=self.accountID).values_list('grade_Level', flat=True).first()
+        copy = BookCopy.objects.filter(pk=self.book_copy_id).values_list('book__Type', 'Location').first()
+        book_type, location = copy if copy else ('', '')
+        self.accountGrade, self.bookType, self.bookLocation = grade or 0, book_type or '', location or ''
 
-        super().save(*args, **kwargs)
+    @classmethod
+    def fill_missing_dimensions(cls):
+        """capture_dimensions() in one UPDATE for loans saved without them
+        (bulk imports, older databases), from the current student and copy.
+        Returns rows updated."""
+        copy = BookCopy.objects.filter(pk=OuterRef('book_copy_id'))
+        grade = students.objects.filter(school_id=OuterRef('accountID')).values('grade_Level')[:1]
+        return cls.objects.filter(accountGrade__isnull=True).update(
+            accountGrade=Coalesce(Subquery(grade), 0),
+            bookType=Coalesce(Subquery(copy.values('book__Type')[:1]), Value('')),
+            bookLocation=Coalesce(Subquery(copy.values('Location')[:1]), Value('')),
+        )
+
+    @staticmethod
+    def due_date_for(borrow_date):
+        """Default due date for a loan starting at `borrow_date`."""
+        proposed_return = borrow_date + timedelta(days=1)
+
+        # If borrowed on Friday, move return date to Wednesday
+        if borrow_date.weekday() == 4:  # Friday
+            proposed_return += timedelta(days=4)
+
+        # If proposed return is weekend, shift to Monday
+        if proposed_return.weekday() == 5:  # Saturday
+            proposed_return += timedelta(days=2)
+        elif proposed_return.weekday() == 6:  # Sunday
+            proposed_return += timedelta(days=1)
+
+        return proposed_return
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was stored so the rollup signal handlers can undo it
+        instance._stored_state = instance.rollup_state()
+        return instance
+
+    def rollup_state(self):
+        """The fields DailyCirculationStats is derived from."""
+        return {
+            field: self.__dict__.get(field)
+            for field in ('book_copy_id', 'accountID', 'accountGrade', 'bookType', 'bookLocation',
+                          'borrow_date', 'return_date', 'returned')
+        }
 
     def is_overdue(self):
         """Check if this borrow record is overdue."""
@@ -163,18 +237,63 @@ class Book(models.Model):
     Type = models.CharField(max_length=50, choices=type_CHOICES, default="Other")
     acquisitionStatus = models.CharField(max_length=255, choices=acquisition_STATUS, null=True, blank=True)
     # Removed copy-specific fields: accessionNumber, status, borrowed_by, student_id, borrow_date, return_date, Location
+
+    # Denormalized copy counters, kept in step by the BookCopy signal handlers
+    # (see adjust_copy_counts). `manage.py recount_copies` repairs any drift.
+    total_copies = models.IntegerField(default=0, editable=False)
+    available_copies = models.IntegerField(default=0, editable=False)
+    borrowed_copies = models.IntegerField(default=0, editable=False)
     
     def get_total_copies(self):
         """Get total number of copies for this book"""
-        return self.copies.count()
+        return self.total_copies
     
     def get_available_copies(self):
         """Get number of available copies"""
-        return self.copies.filter(status='Available').count()
+        return self.available_copies
     
     def get_borrowed_copies(self):
         """Get number of borrowed copies"""
-        return self.copies.filter(status='Borrowed').count()
+        return self.borrowed_copies
+
+    @staticmethod
+    def adjust_copy_counts(book_id, status, delta):
+        """Add `delta` copies with `status` to a book's counters in one UPDATE."""
+        changes = {'total_copies': F('total_copies') + delta}
+        if status == 'Available':
+            changes['available_copies'] = F('available_copies') + delta
+        elif status == 'Borrowed':
+            changes['borrowed_copies'] = F('borrowed_copies') + delta
+        Book.objects.filter(pk=book_id).update(**changes)
+
+    @staticmethod
+    def move_copy_status(book_id, old_status, new_status):
+        """Move one copy between status counters without touching the total."""
+        changes = {}
+        for status, delta in ((old_status, -1), (new_status, 1)):
+            if status == 'Available':
+                changes['available_copies'] = F('available_copies') + delta
+            elif status == 'Borrowed':
+                changes['borrowed_copies'] = F('borrowed_copies') + delta
+        if changes:
+            Book.objects.filter(pk=book_id).update(**changes)
+
+    @classmethod
+    def recount_copies(cls, queryset=None):
+        """Recompute the counters from BookCopy with one UPDATE. Returns rows updated."""
+        def copy_count(**filters):
+            counts = (
+                BookCopy.objects.filter(book=OuterRef('pk'), **filters)
+                .order_by().values('book').annotate(n=Count('id')).values('n')
+            )
+            return Coalesce(Subquery(counts), 0)
+
+        queryset = cls.objects.all() if queryset is None else queryset
+        return queryset.update(
+            total_copies=copy_count(),
+            available_copies=copy_count(status='Available'),
+            borrowed_copies=copy_count(status='Borrowed'),
+        )
 
     def __str__(self):
         return f"{self.Title} ({self.get_available_copies()}/{self.get_total_copies()} available)"
@@ -191,9 +310,90 @@ class BookCopy(models.Model):
     borrow_date = models.DateField(null=True, blank=True)
     return_date = models.DateField(null=True, blank=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was stored so the signal handlers can move counters
+        instance._stored_state = (instance.__dict__.get('book_id'), instance.__dict__.get('status'))
+        # ... and tell a status change from a change to the catalog itself
+        instance._stored_listing = instance.catalog_listing()
+        return instance
+
+    def catalog_listing(self):
+        """The fields the catalog version depends on (status is tracked separately)."""
+        return tuple(self.__dict__.get(field) for field in ('book_id', 'accessionNumber', 'Location'))
+
     def __str__(self):
         return f"{self.book.Title} - {self.accessionNumber} ({self.status})"
     
     class Meta:
         verbose_name_plural = "Book Copies"
         ordering = ['accessionNumber']
+        indexes = [
+            models.Index(fields=['status'], name='bookcopy_status_idx'),
+            models.Index(fields=['Location'], name='bookcopy_location_idx'),
+        ]
+
+
+# ---------------------------------
+# CIRCULATION ROLLUP
+# ---------------------------------
+class DailyCirculationStats(models.Model):
+    """Per-day circulation counts, broken down by grade, book type and location.
+
+    Maintained incrementally by the signal handlers in signals.py (see
+    rollups.py) and rebuilt with `python manage.py backfill_rollups`.
+    Dimensions that don't apply are stored as 0 / '' so every row has a
+    unique key; totals for a day are the sum over its rows.
+    """
+    day = models.DateField()
+    grade = models.IntegerField(default=0, help_text="Borrower's grade level (0 = unknown)")
+    book_type = models.CharField(max_length=50, blank=True, default='')
+    location = models.CharField(max_length=255, blank=True, default='')
+
+    borrows = models.IntegerField(default=0)
+    returns = models.IntegerField(default=0)
+    overdue = models.IntegerField(default=0, help_text="Loans due on this day that came back late (open loans are counted live)")
+    new_students = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day} G{self.grade} {self.book_type or '-'} @ {self.location or '-'}"
+
+    class Meta:
+        verbose_name_plural = "Daily Circulation Stats"
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'grade', 'book_type', 'location'],
+                name='daily_circulation_stats_key',
+            ),
+        ]
+
+
+# ---------------------------------
+# ANALYTICS SNAPSHOTS
+# ---------------------------------
+class AnalyticsSnapshot(models.Model):
+    """A precomputed analytics panel, written by `python manage.py refresh_analytics`.
+
+    Every run stores its panels under a new version. The analytics views
+    start from the latest snapshot of a panel and only recompute what
+    changed after computed_at (see analytics.py). `state` holds whatever
+    that delta step needs beyond the panel data itself.
+    """
+    panel = models.CharField(max_length=50)
+    params = models.CharField(max_length=255, blank=True, default='', help_text="URL-encoded panel parameters")
+    version = models.PositiveIntegerField()
+    computed_at = models.DateTimeField()
+    loan_watermark = models.BigIntegerField(default=0, help_text="Highest BorrowHistory id included")
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    state = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+
+    def __str__(self):
+        return f"{self.panel} v{self.version} ({self.computed_at:%Y-%m-%d %H:%M})"
+
+    class Meta:
+        ordering = ['-version']
+        constraints = [
+            models.UniqueConstraint(fields=['panel', 'params', 'version'], name='analytics_snapshot_version'),
+        ]
@@ -0,0 +1,268 @@
+"""
+Per-view performance instrumentation.
+
+ViewProfilingMiddleware records, for every request that resolves to a
+named URL, the number of SQL queries, the time spent in SQL, the time
+spent rendering templates and the total latency. The figures go to:
+  * a Server-Timing response header, for staff users only,
+  * a rolling in-memory window of the last PROFILE_SAMPLES requests per
+    view, summarised at library-admin/performance/,
+  * optionally a JSON-lines file (settings.VIEW_PROFILE_LOG).
+
+Template time comes from the ProfiledDjangoTemplates backend configured in
+settings.TEMPLATES; nothing in Django is patched.
+
+settings.VIEW_QUERY_BUDGETS maps URL names to a query budget; requests
+that run more queries than their view's budget log a warning.
+
+Like the caches, the in-memory window is per process.
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+from django.http import FileResponse
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SAMPLES = 200
+
+
+class QueryTimer:
+    """connection.execute_wrapper that counts queries and sums their time."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+class RequestProfile:
+    def __init__(self):
+        self.sql = QueryTimer()
+        self.template_seconds = 0.0
+
+
+_current_profile = ContextVar('lims_request_profile', default=None)
+
+
+def record_queries(count, seconds):
+    """Attribute queries run on other threads (e.g. analytics workers) to the current request."""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.sql.queries += count
+        profile.sql.seconds += seconds
+
+
+# ---------------------------------
+# TEMPLATE TIMING
+# ---------------------------------
+class ProfiledTemplate(Template):
+    """A Django template that adds its render time to the current request's profile.
+
+    Only top-level renders go through the backend template ({% include %}/
+    {% extends %} do not), so nothing is counted twice. Outside a profiled
+    request (management commands, emails) it renders as usual.
+    """
+
+    def render(self, context=None, request=None):
+        profile = _current_profile.get()
+        if profile is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.template_seconds += time.perf_counter() - start
+
+
+class ProfiledDjangoTemplates(DjangoTemplates):
+    """The DjangoTemplates backend, handing out ProfiledTemplates (see settings.TEMPLATES).
+
+    Django's template_rendered signal is only sent under the test runner,
+    so render time is measured here rather than from the signal.
+    """
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return ProfiledTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+# ---------------------------------
+# ROLLING SUMMARY
+# ---------------------------------
+_samples_lock = threading.Lock()
+_samples = {}
+_log_lock = threading.Lock()
+
+
+def _record(sample):
+    with _samples_lock:
+        if sample['view'] not in _samples:
+            _samples[sample['view']] = deque(maxlen=PROFILE_SAMPLES)
+        _samples[sample['view']].append(sample)
+
+
+def reset_samples():
+    with _samples_lock:
+        _samples.clear()
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summary():
+    """One row per view over its rolling window, slowest (p95) first."""
+    with _samples_lock:
+        windows = {view: list(samples) for view, samples in _samples.items()}
+    rows = []
+    for view, samples in windows.items():
+        count = len(samples)
+        totals = [sample['total_ms'] for sample in samples]
+        rows.append({
+            'view': view,
+            'requests': count,
+            'p50_ms': _percentile(totals, 0.5),
+            'p95_ms': _percentile(totals, 0.95),
+            'avg_queries': round(sum(sample['queries'] for sample in samples) / count, 1),
+            'max_queries': max(sample['queries'] for sample in samples),
+            'avg_sql_ms': round(sum(sample['sql_ms'] for sample in samples) / count, 1),
+            'avg_template_ms': round(sum(sample['template_ms'] for sample in samples) / count, 1),
+            'over_budget': sum(1 for sample in samples if sample['over_budget']),
+            'budget': query_budget(view),
+        })
+    rows.sort(key=lambda row: row['p95_ms'], reverse=True)
+    return rows
+
+
+def query_budget(view):
+    budgets = getattr(settings, 'VIEW_QUERY_BUDGETS', {})
+    return budgets.get(view, getattr(settings, 'VIEW_QUERY_BUDGET', None))
+
+
+def _write_log(sample):
+    path = getattr(settings, 'VIEW_PROFILE_LOG', None)
+    if not path:
+        return
+    line = json.dumps(sample) + '\n'
+    with _log_lock:
+        with open(path, 'a', encoding='utf-8') as log_file:
+            log_file.write(line)
+
+
+# ---------------------------------
+# MIDDLEWARE
+# ---------------------------------
+_END_OF_STREAM = object()
+
+
+class ViewProfilingMiddleware:
+    """Times each request; place it after AuthenticationMiddleware.
+
+    A streamed response (e.g. the borrow log export) runs most of its
+    queries while the body is being sent, after this middleware has
+    returned. Its body is wrapped so those queries are counted too, and its
+    sample is recorded (and checked against the budget) once the stream
+    ends. It gets no Server-Timing header: the headers go out before the
+    figures are known. FileResponses are left alone, they run no queries.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'VIEW_PROFILING', True):
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        start = time.perf_counter()
+        response = self._profiled(profile, self.get_response, request)
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else None
+        if not view:
+            return response
+
+        if response.streaming and not response.is_async and not isinstance(response, FileResponse):
+            response.streaming_content = self._profiled_stream(
+                response.streaming_content, request, response, view, profile, start,
+            )
+            return response
+
+        sample = self._record_sample(request, response, view, profile, start)
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            response['Server-Timing'] = (
+                f'sql;dur={sample["sql_ms"]};desc="{sample["queries"]} queries", '
+                f'tpl;dur={sample["template_ms"]}, total;dur={sample["total_ms"]}'
+            )
+        return response
+
+    @staticmethod
+    def _profiled(profile, func, *args):
+        token = _current_profile.set(profile)
+        try:
+            with connection.execute_wrapper(profile.sql):
+                return func(*args)
+        finally:
+            _current_profile.reset(token)
+
+    def _profiled_stream(self, chunks, request, response, view, profile, start):
+        """Yield the streamed body chunk by chunk, profiling the work done
+        to produce each one; the sample is recorded when the stream ends or
+        the client goes away."""
+        chunks = iter(chunks)
+        try:
+            while True:
+                chunk = self._profiled(profile, next, chunks, _END_OF_STREAM)
+                if chunk is _END_OF_STREAM:
+                    break
+                yield chunk
+        finally:
+            self._record_sample(request, response, view, profile, start)
+
+    def _record_sample(self, request, response, view, profile, start):
+        sample = {
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'at': timezone.now().isoformat(),
+            'total_ms': round((time.perf_counter() - start) * 1000, 1),
+            'sql_ms': round(profile.sql.seconds * 1000, 1),
+            'queries': profile.sql.queries,
+            'template_ms': round(profile.template_seconds * 1000, 1),
+        }
+        budget = query_budget(view)
+        sample['over_budget'] = budget is not None and sample['queries'] > budget
+        if sample['over_budget']:
+            logger.warning(
+                'View %s ran %d queries (budget %d) for %s %s',
+                view, sample['queries'], budget, request.method, request.path,
+            )
+        _record(sample)
+        _write_log(sample)
+        return sample
+
@@ -0,0 +1,258 @@
+"""
+The DailyCirculationStats rollup: per-day borrows, returns, overdue
+transitions and new students, so analytics can read O(days) rows instead
+of scanning the whole BorrowHistory table.
+
+The rollup is kept up to date by the signal handlers in signals.py, which
+run inside the caller's transaction, so a checkout or return and its
+rollup update commit (or roll back) together. `python manage.py
+backfill_rollups` rebuilds it from scratch.
+
+A loan contributes:
+  * one borrow on the local day of borrow_date,
+  * one return on the local day of return_date once returned,
+  * one overdue transition on its default due day (BorrowHistory.due_date_for)
+    if it came back after it.
+
+Each loan is counted under the grade, book type and location recorded on
+it at checkout (see loan_dimensions). New students are counted under their
+current grade, and a move-up moves them.
+
+Loans still out are not in the rollup's overdue column: whether one is
+overdue depends on today's date, not on a write. open_overdue() counts
+them live (an indexed query over the open loans) once their due date is
+past overdue_cutoff().
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .models import BorrowHistory, DailyCirculationStats, students
+
+ROLLUP_FIELDS = ('borrows', 'returns', 'overdue', 'new_students')
+
+
+def _local_day(value):
+    if not isinstance(value, datetime):
+        return value
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date()
+
+
+def loan_events(state):
+    """(day, field) pairs a loan in `state` (see BorrowHistory.rollup_state) adds to the rollup."""
+    borrow_date = state['borrow_date']
+    return_date = state['return_date']
+    if not borrow_date:
+        return []
+    events = [(_local_day(borrow_date), 'borrows')]
+    if state['returned']:
+        if return_date:
+            events.append((_local_day(return_date), 'returns'))
+            due = BorrowHistory.due_date_for(borrow_date)
+            if return_date > due:
+                events.append((_local_day(due), 'overdue'))
+    return events
+
+
+def loan_dimensions(state):
+    """(grade, book_type, location) a loan is counted under.
+
+    These are recorded on the loan at checkout (BorrowHistory.accountGrade,
+    bookType, bookLocation), so its return and overdue events land on the
+    same row as its borrow even after a move-up or a relocated copy. Loans
+    saved before they existed fall back to the student's and copy's current
+    values, which is what rebuild_rollups() fills in for them.
+    """
+    if state.get('accountGrade') is not None:
+        return state['accountGrade'], state['bookType'] or '', state['bookLocation'] or ''
+    loan = BorrowHistory(book_copy_id=state['book_copy_id'], accountID=state['accountID'])
+    loan.capture_dimensions()
+    return loan.accountGrade, loan.bookType, loan.bookLocation
+
+
+def bump(day, grade=0, book_type='', location='', **deltas):
+    """Add `deltas` (e.g. borrows=1) to one rollup row, creating it if needed."""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    key = {'day': day, 'grade': grade or 0, 'book_type': book_type or '', 'location': location or ''}
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    if DailyCirculationStats.objects.filter(**key).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DailyCirculationStats.objects.create(**key, **deltas)
+    except IntegrityError:
+        # Another writer created the row first
+        DailyCirculationStats.objects.filter(**key).update(**changes)
+
+
+# A loan's dimensions can only differ between two states if one of these does
+DIMENSION_STATE_FIELDS = ('book_copy_id', 'accountID', 'accountGrade', 'bookType', 'bookLocation')
+
+
+def apply_loan_change(old_state, new_state):
+    """Move a loan's contribution from `old_state` to `new_state` (either may be None)."""
+    old_events = Counter(loan_events(old_state)) if old_state else Counter()
+    new_events = Counter(loan_events(new_state)) if new_state else Counter()
+
+    same_dimensions = old_state and new_state and all(
+        old_state[field] == new_state[field] for field in DIMENSION_STATE_FIELDS
+    )
+    if same_dimensions:
+        if old_events == new_events:
+            return
+        new_events.subtract(old_events)
+        changes = [(loan_dimensions(new_state), new_events)]
+    else:
+        changes = []
+        if old_state:
+            old_events = Counter({event: -count for event, count in old_events.items()})
+            changes.append((loan_dimensions(old_state), old_events))
+        if new_state:
+            changes.append((loan_dimensions(new_state), new_events))
+
+    for dimensions, events in changes:
+        per_day = {}
+        for (day, field), count in events.items():
+            if count:
+                per_day.setdefault(day, {})[field] = count
+        for day, deltas in per_day.items():
+            bump(day, *dimensions, **deltas)
+
+
+def apply_loan_changes(changes):
+    """apply_loan_change() for many loans at once, as one bump per rollup row.
+
+    `changes` yields (old_state, new_state) pairs of loans whose
+    dimensions are recorded on them, so none are looked up.
+    """
+    totals = Counter()
+    for old_state, new_state in changes:
+        if old_state:
+            dimensions = loan_dimensions(old_state)
+            totals.subtract(Counter((dimensions, event) for event in loan_events(old_state)))
+        if new_state:
+            dimensions = loan_dimensions(new_state)
+            totals.update(Counter((dimensions, event) for event in loan_events(new_state)))
+
+    per_row = {}
+    for (dimensions, (day, field)), count in totals.items():
+        if count:
+            per_row.setdefault((day, *dimensions), {})[field] = count
+    for (day, *dimensions), deltas in per_row.items():
+        bump(day, *dimensions, **deltas)
+
+
+def record_new_student(student, sign=1, grade=None):
+    """Count `student` (sign=-1: uncount) on their enrolment day under
+    `grade`, by default their current grade; rebuild_rollups() does the same."""
+    if student.created_at:
+        bump(_local_day(student.created_at), grade=student.grade_Level if grade is None else grade,
+             new_students=sign)
+
+
+# ---------------------------------
+# READING
+# ---------------------------------
+def overdue_cutoff(now=None):
+    """Loans due before this instant are overdue, matching BorrowHistory.is_overdue()."""
+    today = (now or timezone.now()).astimezone(dt_timezone.utc).date()
+    return datetime.combine(today, time.min, tzinfo=dt_timezone.utc)
+
+
+def open_overdue(start_date, end_date, now=None):
+    """Loans still out that fell due on a local day in [start_date, end_date]
+    and are overdue by now; the part of the overdue count the rollup leaves out.
+    """
+    start = timezone.make_aware(datetime.combine(start_date, time.min))
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+    return BorrowHistory.objects.filter(
+        returned=False, return_date__gte=start, return_date__lt=min(end, overdue_cutoff(now)),
+    ).count()
+
+
+def period_totals(start_date, end_date):
+    """Summed rollup counts over [start_date, end_date] in one query."""
+    return DailyCirculationStats.objects.filter(day__range=(start_date, end_date)).aggregate(
+        **{field: Coalesce(Sum(field), 0) for field in ROLLUP_FIELDS}
+    )
+
+
+def daily_counts(start_date, end_date, field='borrows'):
+    """[(day, count)] for every day in [start_date, end_date], zero-filled."""
+    counts = dict(
+        DailyCirculationStats.objects.filter(day__range=(start_date, end_date))
+        .values('day')
+        .annotate(count=Sum(field))
+        .order_by()
+        .values_list('day', 'count')
+    )
+    days = (end_date - start_date).days + 1
+    return [(start_date + timedelta(days=i), counts.get(start_date + timedelta(days=i), 0)) for i in range(days)]
+
+
+def monthly_counts(start_date, field='borrows'):
+    """{(year, month): count} from `start_date` onwards."""
+    rows = (
+        DailyCirculationStats.objects.filter(day__gte=start_date)
+        .annotate(month=TruncMonth('day'))
+        .values('month')
+        .annotate(count=Sum(field))
+        .order_by()
+        .values_list('month', 'count')
+    )
+    return {(month.year, month.month): count for month, count in rows}
+
+
+# ---------------------------------
+# BACKFILL
+# ---------------------------------
+def rebuild_rollups(chunk_size=5000):
+    """Recompute the whole rollup from BorrowHistory and students.
+
+    Loans are read in primary-key chunks and folded into an in-memory
+    Counter (one entry per day x grade x type x location), which is then
+    written with bulk_create. Loans without recorded dimensions get them
+    from their current student and copy first. Returns (loans_read, rows_written).
+    """
+    BorrowHistory.fill_missing_dimensions()
+    totals = Counter()
+
+    loans = 0
+    last_id = 0
+    fields = ('id', 'accountGrade', 'bookType', 'bookLocation', 'borrow_date', 'return_date', 'returned')
+    while True:
+        chunk = list(
+            BorrowHistory.objects.filter(id__gt=last_id).order_by('id').values(*fields)[:chunk_size]
+        )
+        if not chunk:
+            break
+        for row in chunk:
+            dimensions = (row['accountGrade'] or 0, row['bookType'] or '', row['bookLocation'] or '')
+            for day, field in loan_events(row):
+                totals[(day, *dimensions, field)] += 1
+        loans += len(chunk)
+        last_id = chunk[-1]['id']
+
+    for created_at, grade in students.objects.values_list('created_at', 'grade_Level').iterator():
+        if created_at:
+            totals[(_local_day(created_at), grade or 0, '', '', 'new_students')] += 1
+
+    rows = {}
+    for (day, grade, book_type, location, field), count in totals.items():
+        key = (day, grade, book_type, location)
+        if key not in rows:
+            rows[key] = DailyCirculationStats(day=day, grade=grade, book_type=book_type, location=location)
+        setattr(rows[key], field, count)
+
+    with transaction.atomic():
+        DailyCirculationStats.objects.all().delete()
+        DailyCirculationStats.objects.bulk_create(rows.values(), batch_size=chunk_size)
+    return loans, len(rows)
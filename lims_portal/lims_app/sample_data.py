@@ -0,0 +1,293 @@
+"""
+Deterministic, production-sized sample data: books, copies, students and
+a multi-year borrow/return history.
+
+Everything comes from one random.Random(seed) and is anchored on an
+`until` date, so the same arguments always produce the same rows. Rows are
+written with bulk_create in batches and never through the model save()
+or signals; the derived data (Book copy counters, the circulation rollup,
+the search index) is rebuilt once at the end.
+
+The history is simulated per copy: a copy is borrowed on a school day, by
+a student who was already enrolled, returned on or before its due date
+(or, for a share of loans, days late), and only then borrowed again. So a
+copy never has two open loans, loans that are still out at `until` leave
+the copy Borrowed, and the late ones among them are overdue.
+"""
+import random
+from datetime import date, datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import search
+from .models import AnalyticsSnapshot, Book, BookCopy, BorrowHistory, DailyCirculationStats, students
+from .rollups import rebuild_rollups
+
+DEFAULT_BATCH_SIZE = 5000
+
+FIRST_NAMES = (
+    'Juan', 'Pedro', 'Jose', 'Miguel', 'Antonio', 'Carlos', 'Luis', 'Rafael', 'Gabriel', 'Manuel',
+    'Maria', 'Ana', 'Rosa', 'Carmen', 'Isabel', 'Teresa', 'Cristina', 'Lucia', 'Elena', 'Sofia',
+)
+LAST_NAMES = (
+    'Santos', 'Garcia', 'Cruz', 'Reyes', 'Ramos', 'Flores', 'Gonzales', 'Torres', 'Rivera', 'Martinez',
+    'Lopez', 'Perez', 'Sanchez', 'Ramirez', 'Castillo', 'Morales', 'Mendoza', 'Navarro', 'Aguilar', 'Luna',
+)
+BATCH_NAMES = (
+    'Antuilan', 'Bakunawa', 'Calipayan', 'Dalisay', 'Estrellas', 'Galura', 'Himigsugan', 'Kasaysayan',
+    'Lakandula', 'Maharlika', 'Narra', 'Pagkakaisa', 'Sikatuna', 'Tuason',
+)
+SECTIONS = ('Ruby', 'Jasmin', 'Tesla', 'Curie', 'Newton', 'Sampaguita')
+
+TITLE_SUBJECTS = (
+    'Physics', 'Mathematics', 'Chemistry', 'Biology', 'World History', 'Philippine Literature',
+    'English Grammar', 'Computer Science', 'Statistics and Probability', 'Philosophy', 'Economics',
+    'Geometry', 'Algebra', 'Genetics', 'Ecology', 'Calculus', 'Research Methods', 'Data Analysis',
+)
+TITLE_FORMS = ('Introduction to {}', 'Advanced {}', '{} Fundamentals', 'Essentials of {}', '{} Today', 'Readings in {}')
+PUBLISHERS = (
+    'Rex Bookstore', 'National Book Store', 'Anvil Publishing', 'University of the Philippines Press',
+    'Pearson Education', 'McGraw-Hill', 'Oxford University Press', 'Cambridge University Press', 'Vibal Group',
+)
+# (value, weight)
+LANGUAGES = (('English', 70), ('Filipino', 25), ('Spanish', 5))
+BOOK_TYPES = (('Books', 75), ('Thesis', 8), ('Journal', 6), ('Article', 4), ('Analytics', 3), ('Other', 4))
+LOCATIONS = (
+    ('Science Section - Shelf A1', 3), ('Science Section - Shelf A2', 3), ('Math Section - Shelf C1', 3),
+    ('Literature Section - Shelf D1', 3), ('Social Studies - Shelf E1', 2), ('Computer Science - Shelf F1', 2),
+    ('Filipino Section - Shelf G1', 2), ('Reference Section - Shelf H1', 1),
+)
+
+SCHOOL_BREAK_MONTHS = (4, 5)  # April-May
+LATE_RETURN_RATE = 0.12
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights=weights)[0]
+
+
+def _is_school_day(day):
+    return day.weekday() < 5 and day.month not in SCHOOL_BREAK_MONTHS
+
+
+def _next_school_day(day):
+    while not _is_school_day(day):
+        day += timedelta(days=1)
+    return day
+
+
+def _school_year_start(year):
+    """First school day of June `year`."""
+    return _next_school_day(date(year, 6, 1))
+
+
+def _at(day, minutes):
+    """Aware local datetime `minutes` after 07:30 on `day`."""
+    return timezone.make_aware(datetime.combine(day, time(7, 30)) + timedelta(minutes=minutes))
+
+
+def clear_sample_data():
+    """Delete all circulation and catalog rows with plain DELETEs (no per-row signals)."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model in (AnalyticsSnapshot, DailyCirculationStats, BorrowHistory, BookCopy, Book, students):
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+    cache.clear()
+
+
+class _Batcher:
+    def __init__(self, model, batch_size):
+        self.model = model
+        self.batch_size = batch_size
+        self.rows = []
+        self.written = 0
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.model.objects.bulk_create(self.rows, batch_size=self.batch_size)
+            self.written += len(self.rows)
+            self.rows = []
+
+
+def generate(books=1000, copies_per_book=3, student_count=600, years=3, loans_per_copy=4.0,
+             seed=0, until=None, batch_size=DEFAULT_BATCH_SIZE, log=None):
+    """Generate a library; returns the number of rows written per model.
+
+    `copies_per_book` is an average (each book gets 1 to 2x-1 copies),
+    `loans_per_copy` the average number of loans per copy per school year
+    (scaled by each book's popularity), and `years` how far back the
+    history goes from `until` (a date, default today). `log` is called
+    with a progress message after each stage.
+    """
+    rng = random.Random(seed)
+    until = until or timezone.localdate()
+    # the history runs up to the start of `until`, so it never depends on the time of day
+    now = timezone.make_aware(datetime.combine(until, time.min))
+    history_start = until - timedelta(days=365 * years)
+    log = log or (lambda message: None)
+    counts = {}
+
+    with transaction.atomic():
+        # ---- Books ----
+        book_batcher = _Batcher(Book, batch_size)
+        popularity = []
+        for i in range(books):
+            subject = rng.choice(TITLE_SUBJECTS)
+            copyright_year = rng.randint(1995, until.year)
+            book_batcher.add(Book(
+                Title=f'{rng.choice(TITLE_FORMS).format(subject)} {i + 1}',
+                mainAuthor=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                coAuthor=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}' if rng.random() < 0.3 else None,
+                Publisher=rng.choice(PUBLISHERS),
+                Edition=rng.choice(('1st Edition', '2nd Edition', '3rd Edition', None)),
+                placeofPublication=rng.choice(('Manila', 'Quezon City', 'Makati', 'Cebu City')),
+                copyrightDate=date(copyright_year, rng.randint(1, 12), rng.randint(1, 28)),
+                callNumber=f'{rng.choice(("QA", "QC", "QD", "QH", "PE", "PL", "HD", "LB"))}{i + 1:06d}',
+                Language=_weighted(rng, LANGUAGES),
+                Type=_weighted(rng, BOOK_TYPES),
+                acquisitionStatus=rng.choice(('Acquired', 'Acquired', 'Donated')),
+            ))
+            # a few titles are borrowed far more than the rest
+            popularity.append(min(rng.paretovariate(1.5), 20.0))
+        book_batcher.flush()
+        counts['books'] = book_batcher.written
+        mean_popularity = sum(popularity) / len(popularity) if popularity else 1
+        book_rows = list(Book.objects.order_by('id').values_list('id', 'Title'))[-books:] if books else []
+        log(f'{counts["books"]} books')
+
+        # ---- Copies ----
+        copy_batcher = _Batcher(BookCopy, batch_size)
+        serial = BookCopy.objects.count()
+        copy_books = []
+        for (book_id, title), weight in zip(book_rows, popularity):
+            for _ in range(rng.randint(1, max(2 * copies_per_book - 1, 1))):
+                serial += 1
+                copy_batcher.add(BookCopy(
+                    book_id=book_id,
+                    accessionNumber=f'ACC{serial:08d}',
+                    Location=_weighted(rng, LOCATIONS),
+                ))
+                copy_books.append((title, weight / mean_popularity))
+        copy_batcher.flush()
+        counts['copies'] = copy_batcher.written
+        copy_ids = list(BookCopy.objects.order_by('id').values_list('id', 'accessionNumber'))[-counts['copies']:] if counts['copies'] else []
+        log(f'{counts["copies"]} copies')
+
+        # ---- Students ----
+        current_year = until.year if until.month >= 6 else until.year - 1
+        student_batcher = _Batcher(students, batch_size)
+        roster = []  # (school_id, name, enrolled_at, activity)
+        cohorts = []  # (first index, last index, enrolled_at)
+        per_grade = max(student_count // 6, 1)
+        index = students.objects.count()
+        for grade in range(7, 13):
+            enrolled_on = max(_school_year_start(current_year - (grade - 7)), history_start)
+            enrolled_at = _at(enrolled_on, 0)
+            batch_name = rng.choice(BATCH_NAMES)
+            first = len(roster)
+            for _ in range(per_grade if grade < 12 else student_count - 5 * per_grade):
+                index += 1
+                gender = rng.choice(('Male', 'Female'))
+                first_name = rng.choice(FIRST_NAMES[:10] if gender == 'Male' else FIRST_NAMES[10:])
+                last_name = rng.choice(LAST_NAMES)
+                school_id = f'SID{index:07d}'
+                name = f'{first_name} {rng.choice("ABCDEFGHIJ")}. {last_name} {index}'
+                student_batcher.add(students(
+                    name=name,
+                    school_id=school_id,
+                    gender=gender,
+                    email=f'{first_name.lower()}.{last_name.lower()}{index}@example.edu.ph',
+                    batch=batch_name,
+                    grade_Level=grade,
+                    section=rng.choice(SECTIONS),
+                ))
+                # a handful of students do most of the borrowing
+                roster.append((school_id, name, enrolled_at, rng.lognormvariate(0, 1)))
+            cohorts.append((first, len(roster), enrolled_at))
+        student_batcher.flush()
+        counts['students'] = student_batcher.written
+        # created_at is auto_now_add, so backdate each cohort with one UPDATE
+        student_ids = list(students.objects.order_by('id').values_list('id', flat=True))[-counts['students']:] if counts['students'] else []
+        for first, last, enrolled_at in cohorts:
+            if last > first:
+                students.objects.filter(id__range=(student_ids[first], student_ids[last - 1])).update(created_at=enrolled_at)
+        log(f'{counts["students"]} students')
+
+        # ---- Loans ----
+        cumulative = []
+        total = 0
+        for _, _, _, activity in roster:
+            total += activity
+            cumulative.append(total)
+        loan_batcher = _Batcher(BorrowHistory, batch_size)
+        out_copies = []  # (copy id, school_id, borrow_date)
+        daily_rate = loans_per_copy / 200.0  # ~200 school days a year
+        for (copy_id, accession), (title, weight) in zip(copy_ids, copy_books):
+            if not roster:
+                break
+            rate = daily_rate * weight
+            day = history_start
+            while rate > 0:
+                day = _next_school_day(day + timedelta(days=int(rng.expovariate(rate))))
+                if day > until:
+                    break
+                borrowed_at = _at(day, rng.randrange(9 * 60))
+                if borrowed_at > now:
+                    break
+                school_id, name, enrolled_at, _ = rng.choices(roster, cum_weights=cumulative)[0]
+                if enrolled_at > borrowed_at:
+                    day += timedelta(days=1)
+                    continue
+                due = BorrowHistory.due_date_for(borrowed_at)
+                if rng.random() < LATE_RETURN_RATE:
+                    returned_at = due + timedelta(days=rng.randint(1, 21), minutes=rng.randrange(480))
+                else:
+                    returned_at = borrowed_at + (due - borrowed_at) * rng.random()
+                still_out = returned_at > now
+                loan_batcher.add(BorrowHistory(
+                    book_copy_id=copy_id,
+                    bookID=accession,
+                    accountID=school_id,
+                    bookTitle=title,
+                    accountName=name,
+                    borrow_date=borrowed_at,
+                    return_date=due if still_out else returned_at,
+                    returned=not still_out,
+                ))
+                if still_out:
+                    out_copies.append((copy_id, school_id, borrowed_at))
+                    break
+                day = timezone.localtime(returned_at).date() + timedelta(days=1)
+        loan_batcher.flush()
+        counts['loans'] = loan_batcher.written
+        counts['open_loans'] = len(out_copies)
+        counts['overdue_loans'] = BorrowHistory.objects.filter(returned=False, return_date__lt=now).count()
+        log(f'{counts["loans"]} loans ({counts["open_loans"]} out, {counts["overdue_loans"]} overdue)')
+
+        # ---- Derived data ----
+        copies_out = {copy_id: (school_id, borrowed_at) for copy_id, school_id, borrowed_at in out_copies}
+        for start in range(0, len(out_copies), batch_size):
+            chunk = BookCopy.objects.filter(id__in=[row[0] for row in out_copies[start:start + batch_size]])
+            updated = []
+            for copy in chunk:
+                school_id, borrowed_at = copies_out[copy.id]
+                copy.status = 'Borrowed'
+                copy.borrowed_by = school_id
+                copy.student_id = school_id
+                copy.borrow_date = timezone.localtime(borrowed_at).date()
+                updated.append(copy)
+            BookCopy.objects.bulk_update(updated, ['status', 'borrowed_by', 'student_id', 'borrow_date'])
+        Book.recount_copies()
+        rebuild_rollups(chunk_size=batch_size)
+        if search.search_enabled():
+            search.rebuild_search_index(chunk_size=batch_size)
+        log('copy counters, rollup and search index rebuilt')
+    cache.clear()
+    return counts
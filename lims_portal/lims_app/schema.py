@@ -0,0 +1,51 @@
+"""
+What the database is missing compared with the lims_app models.
+
+lims_app ships no migrations, so a database created before a model, field
+or index was added keeps its old tables. `python manage.py upgrade_schema`
+(and `explain_queries --create-missing` for indexes) uses these to find and
+create only what is missing, so they are safe to run again and again.
+"""
+from django.apps import apps
+from django.db import connection
+
+
+def _models():
+    return [model for model in apps.get_app_config('lims_app').get_models() if model._meta.managed]
+
+
+def missing_tables():
+    """Models whose table does not exist."""
+    existing = set(connection.introspection.table_names())
+    return [model for model in _models() if model._meta.db_table not in existing]
+
+
+def missing_columns():
+    """(model, field) for columns of existing tables that the database does not have."""
+    missing = []
+    existing_tables = set(connection.introspection.table_names())
+    with connection.cursor() as cursor:
+        for model in _models():
+            if model._meta.db_table not in existing_tables:
+                continue
+            columns = {
+                column.name
+                for column in connection.introspection.get_table_description(cursor, model._meta.db_table)
+            }
+            missing.extend(
+                (model, field) for field in model._meta.local_concrete_fields if field.column not in columns
+            )
+    return missing
+
+
+def missing_indexes():
+    """(model, index) for model indexes of existing tables that the database does not have."""
+    missing = []
+    existing_tables = set(connection.introspection.table_names())
+    with connection.cursor() as cursor:
+        for model in _models():
+            if not model._meta.indexes or model._meta.db_table not in existing_tables:
+                continue
+            existing = connection.introspection.get_constraints(cursor, model._meta.db_table)
+            missing.extend((model, index) for index in model._meta.indexes if index.name not in existing)
+    return missing
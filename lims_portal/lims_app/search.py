@@ -0,0 +1,179 @@
+"""
+Full-text catalog search backed by an SQLite FTS5 table.
+
+The FTS table mirrors each Book plus the text of its copies (one row per
+book, rowid = Book.id). It is kept in sync by the signal handlers in
+signals.py and can be rebuilt with `python manage.py rebuild_search_index`.
+When the database is not SQLite or FTS5 is not compiled in, search_enabled()
+returns False and callers fall back to plain icontains lookups.
+"""
+import re
+
+from django.db import connection, transaction, DatabaseError
+from django.db.models.expressions import RawSQL
+
+from .models import Book
+
+FTS_TABLE = 'lims_app_book_fts'
+
+# Column order matters: bm25() weights below are positional
+FTS_COLUMNS = ('title', 'authors', 'call_number', 'publisher', 'accession_numbers', 'locations', 'other')
+FTS_WEIGHTS = (10.0, 5.0, 5.0, 2.0, 3.0, 1.0, 1.0)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_fts_supported = {}
+_fts_ready = set()
+
+
+def search_enabled():
+    """True when the default database can run FTS5 queries."""
+    if connection.vendor != 'sqlite':
+        return False
+    alias = connection.alias
+    if alias not in _fts_supported:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+                _fts_supported[alias] = bool(cursor.fetchone()[0])
+        except DatabaseError:
+            _fts_supported[alias] = False
+    return _fts_supported[alias]
+
+
+def search_table_exists():
+    return FTS_TABLE in connection.introspection.table_names()
+
+
+def search_ready():
+    """True when FTS5 is usable and the index table has been created."""
+    if connection.alias in _fts_ready:
+        return True
+    if search_enabled() and search_table_exists():
+        _fts_ready.add(connection.alias)
+        return True
+    return False
+
+
+def ensure_search_table():
+    """Create the FTS5 table if it does not exist yet."""
+    if not search_enabled():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"{', '.join(FTS_COLUMNS)}, tokenize='unicode61 remove_diacritics 2')"
+        )
+    return True
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term ("phys"* "intro"*), so user input
+    can never inject FTS operators and partially typed words still match.
+    """
+    tokens = _TOKEN_RE.findall(text or '')
+    return ' '.join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+
+
+def _book_document(book, copies):
+    authors = ' '.join(filter(None, [book.mainAuthor, book.coAuthor, book.Editors]))
+    other = ' '.join(filter(None, [
+        book.Edition,
+        book.placeofPublication,
+        book.Language,
+        book.Type,
+        book.acquisitionStatus,
+        ' '.join(sorted({c.status for c in copies})),
+        # who has a copy out, as the old icontains search on borrowed_by found
+        ' '.join(sorted({c.borrowed_by for c in copies if c.borrowed_by})),
+    ]))
+    return (
+        book.Title,
+        authors,
+        book.callNumber,
+        book.Publisher or '',
+        ' '.join(c.accessionNumber for c in copies),
+        ' '.join(sorted({c.Location for c in copies if c.Location})),
+        other,
+    )
+
+
+def _write_documents(cursor, books):
+    placeholders = ', '.join(['%s'] * (len(FTS_COLUMNS) + 1))
+    cursor.executemany(
+        f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) VALUES ({placeholders})",
+        [(book.id, *_book_document(book, list(book.copies.all()))) for book in books],
+    )
+
+
+def index_book(book_id):
+    """Re-index one book (or drop it from the index if it no longer exists)."""
+    index_books([book_id])
+
+
+def index_books(book_ids):
+    """Re-index several books with one DELETE and one batch of inserts.
+
+    Atomic, so two desks reindexing the same book after their commits
+    cannot interleave the DELETE and the INSERT. The DELETE comes first and
+    takes the write lock, so the rows read after it are the latest ones.
+    """
+    book_ids = list(book_ids)
+    if not book_ids or not search_ready():
+        return
+    with transaction.atomic(), connection.cursor() as cursor:
+        placeholders = ', '.join(['%s'] * len(book_ids))
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", book_ids)
+        books = Book.objects.filter(id__in=book_ids).prefetch_related('copies')
+        _write_documents(cursor, books)
+
+
+def remove_book(book_id):
+    if not search_ready():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [book_id])
+
+
+def rebuild_search_index(chunk_size=2000):
+    """Drop and repopulate the whole index. Returns the number of books indexed."""
+    if not search_enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    ensure_search_table()
+
+    indexed = 0
+    last_id = 0
+    with connection.cursor() as cursor:
+        while True:
+            chunk = list(
+                Book.objects.filter(id__gt=last_id).order_by('id').prefetch_related('copies')[:chunk_size]
+            )
+            if not chunk:
+                break
+            _write_documents(cursor, chunk)
+            indexed += len(chunk)
+            last_id = chunk[-1].id
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return indexed
+
+
+def matching_book_ids(text):
+    """Subquery expression selecting the ids of books matching `text`."""
+    return RawSQL(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+        [build_match_query(text)],
+    )
+
+
+def search_rank(text):
+    """bm25 score of a book for `text` (lower is better), for use in annotate()."""
+    weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+    return RawSQL(
+        f"SELECT bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND rowid = {Book._meta.db_table}.id",
+        [build_match_query(text)],
+    )
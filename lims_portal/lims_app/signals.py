@@ -0,0 +1,138 @@
+"""
+Signal handlers that keep derived data in sync: the catalog search index,
+version and copy counters (Book/BookCopy) and the circulation rollup
+(BorrowHistory/students). Connected from LimsAppConfig.ready().
+
+Counters and the rollup are written in the caller's transaction. Cache
+version bumps and search reindexing wait for it to commit (after_commit),
+so a concurrent reader cannot cache pages, facets or panels built from the
+pre-commit rows under the new version.
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Book, BookCopy, BorrowHistory, students
+from . import rollups, search
+from .analytics import bump_circulation_version
+from .catalog import bump_availability_version, bump_catalog_version
+
+
+def after_commit(func, *args):
+    """Run func(*args) once the current transaction commits (at once in autocommit).
+
+    robust: the write has already committed, so a failure here is logged
+    rather than reported to the caller as a failed save.
+    """
+    transaction.on_commit(partial(func, *args), robust=True)
+
+
+@receiver(post_save, sender=Book)
+def reindex_book_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    after_commit(search.index_book, instance.id)
+    after_commit(bump_catalog_version)
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book_on_delete(sender, instance, **kwargs):
+    after_commit(search.remove_book, instance.id)
+    after_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=BookCopy)
+def update_copy_counts_on_save(sender, instance, created, raw=False, **kwargs):
+    """Keep Book.total/available/borrowed_copies in step with this copy."""
+    if raw:
+        return
+    stored = getattr(instance, '_stored_state', None)
+    if created:
+        Book.adjust_copy_counts(instance.book_id, instance.status, 1)
+    elif stored is None:
+        # Saved from an instance that wasn't loaded from the DB: old state unknown
+        Book.recount_copies(Book.objects.filter(pk=instance.book_id))
+    elif stored[0] != instance.book_id:
+        Book.adjust_copy_counts(stored[0], stored[1], -1)
+        Book.adjust_copy_counts(instance.book_id, instance.status, 1)
+    elif stored[1] != instance.status:
+        Book.move_copy_status(instance.book_id, stored[1], instance.status)
+    instance._stored_state = (instance.book_id, instance.status)
+
+
+@receiver(post_delete, sender=BookCopy)
+def update_copy_counts_on_delete(sender, instance, **kwargs):
+    stored = getattr(instance, '_stored_state', None)
+    book_id, status = stored if stored else (instance.book_id, instance.status)
+    Book.adjust_copy_counts(book_id, status, -1)
+
+
+@receiver(post_save, sender=BookCopy)
+@receiver(post_delete, sender=BookCopy)
+def reindex_book_on_copy_change(sender, instance, signal, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    after_commit(search.index_book, instance.book_id)
+    listing = instance.catalog_listing()
+    if signal is post_save and not created and getattr(instance, '_stored_listing', None) == listing:
+        # Only the status (and loan fields) changed, e.g. a checkout
+        after_commit(bump_availability_version)
+    else:
+        after_commit(bump_catalog_version)
+    instance._stored_listing = listing
+
+
+@receiver(post_save, sender=BorrowHistory)
+def update_rollup_on_loan_save(sender, instance, created, raw=False, **kwargs):
+    """Fold a checkout/return into DailyCirculationStats, in the same transaction."""
+    if raw:
+        return
+    stored = getattr(instance, '_stored_state', None)
+    if created or stored is not None:
+        # An update from an instance that wasn't loaded from the DB has an
+        # unknown old state; backfill_rollups repairs that rare case
+        rollups.apply_loan_change(None if created else stored, instance.rollup_state())
+    instance._stored_state = instance.rollup_state()
+
+
+@receiver(post_delete, sender=BorrowHistory)
+def update_rollup_on_loan_delete(sender, instance, **kwargs):
+    rollups.apply_loan_change(getattr(instance, '_stored_state', None) or instance.rollup_state(), None)
+
+
+@receiver(post_save, sender=BorrowHistory)
+@receiver(post_delete, sender=BorrowHistory)
+@receiver(post_save, sender=students)
+@receiver(post_delete, sender=students)
+def invalidate_analytics(sender, raw=False, **kwargs):
+    if raw:
+        return
+    after_commit(bump_circulation_version)
+
+
+@receiver(post_save, sender=students)
+def update_rollup_on_student_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    stored = getattr(instance, '_stored_grade', None)
+    if created:
+        rollups.record_new_student(instance)
+    elif stored is not None and stored != instance.grade_Level:
+        # A move-up: new_students is counted under the current grade
+        rollups.record_new_student(instance, sign=-1, grade=stored)
+        rollups.record_new_student(instance)
+    instance._stored_grade = instance.grade_Level
+
+
+@receiver(post_delete, sender=students)
+def update_rollup_on_student_delete(sender, instance, **kwargs):
+    rollups.record_new_student(instance, sign=-1)
+
+
+def create_search_index(sender, **kwargs):
+    """Create (and fill, the first time) the FTS table after migrate."""
+    if not search.search_enabled() or search.search_table_exists():
+        return
+    search.rebuild_search_index()
@@ -15,43 +15,6 @@
     return escapeHtml(text).replace(regex, '<span class="suggestion-match">$1</span>');
   }
 
-  function buildMatches(book, queryLower, query) {
-    const matches = [];
-
-    function pushIf(label, value) {
-      if (!value) return;
-      const valueStr = String(value);
-      if (valueStr.toLowerCase().includes(queryLower)) {
-        matches.push(`<span class="suggestion-match">${label}</span>: ${highlightMatch(valueStr, query)}`);
-      }
-    }
-
-    pushIf('Title', book.Title);
-    pushIf('Author', book.mainAuthor);
-    pushIf('Co-Author', book.coAuthor);
-    pushIf('Call Number', book.callNumber);
-    pushIf('Publisher', book.Publisher);
-    pushIf('Edition', book.Edition);
-    pushIf('Language', book.Language);
-    pushIf('Type', book.Type);
-    pushIf('Place', book.placeofPublication);
-    pushIf('Editors', book.Editors);
-    pushIf('Acquisition', book.acquisitionStatus);
-    pushIf('Published', book.publicationDate);
-    pushIf('Copyright', book.copyrightDate);
-
-    if (book.copies && Array.isArray(book.copies)) {
-      book.copies.forEach((copy) => {
-        pushIf('Accession', copy && copy.accessionNumber);
-        pushIf('Location', copy && copy.Location);
-        pushIf('Status', copy && copy.status);
-        pushIf('Borrower', copy && copy.borrowed_by);
-      });
-    }
-
-    return matches;
-  }
-
   function displaySuggestions(container, books, query) {
     if (!books || books.length === 0) {
       container.innerHTML = '<div class="no-results">No books found</div>';
@@ -59,14 +22,11 @@
       return;
     }
 
-    const queryLower = query.toLowerCase();
     const safeQueryEncoded = encodeURIComponent(query);
 
-    const html = books.slice(0, 8).map((book) => {
-      const matches = buildMatches(book, queryLower, query);
-      const matchDetails = matches.length > 0 ? matches.slice(0, 3).join(' • ') : 'Match found';
-
+    const html = books.map((book) => {
       const title = escapeHtml(book && book.Title ? book.Title : 'Untitled');
+      const matchDetails = `<span class="suggestion-match">${escapeHtml(book.field)}</span>: ${highlightMatch(book.snippet, query)}`;
       const available = book && typeof book.available_copies !== 'undefined' ? book.available_copies : 0;
       const total = book && typeof book.total_copies !== 'undefined' ? book.total_copies : 0;
 
@@ -99,19 +59,27 @@
     if (!searchInput || !suggestionsContainer) return;
 
     let searchTimeout;
+    // Every request carries a sequence number; stale responses are ignored
+    // and the previous in-flight request is aborted.
+    let searchSeq = 0;
+    let inflight = null;
 
     function fetchSearchSuggestions(query) {
-      fetch(`/records/?search=${encodeURIComponent(query)}`, {
-        headers: {
-          'X-Requested-With': 'XMLHttpRequest',
-          'Accept': 'application/json'
-        }
+      const seq = ++searchSeq;
+      if (inflight) inflight.abort();
+      inflight = window.AbortController ? new AbortController() : null;
+
+      fetch(`/records/suggest/?q=${encodeURIComponent(query)}&seq=${seq}`, {
+        headers: { 'Accept': 'application/json' },
+        signal: inflight ? inflight.signal : undefined
       })
         .then((response) => response.json())
         .then((data) => {
-          displaySuggestions(suggestionsContainer, data && data.books ? data.books : [], query);
+          if (!data || String(data.seq) !== String(searchSeq)) return;
+          displaySuggestions(suggestionsContainer, data.suggestions || [], query);
         })
         .catch((error) => {
+          if (error && error.name === 'AbortError') return;
           // Fail closed: hide suggestions if backend errors
           console.error('Search error:', error);
           suggestionsContainer.classList.remove('show');
@@ -123,6 +91,7 @@
       clearTimeout(searchTimeout);
 
       if (query.length < 2) {
+        searchSeq++;
         suggestionsContainer.classList.remove('show');
         return;
       }
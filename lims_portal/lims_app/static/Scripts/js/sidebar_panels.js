@@ -0,0 +1,161 @@
+/* ==========================================
+   DASHBOARD BOOKS / STUDENTS PANELS
+   Each panel fetches its first page from admin_sidebar_panel the first
+   time it is opened; searching and "Load more" fetch further pages.
+   ========================================== */
+(function () {
+  var SEARCH_DELAY = 250;
+
+  var panels = {
+    books: { listId: 'booksList', searchId: 'bookSearch', render: renderBook, key: 'books', empty: 'No books found' },
+    students: { listId: 'usersList', searchId: 'userSearch', render: renderStudent, key: 'students', empty: 'No students found' }
+  };
+
+  var state = {};
+
+  function el(tag, cssText, text) {
+    var node = document.createElement(tag);
+    if (cssText) node.style.cssText = cssText;
+    if (text !== undefined) node.textContent = text;
+    return node;
+  }
+
+  function message(text) {
+    return el('p', 'text-align: center; color: var(--secondary-color); padding: 20px; font-size: 0.8rem;', text);
+  }
+
+  function editButton(onclick) {
+    var button = el('button', 'position: absolute; top: 10px; right: 10px; background: var(--accent); color: var(--accent-contrast); border: none; border-radius: 4px; padding: 4px 8px; font-size: 0.7rem; cursor: pointer;', 'Edit');
+    button.type = 'button';
+    button.addEventListener('click', onclick);
+    return button;
+  }
+
+  function renderBook(book) {
+    var item = el('div', 'padding: 12px; margin-bottom: 10px; background: var(--message-box-hover); border-radius: 8px; border-left: 4px solid ' + (book.available_copies > 0 ? 'var(--success)' : 'var(--danger)') + '; position: relative;');
+    item.className = 'book-item';
+    item.appendChild(editButton(function () {
+      openBookEditModal(book.id, book.Title, book.mainAuthor, book.coAuthor || '', book.Publisher || '', book.Edition || '',
+        book.callNumber || '', book.Language || '', book.Type || '', JSON.stringify(book.copies));
+    }));
+    item.appendChild(el('div', 'font-weight: 600; font-size: 0.9rem; color: var(--main-color); margin-bottom: 6px; padding-right: 50px;', book.Title));
+    item.appendChild(el('div', 'font-size: 0.75rem; color: var(--secondary-color); margin-bottom: 6px;', book.mainAuthor));
+
+    var counts = el('div', 'display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px; padding: 6px; background: var(--app-container); border-radius: 6px;');
+    counts.appendChild(el('span', 'font-size: 0.75rem; color: var(--main-color); font-weight: 500;', book.available_copies + ' available / ' + book.total_copies + ' copies'));
+    counts.appendChild(el('span', 'font-size: 0.7rem; color: var(--secondary-color);', book.callNumber || ''));
+    item.appendChild(counts);
+
+    var details = el('details', 'margin-top: 8px;');
+    details.appendChild(el('summary', 'cursor: pointer; font-size: 0.75rem; font-weight: 500; color: var(--main-color); padding: 4px; border-radius: 4px; background: var(--app-container);', 'View All Copies (' + book.total_copies + ')'));
+    var copies = el('div', 'margin-top: 8px; padding-left: 8px;');
+    book.copies.forEach(function (copy) {
+      var available = copy.status === 'Available';
+      var row = el('div', 'display: flex; justify-content: space-between; align-items: center; padding: 6px; margin-bottom: 4px; background: var(--app-container); border-radius: 4px; border-left: 2px solid ' + (available ? 'var(--success)' : 'var(--danger)') + ';');
+      var label = el('div', 'flex: 1;');
+      label.appendChild(el('div', 'font-size: 0.7rem; font-weight: 500; color: var(--main-color);', copy.accessionNumber));
+      label.appendChild(el('div', 'font-size: 0.65rem; color: var(--secondary-color);', copy.Location));
+      row.appendChild(label);
+      row.appendChild(el('span', 'padding: 2px 6px; border-radius: 4px; font-size: 0.65rem; ' + (available ? 'background: var(--success-bg); color: var(--success);' : 'background: var(--danger-bg); color: var(--danger);'), copy.status));
+      copies.appendChild(row);
+    });
+    if (!book.copies.length) {
+      copies.appendChild(el('p', 'font-size: 0.7rem; color: var(--secondary-color); padding: 8px;', 'No copies available'));
+    }
+    details.appendChild(copies);
+    item.appendChild(details);
+    return item;
+  }
+
+  function renderStudent(user) {
+    var item = el('div', 'padding: 10px; margin-bottom: 6px; background: var(--app-container); border-radius: 6px; border-left: 3px solid var(--accent); position: relative;');
+    item.className = 'user-item';
+    var edit = editButton(function () {
+      openUserEditModal(user.school_id, user.name, user.email, String(user.grade_num), user.batch, user.section);
+    });
+    edit.style.top = '6px';
+    edit.style.right = '6px';
+    item.appendChild(edit);
+    item.appendChild(el('div', 'font-weight: 600; font-size: 0.8rem; color: var(--main-color); margin-bottom: 3px; overflow: hidden; text-overflow: ellipsis; white-space: nowrap; padding-right: 45px;', user.name));
+    item.appendChild(el('div', 'font-size: 0.7rem; color: var(--secondary-color); margin-bottom: 2px;', user.school_id + ' | ' + user.grade));
+    item.appendChild(el('div', 'font-size: 0.65rem; color: var(--secondary-color);', user.batch + (user.section ? ' | ' + user.section : '')));
+    return item;
+  }
+
+  function updateGradeCounts(counts) {
+    var select = document.getElementById('userGradeFilter');
+    if (!select || !counts) return;
+    Array.prototype.forEach.call(select.options, function (option) {
+      if (option.value && counts[option.value] !== undefined) {
+        option.textContent = 'Grade ' + option.value + ' (' + counts[option.value] + ')';
+      }
+    });
+  }
+
+  function fetchPage(name, page) {
+    var panel = panels[name];
+    var list = document.getElementById(panel.listId);
+    if (!list) return;
+    var current = state[name];
+    var params = new URLSearchParams({ page: page });
+    var search = document.getElementById(panel.searchId);
+    if (search && search.value.trim()) params.set('q', search.value.trim());
+    if (name === 'students') {
+      var grade = document.getElementById('userGradeFilter');
+      if (grade && grade.value) params.set('grade', grade.value);
+    }
+    var request = current.request = {};
+
+    fetch(list.dataset.url + '?' + params.toString(), { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+      .then(function (response) {
+        if (!response.ok) throw new Error('HTTP ' + response.status);
+        return response.json();
+      })
+      .then(function (data) {
+        // a newer search has started since this request was sent
+        if (current.request !== request) return;
+        if (page === 1) list.innerHTML = '';
+        var more = list.querySelector('.panel-more');
+        if (more) more.remove();
+
+        data[panel.key].forEach(function (row) { list.appendChild(panel.render(row)); });
+        if (!list.children.length) list.appendChild(message(panel.empty));
+        if (name === 'students') updateGradeCounts(data.grade_counts);
+
+        if (data.has_next) {
+          more = el('button', 'width: 100%; background: var(--accent-soft); color: var(--accent); border: none; border-radius: 6px; padding: 8px 12px; font-size: 0.8rem; cursor: pointer; font-weight: 500;', 'Load more (' + (data.total - data.page * data.page_size) + ' left)');
+          more.type = 'button';
+          more.className = 'panel-more';
+          more.addEventListener('click', function () {
+            more.disabled = true;
+            fetchPage(name, data.page + 1);
+          });
+          list.appendChild(more);
+        }
+      })
+      .catch(function () {
+        if (current.request !== request) return;
+        list.innerHTML = '';
+        list.appendChild(message('Could not load the list. Close and reopen the panel to try again.'));
+        current.loaded = false;
+      });
+  }
+
+  function search(name) {
+    var current = state[name];
+    if (!current) return;
+    clearTimeout(current.timer);
+    current.timer = setTimeout(function () { fetchPage(name, 1); }, SEARCH_DELAY);
+  }
+
+  window.loadSidebarPanel = function (name) {
+    if (!panels[name]) return;
+    state[name] = state[name] || {};
+    if (state[name].loaded) return;
+    state[name].loaded = true;
+    fetchPage(name, 1);
+  };
+
+  window.searchBooks = function () { search('books'); };
+  window.searchUsers = function () { search('students'); };
+})();
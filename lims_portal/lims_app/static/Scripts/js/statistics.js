@@ -8,25 +8,13 @@ document.addEventListener('DOMContentLoaded', function() {
     
     /* ==========================================
        DATA INITIALIZATION
-       Load analytics data from window object (injected from Django)
+       Panels are fetched from the analytics_panel endpoint (see
+       window.analyticsConfig, injected from Django); only the KPI cards
+       and the borrow duration chart come with the page itself
        ========================================== */
-    const metrics = window.analyticsData || {};
-
-    // Monthly borrows data with fallback defaults
-    const monthlyLabels = metrics.monthlyLabels || ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul'];
-    const monthlyData = metrics.monthlyData || [4, 3, 9, 3, 4, 3, 4];
-
-    // Weekly activity data with fallback defaults
-    const weeklyLabels = metrics.weeklyLabels || ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'];
-    const weeklyData = metrics.weeklyData || [12, 19, 15, 21, 18, 24, 22];
-
-    // Book type distribution data with fallback defaults
-    const typeLabels = metrics.typeLabels || ['Books', 'Article', 'Thesis', 'Analytics'];
-    const typeData = metrics.typeData || [400, 300, 300, 200];
-
-    // Language distribution data with fallback defaults
-    const languageLabels = metrics.languageLabels || ['English', 'Filipino', 'Spanish', 'Others'];
-    const languageData = metrics.languageData || [500, 200, 150, 100];
+    const config = window.analyticsConfig || {};
+    const durationScript = document.getElementById('durationChartData');
+    const durationChartData = durationScript ? JSON.parse(durationScript.textContent) : {};
 
      /* ==========================================
          CHART.JS GLOBAL CONFIGURATION
@@ -48,176 +36,6 @@ document.addEventListener('DOMContentLoaded', function() {
      Chart.defaults.font.family = '"DM Sans", sans-serif';
      Chart.defaults.color = themeColors.textMuted;
 
-    /* ==========================================
-       MONTHLY BORROWS CHART
-       Line chart showing borrowing trends over months
-       ========================================== */
-    const revenueCanvas = document.getElementById('revenueChart');
-    if (revenueCanvas) {
-        const revenueCtx = revenueCanvas.getContext('2d');
-        new Chart(revenueCtx, {
-            type: 'line',
-            data: {
-                labels: monthlyLabels,
-                datasets: [{
-                    label: 'Borrows',
-                    data: monthlyData,
-                    borderColor: themeColors.accent,
-                    backgroundColor: themeColors.accentSoft,
-                    borderWidth: 3,
-                    fill: true,                          // Fill area under line
-                    tension: 0.4,                        // Curve the line (0 = straight, 1 = very curved)
-                    
-                    // Point styling for data markers
-                    pointRadius: 5,
-                    pointHoverRadius: 7,
-                    pointBackgroundColor: themeColors.accent,
-                    pointBorderColor: '#fff',
-                    pointBorderWidth: 2,
-                    
-                    // Hover state styling
-                    pointHoverBackgroundColor: themeColors.accentStrong,
-                    pointHoverBorderColor: '#fff',
-                    pointHoverBorderWidth: 3
-                }]
-            },
-            options: {
-                responsive: true,                        // Auto-resize with container
-                maintainAspectRatio: false,              // Allow custom height
-                interaction: {
-                    mode: 'index',                       // Show tooltip for all datasets at x-position
-                    intersect: false                     // Show tooltip even when not directly over point
-                },
-                scales: {
-                    y: {
-                        beginAtZero: true,               // Start y-axis at 0
-                        grid: {
-                            color: 'rgba(0, 0, 0, 0.05)',
-                            drawBorder: false
-                        },
-                        ticks: {
-                            precision: 0,                // No decimal places (whole numbers only)
-                            padding: 10,
-                            font: { size: 12 }
-                        }
-                    },
-                    x: {
-                        grid: {
-                            display: false,              // Hide vertical grid lines
-                            drawBorder: false
-                        },
-                        ticks: {
-                            padding: 10,
-                            font: { size: 12 }
-                        }
-                    }
-                },
-                plugins: {
-                    legend: {
-                        display: false                   // Hide legend (only one dataset)
-                    },
-                    tooltip: {
-                        backgroundColor: 'rgba(0, 0, 0, 0.8)',
-                        padding: 12,
-                        cornerRadius: 8,
-                        titleFont: {
-                            size: 14,
-                            weight: '600'
-                        },
-                        bodyFont: {
-                            size: 13
-                        },
-                        displayColors: false,            // Hide color box in tooltip
-                        callbacks: {
-                            // Custom tooltip text format
-                            label: function(context) {
-                                return 'Borrows: ' + context.parsed.y;
-                            }
-                        }
-                    }
-                }
-            }
-        });
-    }
-
-    /* ==========================================
-       WEEKLY ACTIVITY CHART
-       Bar chart showing daily borrows for the last 7 days
-       ========================================== */
-    const userCanvas = document.getElementById('userChart');
-    if (userCanvas) {
-        const userCtx = userCanvas.getContext('2d');
-        new Chart(userCtx, {
-            type: 'bar',
-            data: {
-                labels: weeklyLabels,
-                datasets: [{
-                    label: 'Borrows / day',
-                    data: weeklyData,
-                    backgroundColor: themeColors.info,
-                    borderRadius: 8,                     // Rounded corners on bars
-                    borderSkipped: false,                // Round all corners, not just top
-                    hoverBackgroundColor: themeColors.accentStrong
-                }]
-            },
-            options: {
-                responsive: true,
-                maintainAspectRatio: false,
-                interaction: {
-                    mode: 'index',
-                    intersect: false
-                },
-                scales: {
-                    y: {
-                        beginAtZero: true,
-                        grid: {
-                            color: 'rgba(0, 0, 0, 0.05)',
-                            drawBorder: false
-                        },
-                        ticks: {
-                            precision: 0,                // Whole numbers only
-                            padding: 10,
-                            font: { size: 12 }
-                        }
-                    },
-                    x: {
-                        grid: {
-                            display: false,
-                            drawBorder: false
-                        },
-                        ticks: {
-                            padding: 10,
-                            font: { size: 12 }
-                        }
-                    }
-                },
-                plugins: {
-                    legend: {
-                        display: false
-                    },
-                    tooltip: {
-                        backgroundColor: 'rgba(0, 0, 0, 0.8)',
-                        padding: 12,
-                        cornerRadius: 8,
-                        titleFont: {
-                            size: 14,
-                            weight: '600'
-                        },
-                        bodyFont: {
-                            size: 13
-                        },
-                        displayColors: false,
-                        callbacks: {
-                            label: function(context) {
-                                return 'Borrows: ' + context.parsed.y;
-                            }
-                        }
-                    }
-                }
-            }
-        });
-    }
-
     /* ==========================================
        COLOR GENERATOR HELPER FUNCTION
        Generates unique colors for charts with many segments
@@ -247,133 +65,721 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     /* ==========================================
-       BOOKS BY TYPE CHART
-       Doughnut chart showing distribution of book types
+       TRENDS PANEL
+       Monthly borrows and daily activity for the last 7 days
        ========================================== */
-    const salesCanvas = document.getElementById('salesChart');
-    if (salesCanvas) {
-        const salesCtx = salesCanvas.getContext('2d');
-        const typeColors = generateColors(typeLabels.length);
-        
-        new Chart(salesCtx, {
-            type: 'doughnut',
-            data: {
-                labels: typeLabels,
-                datasets: [{
-                    data: typeData,
-                    backgroundColor: typeColors,
-                    borderWidth: 0,                      // No borders between segments
-                    hoverOffset: 15,                     // Pull segment out on hover
-                    hoverBorderWidth: 0
-                }]
-            },
-            options: {
-                responsive: true,
-                maintainAspectRatio: false,
-                cutout: '65%',                           // Size of donut hole (65% = large hole)
-                plugins: {
-                    legend: {
-                        position: 'bottom',
-                        labels: {
-                            padding: 20,
-                            usePointStyle: true,         // Use circles instead of rectangles
-                            pointStyle: 'circle',
-                            font: {
-                                size: 13,
-                                family: "'Inter', sans-serif"
+    function renderTrends(metrics) {
+        const monthlyLabels = metrics.monthlyLabels || [];
+        const monthlyData = metrics.monthlyData || [];
+        const weeklyLabels = metrics.weeklyLabels || [];
+        const weeklyData = metrics.weeklyData || [];
+
+        /* ==========================================
+           MONTHLY BORROWS CHART
+           Line chart showing borrowing trends over months
+           ========================================== */
+        const revenueCanvas = document.getElementById('revenueChart');
+        if (revenueCanvas) {
+            const revenueCtx = revenueCanvas.getContext('2d');
+            new Chart(revenueCtx, {
+                type: 'line',
+                data: {
+                    labels: monthlyLabels,
+                    datasets: [{
+                        label: 'Borrows',
+                        data: monthlyData,
+                        borderColor: themeColors.accent,
+                        backgroundColor: themeColors.accentSoft,
+                        borderWidth: 3,
+                        fill: true,                          // Fill area under line
+                        tension: 0.4,                        // Curve the line (0 = straight, 1 = very curved)
+                    
+                        // Point styling for data markers
+                        pointRadius: 5,
+                        pointHoverRadius: 7,
+                        pointBackgroundColor: themeColors.accent,
+                        pointBorderColor: '#fff',
+                        pointBorderWidth: 2,
+                    
+                        // Hover state styling
+                        pointHoverBackgroundColor: themeColors.accentStrong,
+                        pointHoverBorderColor: '#fff',
+                        pointHoverBorderWidth: 3
+                    }]
+                },
+                options: {
+                    responsive: true,                        // Auto-resize with container
+                    maintainAspectRatio: false,              // Allow custom height
+                    interaction: {
+                        mode: 'index',                       // Show tooltip for all datasets at x-position
+                        intersect: false                     // Show tooltip even when not directly over point
+                    },
+                    scales: {
+                        y: {
+                            beginAtZero: true,               // Start y-axis at 0
+                            grid: {
+                                color: 'rgba(0, 0, 0, 0.05)',
+                                drawBorder: false
+                            },
+                            ticks: {
+                                precision: 0,                // No decimal places (whole numbers only)
+                                padding: 10,
+                                font: { size: 12 }
+                            }
+                        },
+                        x: {
+                            grid: {
+                                display: false,              // Hide vertical grid lines
+                                drawBorder: false
                             },
-                            color: '#64748b'
+                            ticks: {
+                                padding: 10,
+                                font: { size: 12 }
+                            }
                         }
                     },
-                    tooltip: {
-                        backgroundColor: 'rgba(0, 0, 0, 0.8)',
-                        padding: 12,
-                        cornerRadius: 8,
-                        titleFont: {
-                            size: 14,
-                            weight: '600'
+                    plugins: {
+                        legend: {
+                            display: false                   // Hide legend (only one dataset)
                         },
-                        bodyFont: {
-                            size: 13
+                        tooltip: {
+                            backgroundColor: 'rgba(0, 0, 0, 0.8)',
+                            padding: 12,
+                            cornerRadius: 8,
+                            titleFont: {
+                                size: 14,
+                                weight: '600'
+                            },
+                            bodyFont: {
+                                size: 13
+                            },
+                            displayColors: false,            // Hide color box in tooltip
+                            callbacks: {
+                                // Custom tooltip text format
+                                label: function(context) {
+                                    return 'Borrows: ' + context.parsed.y;
+                                }
+                            }
+                        }
+                    }
+                }
+            });
+        }
+
+        /* ==========================================
+           WEEKLY ACTIVITY CHART
+           Bar chart showing daily borrows for the last 7 days
+           ========================================== */
+        const userCanvas = document.getElementById('userChart');
+        if (userCanvas) {
+            const userCtx = userCanvas.getContext('2d');
+            new Chart(userCtx, {
+                type: 'bar',
+                data: {
+                    labels: weeklyLabels,
+                    datasets: [{
+                        label: 'Borrows / day',
+                        data: weeklyData,
+                        backgroundColor: themeColors.info,
+                        borderRadius: 8,                     // Rounded corners on bars
+                        borderSkipped: false,                // Round all corners, not just top
+                        hoverBackgroundColor: themeColors.accentStrong
+                    }]
+                },
+                options: {
+                    responsive: true,
+                    maintainAspectRatio: false,
+                    interaction: {
+                        mode: 'index',
+                        intersect: false
+                    },
+                    scales: {
+                        y: {
+                            beginAtZero: true,
+                            grid: {
+                                color: 'rgba(0, 0, 0, 0.05)',
+                                drawBorder: false
+                            },
+                            ticks: {
+                                precision: 0,                // Whole numbers only
+                                padding: 10,
+                                font: { size: 12 }
+                            }
                         },
-                        callbacks: {
-                            // Show count and percentage in tooltip
-                            label: function(context) {
-                                const label = context.label || '';
-                                const value = context.parsed || 0;
-                                const total = context.dataset.data.reduce((a, b) => a + b, 0);
-                                const percentage = total > 0 ? ((value / total) * 100).toFixed(1) : 0;
-                                return label + ': ' + value + ' (' + percentage + '%)';
+                        x: {
+                            grid: {
+                                display: false,
+                                drawBorder: false
+                            },
+                            ticks: {
+                                padding: 10,
+                                font: { size: 12 }
+                            }
+                        }
+                    },
+                    plugins: {
+                        legend: {
+                            display: false
+                        },
+                        tooltip: {
+                            backgroundColor: 'rgba(0, 0, 0, 0.8)',
+                            padding: 12,
+                            cornerRadius: 8,
+                            titleFont: {
+                                size: 14,
+                                weight: '600'
+                            },
+                            bodyFont: {
+                                size: 13
+                            },
+                            displayColors: false,
+                            callbacks: {
+                                label: function(context) {
+                                    return 'Borrows: ' + context.parsed.y;
+                                }
                             }
                         }
                     }
                 }
-            }
-        });
+            });
+        }
     }
 
+    function renderDuration(durationLabels, durationData) {
+        /* ==========================================
+           BORROW DURATION CHART
+           Bar chart of how long completed loans lasted
+           ========================================== */
+        const durationCanvas = document.getElementById('durationChart');
+        if (durationCanvas) {
+            const durationCtx = durationCanvas.getContext('2d');
+            new Chart(durationCtx, {
+                type: 'bar',
+                data: {
+                    labels: durationLabels,
+                    datasets: [{
+                        label: 'Loans',
+                        data: durationData,
+                        backgroundColor: themeColors.success,
+                        borderRadius: 8,
+                        borderSkipped: false,
+                        hoverBackgroundColor: themeColors.accentStrong
+                    }]
+                },
+                options: {
+                    responsive: true,
+                    maintainAspectRatio: false,
+                    scales: {
+                        y: {
+                            beginAtZero: true,
+                            grid: {
+                                color: 'rgba(0, 0, 0, 0.05)',
+                                drawBorder: false
+                            },
+                            ticks: {
+                                precision: 0,
+                                padding: 10,
+                                font: { size: 12 }
+                            }
+                        },
+                        x: {
+                            grid: {
+                                display: false,
+                                drawBorder: false
+                            },
+                            ticks: {
+                                padding: 10,
+                                font: { size: 12 }
+                            }
+                        }
+                    },
+                    plugins: {
+                        legend: {
+                            display: false
+                        },
+                        tooltip: {
+                            backgroundColor: 'rgba(0, 0, 0, 0.8)',
+                            padding: 12,
+                            cornerRadius: 8,
+                            displayColors: false,
+                            callbacks: {
+                                label: function(context) {
+                                    return 'Loans: ' + context.parsed.y;
+                                }
+                            }
+                        }
+                    }
+                }
+            });
+        }
+    }
+    renderDuration(durationChartData.labels || [], durationChartData.data || []);
+
     /* ==========================================
-       BOOKS BY LANGUAGE CHART
-       Doughnut chart showing distribution by language
+       COLLECTION PANEL
+       Book type and language doughnuts plus per-location copy counts
        ========================================== */
-    const languageCanvas = document.getElementById('languageChart');
-    if (languageCanvas) {
-        const languageCtx = languageCanvas.getContext('2d');
-        const langColors = generateColors(languageLabels.length);
+    function renderCollection(metrics) {
+        const typeLabels = metrics.typeLabels || [];
+        const typeData = metrics.typeData || [];
+        const languageLabels = metrics.languageLabels || [];
+        const languageData = metrics.languageData || [];
+
+        /* ==========================================
+           BOOKS BY TYPE CHART
+           Doughnut chart showing distribution of book types
+           ========================================== */
+        const salesCanvas = document.getElementById('salesChart');
+        if (salesCanvas) {
+            const salesCtx = salesCanvas.getContext('2d');
+            const typeColors = generateColors(typeLabels.length);
         
-        new Chart(languageCtx, {
-            type: 'doughnut',
-            data: {
-                labels: languageLabels,
-                datasets: [{
-                    data: languageData,
-                    backgroundColor: langColors,
-                    borderWidth: 0,
-                    hoverOffset: 15,
-                    hoverBorderWidth: 0
-                }]
-            },
-            options: {
-                responsive: true,
-                maintainAspectRatio: false,
-                cutout: '65%',
-                plugins: {
-                    legend: {
-                        position: 'bottom',
-                        labels: {
-                            padding: 20,
-                            usePointStyle: true,
-                            pointStyle: 'circle',
-                            font: {
-                                size: 13,
-                                family: "'Inter', sans-serif"
+            new Chart(salesCtx, {
+                type: 'doughnut',
+                data: {
+                    labels: typeLabels,
+                    datasets: [{
+                        data: typeData,
+                        backgroundColor: typeColors,
+                        borderWidth: 0,                      // No borders between segments
+                        hoverOffset: 15,                     // Pull segment out on hover
+                        hoverBorderWidth: 0
+                    }]
+                },
+                options: {
+                    responsive: true,
+                    maintainAspectRatio: false,
+                    cutout: '65%',                           // Size of donut hole (65% = large hole)
+                    plugins: {
+                        legend: {
+                            position: 'bottom',
+                            labels: {
+                                padding: 20,
+                                usePointStyle: true,         // Use circles instead of rectangles
+                                pointStyle: 'circle',
+                                font: {
+                                    size: 13,
+                                    family: "'Inter', sans-serif"
+                                },
+                                color: '#64748b'
+                            }
+                        },
+                        tooltip: {
+                            backgroundColor: 'rgba(0, 0, 0, 0.8)',
+                            padding: 12,
+                            cornerRadius: 8,
+                            titleFont: {
+                                size: 14,
+                                weight: '600'
+                            },
+                            bodyFont: {
+                                size: 13
                             },
-                            color: '#64748b'
+                            callbacks: {
+                                // Show count and percentage in tooltip
+                                label: function(context) {
+                                    const label = context.label || '';
+                                    const value = context.parsed || 0;
+                                    const total = context.dataset.data.reduce((a, b) => a + b, 0);
+                                    const percentage = total > 0 ? ((value / total) * 100).toFixed(1) : 0;
+                                    return label + ': ' + value + ' (' + percentage + '%)';
+                                }
+                            }
                         }
-                    },
-                    tooltip: {
-                        backgroundColor: 'rgba(0, 0, 0, 0.8)',
-                        padding: 12,
-                        cornerRadius: 8,
-                        titleFont: {
-                            size: 14,
-                            weight: '600'
-                        },
-                        bodyFont: {
-                            size: 13
+                    }
+                }
+            });
+        }
+
+        /* ==========================================
+           BOOKS BY LANGUAGE CHART
+           Doughnut chart showing distribution by language
+           ========================================== */
+        const languageCanvas = document.getElementById('languageChart');
+        if (languageCanvas) {
+            const languageCtx = languageCanvas.getContext('2d');
+            const langColors = generateColors(languageLabels.length);
+        
+            new Chart(languageCtx, {
+                type: 'doughnut',
+                data: {
+                    labels: languageLabels,
+                    datasets: [{
+                        data: languageData,
+                        backgroundColor: langColors,
+                        borderWidth: 0,
+                        hoverOffset: 15,
+                        hoverBorderWidth: 0
+                    }]
+                },
+                options: {
+                    responsive: true,
+                    maintainAspectRatio: false,
+                    cutout: '65%',
+                    plugins: {
+                        legend: {
+                            position: 'bottom',
+                            labels: {
+                                padding: 20,
+                                usePointStyle: true,
+                                pointStyle: 'circle',
+                                font: {
+                                    size: 13,
+                                    family: "'Inter', sans-serif"
+                                },
+                                color: '#64748b'
+                            }
                         },
-                        callbacks: {
-                            label: function(context) {
-                                const label = context.label || '';
-                                const value = context.parsed || 0;
-                                const total = context.dataset.data.reduce((a, b) => a + b, 0);
-                                const percentage = total > 0 ? ((value / total) * 100).toFixed(1) : 0;
-                                return label + ': ' + value + ' (' + percentage + '%)';
+                        tooltip: {
+                            backgroundColor: 'rgba(0, 0, 0, 0.8)',
+                            padding: 12,
+                            cornerRadius: 8,
+                            titleFont: {
+                                size: 14,
+                                weight: '600'
+                            },
+                            bodyFont: {
+                                size: 13
+                            },
+                            callbacks: {
+                                label: function(context) {
+                                    const label = context.label || '';
+                                    const value = context.parsed || 0;
+                                    const total = context.dataset.data.reduce((a, b) => a + b, 0);
+                                    const percentage = total > 0 ? ((value / total) * 100).toFixed(1) : 0;
+                                    return label + ': ' + value + ' (' + percentage + '%)';
+                                }
                             }
                         }
                     }
                 }
+            });
+        }
+
+        renderList('locationStatsList', metrics.location_stats, loc => activityItem({
+            icon: 'fa-bookmark', iconClass: 'icon-green', border: true,
+            title: truncateWords(loc.Location, 3),
+            subtitle: 'Available: ' + loc.available + ' | Borrowed: ' + loc.borrowed,
+            side: loc.total + ' books', sideClass: 'activity-count-green'
+        }));
+    }
+
+    /* ==========================================
+       LIST RENDERING HELPERS
+       Build the activity-list rows the template used to render
+       ========================================== */
+    function escapeHtml(value) {
+        return String(value == null ? '' : value)
+            .replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;')
+            .replace(/"/g, '&quot;').replace(/'/g, '&#39;');
+    }
+
+    function truncateWords(value, count) {
+        const words = String(value || '').split(/\s+/).filter(Boolean);
+        return words.length > count ? words.slice(0, count).join(' ') + ' …' : words.join(' ');
+    }
+
+    function formatDate(value, withTime) {
+        if (!value) return '';
+        const date = new Date(value);
+        const options = { month: 'short', day: '2-digit', year: 'numeric' };
+        if (withTime) {
+            options.hour = '2-digit';
+            options.minute = '2-digit';
+            options.hour12 = false;
+        }
+        return date.toLocaleString('en-US', options);
+    }
+
+    function activityItem(item) {
+        return '<div class="activity-item' + (item.border ? ' activity-item-border' : '') + '">' +
+            '<div class="activity-content">' +
+            '<div class="activity-icon ' + item.iconClass + '"><i class="fas ' + item.icon + '"></i></div>' +
+            '<div class="activity-text"><h4>' + escapeHtml(item.title) + '</h4><p>' + escapeHtml(item.subtitle) + '</p></div>' +
+            '</div>' +
+            '<div class="activity-time ' + (item.sideClass || '') + '">' + escapeHtml(item.side) + '</div>' +
+            '</div>';
+    }
+
+    function renderList(elementId, rows, renderRow, emptyText) {
+        const element = document.getElementById(elementId);
+        if (!element) return;
+        if (!rows || !rows.length) {
+            element.innerHTML = '<p class="empty-state">' + escapeHtml(emptyText || 'No data available') + '</p>';
+            return;
+        }
+        element.innerHTML = rows.map(renderRow).join('');
+    }
+
+    /* ==========================================
+       LEADERS PANEL
+       Top borrowers and most borrowed books
+       ========================================== */
+    function renderLeaders(metrics) {
+        renderList('topBorrowersList', metrics.top_borrowers, borrower => activityItem({
+            icon: 'fa-user', iconClass: 'icon-blue', border: true,
+            title: borrower.accountName, subtitle: 'ID: ' + borrower.accountID,
+            side: borrower.borrow_count + ' borrows', sideClass: 'activity-count-blue'
+        }));
+        renderList('mostBorrowedList', metrics.most_borrowed, book => activityItem({
+            icon: 'fa-book', iconClass: 'icon-purple', border: true,
+            title: truncateWords(book.bookTitle, 5), subtitle: 'Acc: ' + (book.bookID || ''),
+            side: book.borrow_count + 'x', sideClass: 'activity-count-purple'
+        }));
+    }
+
+    /* ==========================================
+       DEMOGRAPHICS PANEL
+       Overall and per-grade gender pies
+       ========================================== */
+    function renderDemographics(metrics) {
+        const genderColors = [themeColors.accent, themeColors.info, themeColors.warning];
+        const pieOptions = {
+            responsive: true,
+            plugins: {
+                legend: { position: 'bottom' },
+                tooltip: { callbacks: { label: function(context) { return context.label + ': ' + context.parsed + '%'; } } }
             }
+        };
+
+        const overallCanvas = document.getElementById('overallGenderChart');
+        if (overallCanvas) {
+            new Chart(overallCanvas.getContext('2d'), {
+                type: 'pie',
+                data: {
+                    labels: metrics.overall_gender_labels || [],
+                    datasets: [{ data: metrics.overall_gender_data || [], backgroundColor: genderColors, borderColor: genderColors, borderWidth: 1 }]
+                },
+                options: pieOptions
+            });
+        }
+
+        const batchPieData = metrics.batch_gender_pie_data || {};
+        const batchSelect = document.getElementById('batchSelect');
+        const batchCanvas = document.getElementById('batchGenderChart');
+        const batches = Object.keys(batchPieData);
+        if (!batchCanvas || !batchSelect || !batches.length) return;
+
+        batchSelect.innerHTML = batches.map(batch => '<option value="' + escapeHtml(batch) + '">' + escapeHtml(batch) + '</option>').join('');
+        const batchChart = new Chart(batchCanvas.getContext('2d'), {
+            type: 'pie',
+            data: {
+                labels: batchPieData[batches[0]].labels,
+                datasets: [{ data: batchPieData[batches[0]].data, backgroundColor: genderColors, borderColor: genderColors, borderWidth: 1 }]
+            },
+            options: pieOptions
+        });
+        batchSelect.addEventListener('change', function() {
+            const data = batchPieData[this.value];
+            batchChart.data.labels = data.labels;
+            batchChart.data.datasets[0].data = data.data;
+            batchChart.update();
+        });
+    }
+
+    /* ==========================================
+       ACTIVITY PANEL
+       Overdue loans and the most recent checkouts
+       ========================================== */
+    function renderActivity(metrics) {
+        renderList('overdueList', metrics.overdue_list, loan => activityItem({
+            icon: 'fa-clock', iconClass: 'icon-red',
+            title: truncateWords(loan.book_title, 6),
+            subtitle: loan.account_name + ' (' + loan.account_id + ')',
+            side: 'Due: ' + formatDate(loan.return_date), sideClass: 'activity-time-danger'
+        }));
+        renderList('recentActivityList', metrics.recent_activity, loan => activityItem({
+            icon: 'fa-book', iconClass: 'icon-blue',
+            title: truncateWords(loan.book_title, 8) + ' was borrowed',
+            subtitle: loan.account_name + ' (' + loan.account_id + ')',
+            side: formatDate(loan.borrow_date, true)
+        }), 'No recent activity');
+    }
+
+    /* ==========================================
+       HEATMAP PANEL
+       Calendar of borrows per day; prev/next and the range select
+       refetch only this panel
+       ========================================== */
+    const heatmapState = {
+        range: new URLSearchParams(config.query || '').get('heatmap_range') || 'year',
+        offset: parseInt(new URLSearchParams(config.query || '').get('heatmap_offset') || '0', 10) || 0
+    };
+
+    function renderHeatmap(metrics) {
+        const grid = document.getElementById('heatmapGrid');
+        const label = document.getElementById('heatmapLabel');
+        const rangeSelect = document.getElementById('heatmap-range-select');
+        const nextBtn = document.getElementById('heatmapNext');
+        if (!grid) return;
+
+        heatmapState.range = metrics.heatmapRange;
+        heatmapState.offset = metrics.heatmapOffset;
+        if (label) label.textContent = metrics.heatmapPeriodLabel || '';
+        if (rangeSelect) rangeSelect.value = metrics.heatmapRange;
+        if (nextBtn) nextBtn.disabled = !metrics.heatmapCanGoNext;
+
+        const days = metrics.heatmapData || [];
+        const max = days.reduce((highest, day) => Math.max(highest, day.count), 0);
+        // Monday-first rows: pad the first column up to the first day's weekday
+        const firstWeekday = days.length ? (new Date(days[0].date + 'T00:00:00').getDay() + 6) % 7 : 0;
+        let cells = '';
+        for (let i = 0; i < firstWeekday; i++) {
+            cells += '<span class="heatmap-cell heatmap-pad"></span>';
+        }
+        days.forEach(day => {
+            const level = day.count === 0 || max === 0 ? 0 : Math.ceil((day.count / max) * 4);
+            cells += '<span class="heatmap-cell heatmap-level-' + level + '" title="' +
+                escapeHtml(day.date + ': ' + day.count + ' borrow' + (day.count === 1 ? '' : 's')) + '"></span>';
+        });
+        grid.innerHTML = cells;
+    }
+
+    /* ==========================================
+       PANEL LOADING
+       Each panel is fetched independently so slow ones don't hold up the rest
+       ========================================== */
+    const panelRenderers = {
+        trends: renderTrends,
+        collection: renderCollection,
+        leaders: renderLeaders,
+        demographics: renderDemographics,
+        activity: renderActivity,
+        heatmap: renderHeatmap
+    };
+
+    function panelUrl(name, overrides) {
+        const params = new URLSearchParams(config.query || '');
+        if (config.refresh) params.set('refresh', '1');
+        Object.keys(overrides || {}).forEach(key => params.set(key, overrides[key]));
+        return config.panelUrl.replace('panel-name', name) + '?' + params.toString();
+    }
+
+    function loadPanel(name, overrides) {
+        return fetch(panelUrl(name, overrides), { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+            .then(response => {
+                if (!response.ok) throw new Error(response.status + ' ' + response.statusText);
+                return response.json();
+            })
+            .then(data => panelRenderers[name](data))
+            .catch(error => {
+                document.querySelectorAll('[data-panel="' + name + '"] .panel-loading').forEach(el => {
+                    el.textContent = 'Could not load this panel.';
+                });
+                console.error('Analytics panel "' + name + '" failed:', error);
+            });
+    }
+
+    if (config.panelUrl) {
+        (config.panels || []).forEach(name => loadPanel(name));
+    }
+
+    function reloadHeatmap() {
+        const overrides = { heatmap_range: heatmapState.range, heatmap_offset: heatmapState.offset };
+        // Keep the URL (and so reloads, exports and the period form) in step
+        const pageParams = new URLSearchParams(window.location.search);
+        pageParams.set('heatmap_range', heatmapState.range);
+        pageParams.set('heatmap_offset', heatmapState.offset);
+        pageParams.delete('refresh');
+        window.history.replaceState(null, '', '?' + pageParams.toString());
+        document.querySelectorAll('#period-form input[name="heatmap_range"]').forEach(el => { el.value = heatmapState.range; });
+        document.querySelectorAll('#period-form input[name="heatmap_offset"]').forEach(el => { el.value = heatmapState.offset; });
+        loadPanel('heatmap', overrides);
+    }
+
+    /* ==========================================
+       SIDEBAR BOOKS / STUDENTS
+       Loaded the first time their panel is opened
+       ========================================== */
+    const sidebarLoaded = {};
+
+    function renderSidebarBooks(data) {
+        const list = document.getElementById('booksList');
+        if (!list) return;
+        const books = data.books || [];
+        if (!books.length) {
+            list.innerHTML = '<p style="text-align: center; color: var(--secondary-color); padding: 20px; font-size: 0.8rem;">No books</p>';
+            return;
+        }
+        list.innerHTML = books.map(book => {
+            const copies = (book.copies || []).map(copy => {
+                const available = copy.status === 'Available';
+                return '<div style="display: flex; justify-content: space-between; align-items: center; padding: 6px; margin-bottom: 4px; background: var(--app-container); border-radius: 4px; border-left: 2px solid ' + (available ? 'var(--success)' : 'var(--danger)') + ';">' +
+                    '<div style="flex: 1;">' +
+                    '<div style="font-size: 0.7rem; font-weight: 500; color: var(--main-color);">' + escapeHtml(copy.accessionNumber) + '</div>' +
+                    '<div style="font-size: 0.65rem; color: var(--secondary-color);">' + escapeHtml(copy.Location) + '</div>' +
+                    '</div>' +
+                    '<span style="padding: 2px 6px; border-radius: 4px; font-size: 0.65rem; ' + (available ? 'background: var(--success-bg); color: var(--success);' : 'background: var(--danger-bg); color: var(--danger);') + '">' + escapeHtml(copy.status) + '</span>' +
+                    '</div>';
+            }).join('') || '<p style="font-size: 0.7rem; color: var(--secondary-color); padding: 8px;">No copies available</p>';
+            return '<div class="book-item" data-title="' + escapeHtml((book.Title || '').toLowerCase()) + '" data-author="' + escapeHtml((book.mainAuthor || '').toLowerCase()) + '" data-callnumber="' + escapeHtml((book.callNumber || '').toLowerCase()) + '" style="padding: 12px; margin-bottom: 10px; background: var(--message-box-hover); border-radius: 8px; border-left: 4px solid ' + (book.available_copies > 0 ? 'var(--success)' : 'var(--danger)') + '; position: relative;">' +
+                '<div style="font-weight: 600; font-size: 0.9rem; color: var(--main-color); margin-bottom: 6px;">' + escapeHtml(book.Title) + '</div>' +
+                '<div style="font-size: 0.75rem; color: var(--secondary-color); margin-bottom: 6px;">' + escapeHtml(book.mainAuthor) + '</div>' +
+                '<div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px; padding: 6px; background: var(--app-container); border-radius: 6px;">' +
+                '<span style="font-size: 0.75rem; color: var(--main-color); font-weight: 500;">' + book.available_copies + ' available / ' + book.total_copies + ' copies</span>' +
+                '<span style="font-size: 0.7rem; color: var(--secondary-color);">' + escapeHtml(book.callNumber) + '</span>' +
+                '</div>' +
+                '<details style="margin-top: 8px;">' +
+                '<summary style="cursor: pointer; font-size: 0.75rem; font-weight: 500; color: var(--main-color); padding: 4px; border-radius: 4px; background: var(--app-container);">View All Copies (' + book.total_copies + ')</summary>' +
+                '<div style="margin-top: 8px; padding-left: 8px;">' + copies + '</div>' +
+                '</details>' +
+                '</div>';
+        }).join('');
+    }
+
+    function renderSidebarStudents(data) {
+        const list = document.getElementById('usersList');
+        if (!list) return;
+        const byGrade = data.students_by_grade || {};
+        list.innerHTML = Object.keys(byGrade).map(grade => {
+            const users = byGrade[grade];
+            const items = users.map(user =>
+                '<div class="user-item" data-name="' + escapeHtml(user.name.toLowerCase()) + '" data-schoolid="' + escapeHtml(user.school_id.toLowerCase()) + '" data-grade="grade ' + grade + '" data-batch="' + escapeHtml(user.batch.toLowerCase()) + '" data-section="' + escapeHtml(user.section.toLowerCase()) + '" style="padding: 10px; margin-bottom: 6px; background: var(--app-container); border-radius: 6px; border-left: 3px solid var(--accent); position: relative;">' +
+                '<div style="font-weight: 600; font-size: 0.8rem; color: var(--main-color); margin-bottom: 3px; overflow: hidden; text-overflow: ellipsis; white-space: nowrap;">' + escapeHtml(user.name) + '</div>' +
+                '<div style="font-size: 0.7rem; color: var(--secondary-color); margin-bottom: 2px;">' + escapeHtml(user.school_id) + '</div>' +
+                '<div style="font-size: 0.65rem; color: var(--secondary-color);">' + escapeHtml(user.batch) + (user.section ? ' | ' + escapeHtml(user.section) : '') + '</div>' +
+                '</div>'
+            ).join('') || '<p style="text-align: center; color: var(--secondary-color); padding: 12px; font-size: 0.75rem;">No students in this grade</p>';
+            return '<details class="grade-section"' + (grade === '7' ? ' open' : '') + ' style="margin-bottom: 8px; border-radius: 8px; overflow: hidden; background: var(--message-box-hover);">' +
+                '<summary style="cursor: pointer; padding: 10px 12px; color: var(--accent-contrast); font-weight: 600; font-size: 0.85rem; display: flex; justify-content: space-between; align-items: center; user-select: none; transition: all 0.3s ease;">' +
+                '<span>Grade ' + grade + '</span>' +
+                '<span style="background: var(--accent-soft); color: var(--accent); padding: 2px 8px; border-radius: 12px; font-size: 0.75rem;">' + users.length + '</span>' +
+                '</summary>' +
+                '<div style="padding: 8px;">' + items + '</div>' +
+                '</details>';
+        }).join('');
+    }
+
+    panelRenderers.books = renderSidebarBooks;
+    panelRenderers.students = renderSidebarStudents;
+
+    window.loadSidebarPanel = function(name) {
+        if (sidebarLoaded[name] || !config.panelUrl) return;
+        sidebarLoaded[name] = true;
+        loadPanel(name);
+    };
+
+    const heatmapRangeSelect = document.getElementById('heatmap-range-select');
+    if (heatmapRangeSelect) {
+        heatmapRangeSelect.addEventListener('change', function() {
+            heatmapState.range = this.value;
+            heatmapState.offset = 0;
+            reloadHeatmap();
+        });
+    }
+    const heatmapPrev = document.getElementById('heatmapPrev');
+    if (heatmapPrev) {
+        heatmapPrev.addEventListener('click', function() {
+            heatmapState.offset += 1;
+            reloadHeatmap();
+        });
+    }
+    const heatmapNext = document.getElementById('heatmapNext');
+    if (heatmapNext) {
+        heatmapNext.addEventListener('click', function() {
+            if (heatmapState.offset === 0) return;
+            heatmapState.offset -= 1;
+            reloadHeatmap();
         });
     }
 
@@ -421,18 +827,6 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    /* ==========================================
-       HEATMAP RANGE SELECT AUTO-SUBMIT
-       Submits form when user changes heatmap time range
-       ========================================== */
-    const heatmapRangeSelect = document.getElementById('heatmap-range-select');
-    if (heatmapRangeSelect) {
-        heatmapRangeSelect.addEventListener('change', function() {
-            // Automatically submit the form to refresh heatmap
-            this.form.submit();
-        });
-    }
-
     /* ==========================================
        CHART CARD ENTRANCE ANIMATIONS
        Staggered fade-in animation for chart containers
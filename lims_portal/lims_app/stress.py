@@ -0,0 +1,152 @@
+"""
+Concurrent checkout/return stress run for `python manage.py stress_circulation`.
+
+Several threads, each with its own database connection, hammer the same
+few copies with random checkouts (single and in stacks of two) and returns
+through circulation.py, so
+most operations race another desk for the same row. Losing a race is
+expected (the conditional UPDATE matches no row and the usual
+CirculationError is raised); anything else, such as "database is locked",
+is counted as an error. Afterwards check_consistency() compares what the
+threads report with the database: one loan per successful checkout, one
+closed loan per successful return, no copy with two open loans, and copy
+statuses and Book counters that agree with the loans. The threads share a
+couple of borrowers, so one student racing themselves at two desks is
+covered as well as different students racing for a copy.
+
+Writers need a file-backed SQLite database in WAL mode (see settings.py);
+the in-memory test database cannot take concurrent writes.
+"""
+import random
+import threading
+import time
+
+from django.db import OperationalError, connection
+from django.db.models import Count, Q
+
+from . import circulation
+from .models import Book, BookCopy, BorrowHistory, students
+
+
+def _worker(number, accession_numbers, student_id, operations, seed, barrier, tally):
+    rng = random.Random(seed * 1000 + number)
+    counts = {'checkouts': 0, 'returns': 0, 'conflicts': 0, 'errors': []}
+    try:
+        barrier.wait()
+        for _ in range(operations):
+            accession_number = rng.choice(accession_numbers)
+            action = rng.random()
+            try:
+                if action < 0.4:
+                    circulation.checkout(accession_number, student_id)
+                    counts['checkouts'] += 1
+                elif action < 0.6:
+                    # a stack of two, so some batches are only partly won
+                    stack = rng.sample(accession_numbers, min(2, len(accession_numbers)))
+                    results = circulation.checkout_many(student_id, stack)
+                    counts['checkouts'] += sum(result['ok'] for result in results)
+                    counts['conflicts'] += sum(not result['ok'] for result in results)
+                else:
+                    circulation.return_by_accession(accession_number)
+                    counts['returns'] += 1
+            except circulation.CirculationError:
+                counts['conflicts'] += 1
+            except OperationalError as e:
+                counts['errors'].append(str(e))
+    finally:
+        # Worker threads open their own connection; don't leak it
+        connection.close()
+        tally[number] = counts
+
+
+def check_consistency(accession_numbers):
+    """Ways the loans, copy statuses and Book counters of these copies disagree."""
+    problems = []
+    copies = BookCopy.objects.filter(accessionNumber__in=accession_numbers).annotate(
+        open_loans=Count('borrow_history', filter=Q(borrow_history__returned=False)),
+    )
+    book_ids = set()
+    for copy in copies:
+        book_ids.add(copy.book_id)
+        if copy.open_loans > 1:
+            problems.append(f'{copy.accessionNumber} has {copy.open_loans} open loans')
+        expected = 'Borrowed' if copy.open_loans else 'Available'
+        if copy.status != expected:
+            problems.append(f'{copy.accessionNumber} is {copy.status} with {copy.open_loans} open loans')
+    stored = {
+        book.id: (book.total_copies, book.available_copies, book.borrowed_copies)
+        for book in Book.objects.filter(pk__in=book_ids)
+    }
+    actual = {
+        row['book']: (row['total'], row['available'], row['borrowed'])
+        for row in BookCopy.objects.filter(book_id__in=book_ids).values('book').annotate(
+            total=Count('id'),
+            available=Count('id', filter=Q(status='Available')),
+            borrowed=Count('id', filter=Q(status='Borrowed')),
+        )
+    }
+    for book_id, counts in stored.items():
+        if counts != actual.get(book_id):
+            problems.append(f'Book {book_id} counters {counts} != copies {actual.get(book_id)}')
+    return problems
+
+
+def run(threads=8, operations=200, copies=4, borrowers=2, seed=0):
+    """Run `threads` workers doing `operations` random checkouts/returns each
+    on the first `copies` available copies, as the first `borrowers`
+    students (shared round-robin); returns a report dict.
+
+    The copies are returned afterwards, so the run leaves them as it found
+    them apart from the loan history it adds.
+    """
+    accession_numbers = list(
+        BookCopy.objects.filter(status='Available').order_by('id').values_list('accessionNumber', flat=True)[:copies]
+    )
+    student_ids = list(students.objects.order_by('id').values_list('school_id', flat=True)[:max(borrowers, 1)])
+    if not accession_numbers or not student_ids:
+        raise ValueError('The stress run needs at least one available copy and one student')
+    loans_before = BorrowHistory.objects.filter(book_copy__accessionNumber__in=accession_numbers).count()
+
+    barrier = threading.Barrier(threads)
+    tally = {}
+    workers = [
+        threading.Thread(
+            target=_worker,
+            args=(number, accession_numbers, student_ids[number % len(student_ids)], operations, seed, barrier, tally),
+            name=f'stress-{number}',
+        )
+        for number in range(threads)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    seconds = time.perf_counter() - start
+
+    checkouts = sum(counts['checkouts'] for counts in tally.values())
+    returns = sum(counts['returns'] for counts in tally.values())
+    errors = [error for counts in tally.values() for error in counts['errors']]
+    loans = BorrowHistory.objects.filter(book_copy__accessionNumber__in=accession_numbers)
+    problems = check_consistency(accession_numbers)
+    if loans.count() - loans_before != checkouts:
+        problems.append(f'{loans.count() - loans_before} loans created for {checkouts} checkouts')
+    if checkouts - returns != loans.filter(returned=False).count():
+        problems.append(f'{checkouts - returns} loans should be open, found {loans.filter(returned=False).count()}')
+    circulation.return_many(accession_numbers)
+
+    total = threads * operations
+    return {
+        'threads': threads,
+        'copies': len(accession_numbers),
+        'borrowers': len(student_ids),
+        'operations': total,
+        'checkouts': checkouts,
+        'returns': returns,
+        'conflicts': sum(counts['conflicts'] for counts in tally.values()),
+        'errors': errors,
+        'problems': problems,
+        'seconds': round(seconds, 3),
+        'ops_per_second': round(total / seconds, 1) if seconds else None,
+        'writes_per_second': round((checkouts + returns) / seconds, 1) if seconds else None,
+    }
@@ -1,3 +1,1292 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# lol, gotta write tests here... maybe later
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import benchmarking, catalog, circulation, profiling, rollups, sample_data, schema, search, stress
+from .analytics import ANALYTICS_PANELS, borrow_duration_stats, compute_panels, get_panel
+from .catalog import get_catalog_version, get_facet_values
+from .models import AnalyticsSnapshot, Book, BookCopy, BorrowHistory, DailyCirculationStats, students
+
+
+def make_books(count, copies_per_book=3, start=0):
+    for i in range(start, start + count):
+        book = Book.objects.create(
+            Title=f'Sample Book {i}',
+            mainAuthor=f'Author {i}',
+            callNumber=f'QA{i:05d}',
+            Language='English',
+        )
+        for j in range(copies_per_book):
+            BookCopy.objects.create(
+                book=book,
+                accessionNumber=f'ACC{i:05d}-{j}',
+                Location='Shelf A',
+                status='Borrowed' if j == 0 else 'Available',
+            )
+
+
+class CatalogQueryCountTests(TestCase):
+    """The catalog views must cost the same number of queries at any catalog size."""
+
+    def setUp(self):
+        self.staff = User.objects.create_superuser('librarian', 'lib@example.com', 'pw')
+        self.client.force_login(self.staff)
+
+    def count_queries(self, url, **headers):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def assert_flat(self, url, **headers):
+        # catalog/circulation versions are bumped on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            make_books(3)
+        small = self.count_queries(url, **headers)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_books(30, start=3)
+        large = self.count_queries(url, **headers)
+        self.assertEqual(small, large, f'{url} query count grew from {small} to {large}')
+
+    def test_records_json_is_constant_query(self):
+        self.assert_flat('/records/', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_records_page_is_constant_query(self):
+        self.assert_flat('/records/data/?draw=1&start=0&length=25')
+
+    def test_admin_dashboard_is_constant_query(self):
+        self.assert_flat('/library-admin/')
+
+    def test_analytics_is_constant_query(self):
+        self.assert_flat('/library-admin/analytics/')
+
+    def test_serialized_counts(self):
+        make_books(2)
+        response = self.client.get('/records/', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        book = response.json()['books'][0]
+        self.assertEqual(book['total_copies'], 3)
+        self.assertEqual(book['available_copies'], 2)
+        self.assertEqual(book['borrowed_copies'], 1)
+        self.assertEqual(len(book['copies']), 3)
+
+
+class RecordsDataTests(TestCase):
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_books(12)
+            BookCopy.objects.filter(accessionNumber='ACC00004-1').update(Location='Shelf B')
+        Book.objects.filter(callNumber='QA00002').update(Language='Filipino')
+
+    def get(self, query):
+        response = self.client.get(f'/records/data/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_page_shape(self):
+        data = self.get('draw=3&start=0&length=5')
+        self.assertEqual((data['draw'], data['recordsTotal'], data['recordsFiltered']), (3, 12, 12))
+        self.assertEqual([row['Title'] for row in data['data']], [f'Sample Book {i}' for i in range(11, 6, -1)])
+        row = data['data'][0]
+        self.assertEqual((row['total_copies'], row['available_copies'], row['borrowed_copies']), (3, 2, 1))
+        self.assertEqual(
+            [copy['accessionNumber'] for copy in row['copies']], ['ACC00011-0', 'ACC00011-1', 'ACC00011-2'],
+        )
+        self.assertEqual(set(row['copies'][0]), {
+            'accessionNumber', 'Location', 'status', 'borrowed_by', 'student_id', 'borrow_date', 'return_date',
+        })
+
+    def test_pages_and_ordering(self):
+        second = self.get('start=5&length=5&order[0][column]=0&order[0][dir]=asc')
+        titles = sorted(f'Sample Book {i}' for i in range(12))
+        self.assertEqual([row['Title'] for row in second['data']], titles[5:10])
+        last = self.get('start=10&length=5&order[0][column]=0&order[0][dir]=asc')
+        self.assertEqual([row['Title'] for row in last['data']], titles[10:])
+
+    def test_out_of_range_and_invalid_paging(self):
+        past_end = self.get('draw=2&start=50&length=10')
+        self.assertEqual((past_end['recordsFiltered'], past_end['data']), (12, []))
+        # bad numbers fall back to the defaults; length is capped at RECORDS_PAGE_MAX
+        invalid = self.get('draw=x&start=abc&length=ten')
+        self.assertEqual((invalid['draw'], len(invalid['data'])), (0, 10))
+        self.assertEqual(invalid['data'][0]['Title'], 'Sample Book 11')
+        self.assertEqual(self.get('start=-5&length=2')['data'][0]['Title'], 'Sample Book 11')
+        self.assertEqual(len(self.get('length=0')['data']), 12)
+        self.assertEqual(len(self.get('length=100000')['data']), 12)
+
+    def test_filters(self):
+        language = self.get('language=Filipino')
+        self.assertEqual((language['recordsTotal'], language['recordsFiltered']), (12, 1))
+        self.assertEqual(language['data'][0]['callNumber'], 'QA00002')
+
+        # a location filter narrows both the books and their copies and counts
+        location = self.get('location=Shelf B')
+        self.assertEqual(location['recordsFiltered'], 1)
+        [row] = location['data']
+        self.assertEqual([copy['accessionNumber'] for copy in row['copies']], ['ACC00004-1'])
+        self.assertEqual((row['total_copies'], row['available_copies']), (1, 1))
+
+        searched = self.get('search[value]=Author 7')
+        self.assertEqual(searched['recordsFiltered'], 1)
+        self.assertEqual(searched['data'][0]['Title'], 'Sample Book 7')
+        self.assertEqual(self.get('language=Filipino&search[value]=Author 7')['data'], [])
+
+
+class SearchIndexTests(TransactionTestCase):
+    """The FTS5 index, written after each commit (so not inside a TestCase transaction)."""
+
+    def setUp(self):
+        cache.clear()
+        if not search.search_enabled():
+            self.skipTest('SQLite was built without FTS5')
+        search.rebuild_search_index()  # drop rows left by earlier tests
+        self.physics = Book.objects.create(Title='Introductory Physics', mainAuthor='Ada Lovelace',
+                                           callNumber='QC21', Publisher='Science House')
+        self.garden = Book.objects.create(Title='Garden Notes', mainAuthor='Ben Reyes',
+                                          callNumber='SB45', Publisher='Physics Garden Press')
+        BookCopy.objects.create(book=self.physics, accessionNumber='PHY-001', Location='Shelf A')
+        BookCopy.objects.create(book=self.garden, accessionNumber='GRD-001', Location='Shelf B')
+
+    def titles(self, text):
+        return [row['Title'] for row in self.client.get('/records/data/', {'search': text}).json()['data']]
+
+    def test_prefix_match_query(self):
+        self.assertEqual(search.build_match_query('intro  phys'), '"intro"* "phys"*')
+        self.assertEqual(self.titles('intro phys'), ['Introductory Physics'])
+        self.assertEqual(self.titles('lovel'), ['Introductory Physics'])
+        self.assertEqual(self.titles('qc2'), ['Introductory Physics'])
+
+    def test_bm25_puts_title_matches_first(self):
+        # the garden book is newer, but "physics" is only in its publisher
+        self.assertEqual(self.titles('physics'), ['Introductory Physics', 'Garden Notes'])
+        ranked = Book.objects.filter(id__in=search.matching_book_ids('physics')).annotate(
+            rank=search.search_rank('physics'),
+        ).order_by('rank')
+        self.assertEqual([book.Title for book in ranked], ['Introductory Physics', 'Garden Notes'])
+
+    def test_saves_and_deletes_reindex_after_commit(self):
+        self.physics.Title = 'Advanced Mechanics'
+        self.physics.save()
+        self.assertEqual(self.titles('mechanics'), ['Advanced Mechanics'])
+        self.assertEqual(self.titles('introductory'), [])
+
+        copy = BookCopy.objects.create(book=self.garden, accessionNumber='ZX-9931', Location='Annex')
+        self.assertEqual(self.titles('ZX-9931'), ['Garden Notes'])
+        self.assertEqual(self.titles('annex'), ['Garden Notes'])
+        copy.delete()
+        self.assertEqual(self.titles('ZX-9931'), [])
+
+        self.garden.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid FROM {search.FTS_TABLE}')
+            self.assertEqual([row[0] for row in cursor.fetchall()], [self.physics.id])
+
+    def test_borrower_is_searchable_while_the_copy_is_out(self):
+        students.objects.create(name='Student Q', school_id='ZQ-4411', email='q@example.com', grade_Level=8)
+        circulation.checkout('GRD-001', 'ZQ-4411')
+        self.assertEqual(self.titles('ZQ-4411'), ['Garden Notes'])
+        circulation.return_by_accession('GRD-001')
+        self.assertEqual(self.titles('ZQ-4411'), [])
+
+    def test_hostile_input_is_quoted(self):
+        self.assertEqual(search.build_match_query('a" OR b*'), '"a"* "OR"* "b"*')
+        self.assertEqual(search.build_match_query('" * ( ) :'), '')
+        Book.objects.create(Title='Near Earth Objects And Comets', mainAuthor='C. Sagan', callNumber='QB500')
+        for text in ('"', '*', 'AND', 'NEAR', 'NEAR(physics garden)', 'physics AND', 'title:garden', 'NOT physics'):
+            response = self.client.get('/records/data/', {'search': text})
+            self.assertEqual(response.status_code, 200, text)
+        # operators are searched as plain words
+        self.assertEqual(self.titles('near and'), ['Near Earth Objects And Comets'])
+        # "NOT" is the prefix "not"* (matching Notes), not a negation of physics
+        self.assertEqual(self.titles('NOT physics'), ['Garden Notes'])
+
+    def test_rebuild_search_index_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.FTS_TABLE}')
+        self.assertEqual(self.titles('physics'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 2 books.', out.getvalue())
+        self.assertEqual(self.titles('physics'), ['Introductory Physics', 'Garden Notes'])
+
+
+class FacetCacheTests(TestCase):
+
+    def test_facets_cached_until_catalog_changes(self):
+        make_books(2)
+        first = get_facet_values()
+        self.assertEqual(first['locations'], ['Shelf A'])
+        with self.assertNumQueries(0):
+            get_facet_values()
+
+        book = Book.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            BookCopy.objects.create(book=book, accessionNumber='NEW-1', Location='Shelf B')
+        self.assertEqual(get_facet_values()['locations'], ['Shelf A', 'Shelf B'])
+
+    def test_status_changes_keep_facets_but_change_etag(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_books(2)
+        get_facet_values()
+        etag = self.client.get('/records/data/?draw=1')['ETag']
+        copy = BookCopy.objects.get(accessionNumber='ACC00000-1')
+        copy.status = 'Borrowed'
+        with self.captureOnCommitCallbacks(execute=True):
+            copy.save()
+        with self.assertNumQueries(0):
+            get_facet_values()
+        self.assertEqual(self.client.get('/records/data/?draw=1', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        copy.Location = 'Shelf B'
+        with self.captureOnCommitCallbacks(execute=True):
+            copy.save()
+        self.assertEqual(get_facet_values()['locations'], ['Shelf A', 'Shelf B'])
+
+    def test_versions_bump_only_after_commit(self):
+        make_books(1)
+        before = get_catalog_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            Book.objects.first().save()
+            # a reader in another connection still sees the old rows
+            self.assertEqual(get_catalog_version(), before)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(get_catalog_version(), before)
+
+
+class FacetCountTests(TestCase):
+
+    def test_counts_follow_other_filters_but_not_their_own(self):
+        make_books(3)
+        Book.objects.filter(callNumber='QA00000').update(Language='Filipino')
+
+        response = self.client.get('/records/facets/?language=English&main_author=Author 1')
+        facets = {facet['key']: facet for facet in response.json()['facets']}
+
+        # the language facet ignores the language filter but honours the author filter
+        self.assertEqual(
+            [(v['value'], v['count'], v['selected']) for v in facets['language']['values']],
+            [('English', 1, True)],
+        )
+        self.assertEqual(facets['location']['values'], [{'value': 'Shelf A', 'count': 1, 'selected': False}])
+
+    def test_counts_cached_until_catalog_changes(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            make_books(3)
+        url = '/records/facets/?language=English'
+        first = self.client.get(url).json()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(url).json(), first)
+        self.assertFalse(any('GROUP BY' in q['sql'] for q in ctx.captured_queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(Title='Another', mainAuthor='Author 1', callNumber='QX1', Language='English')
+        facets = {facet['key']: facet for facet in self.client.get(url).json()['facets']}
+        self.assertEqual(facets['language']['values'], [{'value': 'English', 'count': 4, 'selected': True}])
+
+
+class CatalogConditionalGetTests(TestCase):
+
+    def test_unchanged_catalog_answers_304_without_queries(self):
+        make_books(2)
+        first = self.client.get('/records/data/?draw=1')
+        etag = first['ETag']
+        self.assertTrue(first.has_header('Last-Modified'))
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/records/data/?draw=1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+
+        BookCopy.objects.filter(accessionNumber='ACC00000-1').update(status='Lost')
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.first().save()
+        changed = self.client.get('/records/data/?draw=1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+
+    def test_suggestions_are_not_pinned_to_the_catalog_etag(self):
+        make_books(2)
+        first = self.client.get('/records/suggest/?q=sample')
+        self.assertFalse(first.has_header('ETag'))
+        self.assertIn('no-store', first['Cache-Control'])
+        Book.objects.create(Title='Sampler Guide', mainAuthor='New Author', callNumber='QB1')
+        # within SUGGEST_INDEX_MIN_AGE the index may still be the old one; the
+        # response must not be revalidated as current under the new version
+        again = self.client.get('/records/suggest/?q=sample', HTTP_IF_NONE_MATCH=f'"catalog-{get_catalog_version()}-page"')
+        self.assertEqual(again.status_code, 200)
+
+    def test_page_and_json_have_different_etags(self):
+        page = self.client.get('/records/')
+        data = self.client.get('/records/', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertNotEqual(page['ETag'], data['ETag'])
+
+
+class SuggestionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        # the index is per process; start each test from a fresh one
+        catalog._suggest_state.update(index=None, version=None, built_at=0.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.physics = Book.objects.create(
+                Title='A Very Long Introduction to Modern Physics for Curious Readers of All Ages',
+                mainAuthor='Ada Lovelace', callNumber='QC21',
+            )
+            self.garden = Book.objects.create(Title='Garden Notes', mainAuthor='Ben Reyes', callNumber='SB45')
+            BookCopy.objects.create(book=self.garden, accessionNumber='GRD-001', Location='Shelf B')
+
+    def suggest(self, **params):
+        response = self.client.get('/records/suggest/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_echoes_seq_and_reports_the_matched_field(self):
+        data = self.suggest(q='lovel', seq='17')
+        self.assertEqual((data['seq'], data['query']), ('17', 'lovel'))
+        [hit] = data['suggestions']
+        self.assertEqual((hit['id'], hit['field'], hit['snippet']), (self.physics.id, 'Author', 'Ada Lovelace'))
+        self.assertEqual((hit['available_copies'], hit['total_copies']), (0, 0))
+
+        [hit] = self.suggest(q='grd-0')['suggestions']
+        self.assertEqual((hit['Title'], hit['field'], hit['snippet']), ('Garden Notes', 'Accession', 'GRD-001'))
+        self.assertEqual((hit['available_copies'], hit['total_copies']), (1, 1))
+
+    def test_matches_title_words_and_trims_the_snippet(self):
+        [hit] = self.suggest(q='modern phys')['suggestions']
+        self.assertEqual(hit['field'], 'Title')
+        self.assertIn('Modern Physics', hit['snippet'])
+        self.assertTrue(hit['snippet'].startswith('…') and hit['snippet'].endswith('…'))
+        self.assertLess(len(hit['snippet']), len(self.physics.Title))
+        # only word starts: "hysics" is inside a word, "qc" only matches a call number start
+        self.assertEqual(self.suggest(q='hysics')['suggestions'], [])
+        self.assertEqual(self.suggest(q='c21')['suggestions'], [])
+        self.assertEqual(self.suggest(q='qc2')['suggestions'][0]['field'], 'Call Number')
+
+    def test_limit_and_minimum_length(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_books(25, copies_per_book=1)
+        catalog._suggest_state.update(index=None)
+        self.assertEqual(len(self.suggest(q='sample')['suggestions']), 8)
+        self.assertEqual(len(self.suggest(q='sample', limit=0)['suggestions']), 1)
+        self.assertEqual(len(self.suggest(q='sample', limit=3)['suggestions']), 3)
+        self.assertEqual(len(self.suggest(q='sample', limit=500)['suggestions']), 20)
+        self.assertEqual(len(self.suggest(q='sample', limit='many')['suggestions']), 8)
+        for query in ('s', ' s ', '', '  '):
+            self.assertEqual(self.suggest(q=query)['suggestions'], [])
+
+    def test_deleted_and_renamed_books_leave_after_rebuild(self):
+        self.assertEqual(len(self.suggest(q='garden')['suggestions']), 1)
+        self.assertEqual(len(self.suggest(q='lovel')['suggestions']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.garden.delete()
+            self.physics.Title = 'Quantum Mechanics'
+            self.physics.save()
+
+        # within SUGGEST_INDEX_MIN_AGE the old index is kept, but deleted books are dropped
+        self.assertEqual(self.suggest(q='garden')['suggestions'], [])
+        self.assertEqual(self.suggest(q='quantum')['suggestions'], [])
+        with mock.patch.object(catalog, 'SUGGEST_INDEX_MIN_AGE', 0):
+            [hit] = self.suggest(q='quantum')['suggestions']
+            self.assertEqual(hit['Title'], 'Quantum Mechanics')
+            self.assertEqual(self.suggest(q='modern')['suggestions'], [])
+
+
+class CopyCounterTests(TestCase):
+
+    def counters(self, book):
+        book.refresh_from_db()
+        return (book.total_copies, book.available_copies, book.borrowed_copies)
+
+    def test_counters_follow_copy_writes(self):
+        make_books(1)
+        book = Book.objects.get()
+        self.assertEqual(self.counters(book), (3, 2, 1))
+
+        copy = BookCopy.objects.get(accessionNumber='ACC00000-1')
+        copy.status = 'Borrowed'
+        copy.save()
+        self.assertEqual(self.counters(book), (3, 1, 2))
+
+        copy.status = 'Lost'
+        copy.save()
+        self.assertEqual(self.counters(book), (3, 1, 1))
+
+        BookCopy.objects.filter(accessionNumber='ACC00000-0').delete()
+        self.assertEqual(self.counters(book), (2, 1, 0))
+
+    def test_recount_copies_repairs_drift(self):
+        make_books(2)
+        Book.objects.update(total_copies=0, available_copies=7)
+        call_command('recount_copies', stdout=StringIO())
+        self.assertEqual(
+            list(Book.objects.values_list('total_copies', 'available_copies', 'borrowed_copies')),
+            [(3, 2, 1), (3, 2, 1)],
+        )
+
+
+def make_borrow(copy, student, borrow_date, returned=False, return_date=None):
+    borrow = BorrowHistory(
+        book_copy=copy,
+        accountID=student.school_id,
+        accountName=student.name,
+        bookTitle=copy.book.Title,
+        borrow_date=borrow_date,
+        return_date=return_date,
+        returned=returned,
+    )
+    borrow.save(skip_validation=True)
+    return borrow
+
+
+class AnalyticsTimeSeriesTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_superuser('librarian', 'lib@example.com', 'pw')
+        self.client.force_login(self.staff)
+        make_books(1)
+        self.student = students.objects.create(name='Student One', school_id='S-1', email='s1@example.com')
+        self.copy = BookCopy.objects.get(accessionNumber='ACC00000-1')
+
+    def panel(self, name, **params):
+        response = self.client.get(f'/library-admin/analytics/panel/{name}/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_heatmap_range_does_not_change_query_count(self):
+        counts = {}
+        for heatmap_range in ('week', 'month', 'year'):
+            with CaptureQueriesContext(connection) as ctx:
+                self.panel('heatmap', heatmap_range=heatmap_range)
+            counts[heatmap_range] = len(ctx.captured_queries)
+        self.assertEqual(counts['week'], counts['year'])
+        self.assertEqual(counts['month'], counts['year'])
+
+    def test_series_are_zero_filled(self):
+        borrowed_at = timezone.now() - timedelta(days=1)
+        make_borrow(self.copy, self.student, borrowed_at)
+        make_borrow(self.copy, self.student, borrowed_at, returned=True, return_date=borrowed_at)
+
+        metrics = self.panel('trends')
+        self.assertEqual(len(metrics['weeklyData']), 7)
+        self.assertEqual(sum(metrics['weeklyData']), 2)
+        self.assertEqual(len(metrics['monthlyData']), 7)
+        self.assertEqual(metrics['monthlyData'][-1] + metrics['monthlyData'][-2], 2)
+
+        year = self.panel('heatmap', heatmap_range='year', heatmap_offset=0)['heatmapData']
+        by_date = {entry['date']: entry['count'] for entry in year}
+        self.assertGreaterEqual(len(year), 365)
+        self.assertEqual(by_date.get(timezone.localtime(borrowed_at).strftime('%Y-%m-%d')), 2)
+
+    def test_grade_gender_and_batch_activity(self):
+        students.objects.create(name='Student Two', school_id='S-2', email='s2@example.com',
+                                gender='Female', grade_Level=8)
+        students.objects.create(name='Student Three', school_id='S-3', email='s3@example.com',
+                                gender='Male', grade_Level=8)
+        make_borrow(self.copy, self.student, timezone.now())
+        make_borrow(self.copy, students.objects.get(school_id='S-2'), timezone.now())
+        make_borrow(self.copy, students.objects.get(school_id='S-2'), timezone.now())
+
+        context = self.panel('demographics')
+        grade_8 = context['batch_gender_stats']['Grade 8']
+        self.assertEqual((grade_8['Male'], grade_8['Female'], grade_8['Other'], grade_8['total']), (1, 1, 0, 2))
+        self.assertEqual(grade_8['proportions'], {'Male': 50.0, 'Female': 50.0, 'Other': 0})
+        self.assertEqual(context['overall_gender_proportions']['Other'], 33.3)
+
+        activity = {row['batch']: row['borrows'] for row in context['sorted_batch_activity']}
+        self.assertEqual(activity['Grade 8'], 2)
+        self.assertEqual(activity['Grade 7'], 1)
+        self.assertEqual(activity['Grade 12'], 0)
+        self.assertEqual(context['sorted_batch_activity'][0]['batch'], 'Grade 8')
+
+
+class BorrowDurationStatsTests(TestCase):
+
+    def test_duration_stats_match_python(self):
+        make_books(1)
+        student = students.objects.create(name='Student One', school_id='S-1', email='s1@example.com')
+        copy = BookCopy.objects.get(accessionNumber='ACC00000-1')
+        start = timezone.now() - timedelta(days=60)
+        durations = [timedelta(hours=5), timedelta(days=1), timedelta(days=1, hours=23),
+                     timedelta(days=3), timedelta(days=10), timedelta(days=40)]
+        for duration in durations:
+            make_borrow(copy, student, start, returned=True, return_date=start + duration)
+        make_borrow(copy, student, start)  # still out, not counted
+
+        with self.assertNumQueries(1):
+            stats = borrow_duration_stats()
+
+        days = sorted(d.days for d in durations)
+        self.assertEqual(stats['count'], 6)
+        self.assertAlmostEqual(stats['avg_days'], sum(days) / len(days))
+        self.assertEqual(stats['median_days'], 1)
+        self.assertEqual(stats['p90_days'], 40)
+        histogram = {bucket['label']: bucket['count'] for bucket in stats['histogram']}
+        self.assertEqual(histogram['Same day'], 1)
+        self.assertEqual(histogram['1 day'], 2)
+        self.assertEqual(histogram['8-14 days'], 1)
+        self.assertEqual(histogram['31+ days'], 1)
+
+
+class CirculationRollupTests(TestCase):
+
+    def setUp(self):
+        self.staff = User.objects.create_superuser('librarian', 'lib@example.com', 'pw')
+        self.client.force_login(self.staff)
+        make_books(2)
+        self.student = students.objects.create(name='Student One', school_id='S-1', email='s1@example.com',
+                                               grade_Level=9)
+
+    def rollup_rows(self):
+        return sorted(DailyCirculationStats.objects.exclude(
+            borrows=0, returns=0, overdue=0, new_students=0,
+        ).values_list('day', 'grade', 'book_type', 'location', 'borrows', 'returns', 'overdue', 'new_students'))
+
+    def test_checkout_and_return_update_rollup(self):
+        today = timezone.localdate()
+        self.client.post('/library-admin/', {'action': 'checkout', 'book_id': 'ACC00000-1', 'student_id': 'S-1'})
+        totals = rollups.period_totals(today, today)
+        self.assertEqual((totals['borrows'], totals['returns'], totals['new_students']), (1, 0, 1))
+
+        self.client.post('/library-admin/', {'action': 'return_barcode', 'accession_number': 'ACC00000-1'})
+        totals = rollups.period_totals(today, today)
+        self.assertEqual((totals['borrows'], totals['returns']), (1, 1))
+        self.assertEqual(
+            DailyCirculationStats.objects.get(day=today, borrows=1).grade, 9,
+        )
+
+    def test_backfill_matches_incremental(self):
+        copy = BookCopy.objects.get(accessionNumber='ACC00001-2')
+        long_ago = timezone.now() - timedelta(days=40)
+        late = make_borrow(copy, self.student, long_ago)
+        make_borrow(copy, self.student, long_ago, returned=True, return_date=long_ago + timedelta(hours=3))
+        make_borrow(copy, self.student, long_ago - timedelta(days=3))
+
+        late = BorrowHistory.objects.get(pk=late.pk)
+        late.returned = True
+        late.return_date = timezone.now()
+        late.save(skip_validation=True)
+
+        incremental = self.rollup_rows()
+        self.assertEqual(sum(row[6] for row in incremental), 1)  # the late return; the one still out is live
+        today = timezone.localdate()
+        self.assertEqual(rollups.open_overdue(today - timedelta(days=60), today), 1)
+
+        call_command('backfill_rollups', stdout=StringIO())
+        self.assertEqual(self.rollup_rows(), incremental)
+
+    def test_move_up_and_relocation_between_checkout_and_return(self):
+        self.client.post('/library-admin/', {'action': 'checkout', 'book_id': 'ACC00000-1', 'student_id': 'S-1'})
+        late = make_borrow(BookCopy.objects.get(accessionNumber='ACC00001-1'), self.student,
+                           timezone.now() - timedelta(days=10))
+        call_command('moveup_students', stdout=StringIO())
+        BookCopy.objects.filter(accessionNumber='ACC00000-1').update(Location='Shelf B')
+        Book.objects.filter(callNumber='QA00001').update(Type='Fiction')
+
+        self.client.post('/library-admin/', {'action': 'return_barcode', 'accession_number': 'ACC00000-1'})
+        late = BorrowHistory.objects.get(pk=late.pk)
+        late.returned = True
+        late.return_date = timezone.now()
+        late.save(skip_validation=True)
+        BorrowHistory.objects.get(pk=late.pk).delete()
+
+        incremental = self.rollup_rows()
+        self.assertTrue(all(count >= 0 for row in incremental for count in row[4:]))
+        # the loan's borrow and return stay under grade 9 at Shelf A; the student moved to grade 10
+        self.assertEqual({row[1:4] for row in incremental if row[4] or row[5]}, {(9, 'Other', 'Shelf A')})
+        self.assertEqual({row[1] for row in incremental if row[7]}, {10})
+        rollups.rebuild_rollups()
+        self.assertEqual(self.rollup_rows(), incremental)
+
+    def test_open_loan_due_tomorrow_is_not_overdue(self):
+        copy = BookCopy.objects.get(accessionNumber='ACC00001-2')
+        make_borrow(copy, self.student, timezone.now(), return_date=timezone.now() + timedelta(days=1))
+        today = timezone.localdate()
+        month_end = today + timedelta(days=40)
+
+        self.assertEqual(rollups.period_totals(today, month_end)['overdue'], 0)
+        self.assertEqual(rollups.open_overdue(today, month_end), 0)
+        self.assertEqual(get_panel('kpis', {}, refresh=True)['period_overdue'], 0)
+        # Two days on, the same loan is overdue without any write
+        later = timezone.now() + timedelta(days=2)
+        self.assertEqual(rollups.open_overdue(today, month_end, now=later), 1)
+
+
+class AnalyticsCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_superuser('librarian', 'lib@example.com', 'pw')
+        self.client.force_login(self.staff)
+        make_books(2)
+
+    def computed_at(self, url='/library-admin/analytics/'):
+        return self.client.get(url).context['computed_at']
+
+    def test_metrics_cached_until_circulation_changes(self):
+        first = self.client.get('/library-admin/analytics/export/?format=json').json()['computed_at']
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/library-admin/analytics/export/?format=json')
+        self.assertEqual(response.json()['computed_at'], first)
+        self.assertFalse(any('lims_app_borrowhistory' in q['sql'] for q in ctx.captured_queries))
+
+        page = self.computed_at()
+        self.assertEqual(self.computed_at(), page)
+        with self.captureOnCommitCallbacks(execute=True):
+            students.objects.create(name='Student One', school_id='S-1', email='s1@example.com')
+        self.assertGreater(self.computed_at(), page)
+
+    def test_parameters_and_refresh(self):
+        first = self.computed_at()
+        self.assertNotEqual(self.computed_at('/library-admin/analytics/?period=year'), first)
+        self.assertGreater(self.computed_at('/library-admin/analytics/?refresh=1'), first)
+
+
+class AnalyticsSnapshotTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        make_books(4, copies_per_book=2)
+        self.copies = list(BookCopy.objects.order_by('accessionNumber'))
+        self.students = [
+            students.objects.create(name=f'Student {i}', school_id=f'S-{i}', email=f's{i}@example.com')
+            for i in range(3)
+        ]
+        now = timezone.now()
+        for i, copy in enumerate(self.copies[:5]):
+            make_borrow(copy, self.students[i % 2], now - timedelta(days=20 - i),
+                        returned=True, return_date=now - timedelta(days=18 - 2 * i))
+
+    def panels(self):
+        cache.clear()
+        return {name: get_panel(name, {}) for name in ('kpis', 'leaders', 'heatmap')}
+
+    def test_snapshot_plus_delta_matches_full_recompute(self):
+        out = StringIO()
+        call_command('refresh_analytics', stdout=out)
+        self.assertIn('Stored analytics snapshot v1', out.getvalue())
+
+        # activity after the snapshot: a new loan and a return of an old one
+        now = timezone.now()
+        make_borrow(self.copies[6], self.students[2], now - timedelta(hours=5), returned=True, return_date=now)
+        make_borrow(self.copies[7], self.students[2], now)
+
+        served = self.panels()
+        self.assertEqual({served[name]['snapshot_version'] for name in served}, {1})
+        fresh = {name: get_panel(name, {}, refresh=True) for name in ('kpis', 'leaders', 'heatmap')}
+        for name in ('kpis', 'heatmap'):
+            for key in ('computed_at', 'snapshot_version'):
+                served[name].pop(key, None)
+                fresh[name].pop(key, None)
+            self.assertEqual(served[name], fresh[name])
+        counts = lambda rows: sorted(row['borrow_count'] for row in rows)
+        self.assertEqual(counts(served['leaders']['top_borrowers']), counts(fresh['leaders']['top_borrowers']))
+        self.assertEqual(counts(served['leaders']['most_borrowed']), counts(fresh['leaders']['most_borrowed']))
+
+    def test_old_versions_are_pruned(self):
+        for _ in range(4):
+            call_command('refresh_analytics', keep=2, stdout=StringIO())
+        self.assertEqual(sorted(set(AnalyticsSnapshot.objects.values_list('version', flat=True))), [3, 4])
+
+
+class AnalyticsPanelTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_superuser('librarian', 'lib@example.com', 'pw')
+        self.client.force_login(self.staff)
+        make_books(2)
+
+    def test_page_renders_without_lazy_panels(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/library-admin/analytics/')
+        self.assertContains(response, 'analyticsConfig')
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertNotIn('lims_app_students"."gender', sql)  # demographics panel
+        self.assertNotIn('"lims_app_bookcopy"."accessionNumber"', sql)  # sidebar books
+
+    def test_heatmap_navigation_only_recomputes_heatmap(self):
+        for name in ('trends', 'collection', 'leaders', 'demographics', 'activity', 'heatmap'):
+            self.assertEqual(self.client.get(f'/library-admin/analytics/panel/{name}/').status_code, 200)
+
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get('/library-admin/analytics/panel/heatmap/?heatmap_range=month&heatmap_offset=1').json()
+        self.assertEqual(data['heatmapOffset'], 1)
+        self.assertTrue(data['heatmapCanGoNext'])
+        # Besides the session/user and snapshot lookups, only the heatmap's rollup query runs
+        panel_queries = [q['sql'] for q in ctx.captured_queries if 'django_session' not in q['sql']
+                         and 'auth_user' not in q['sql'] and 'lims_app_analyticssnapshot' not in q['sql']]
+        self.assertEqual(len(panel_queries), 1)
+        self.assertIn('lims_app_dailycirculationstats', panel_queries[0])
+
+    def test_sidebar_and_unknown_panels(self):
+        books = self.client.get('/library-admin/analytics/panel/books/').json()['books']
+        self.assertEqual(len(books), 2)
+        grades = self.client.get('/library-admin/analytics/panel/students/').json()['students_by_grade']
+        self.assertEqual(sorted(grades), [str(grade) for grade in range(10, 13)] + [str(grade) for grade in range(7, 10)])
+        self.assertEqual(self.client.get('/library-admin/analytics/panel/nope/').status_code, 404)
+
+
+class DashboardPanelTests(TestCase):
+
+    def setUp(self):
+        self.staff = User.objects.create_superuser('librarian', 'lib@example.com', 'pw')
+        self.client.force_login(self.staff)
+        # the search index is written on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            make_books(30)
+        for i in range(12):
+            students.objects.create(
+                name=f'Student {i:02d}', school_id=f'S-{i:02d}', email=f's{i}@example.com',
+                grade_Level=7 + i % 6, section='Ruby' if i < 6 else 'Tesla',
+            )
+
+    def test_failed_book_edit_changes_nothing(self):
+        book = Book.objects.get(callNumber='QA00000')
+        second = BookCopy.objects.get(accessionNumber='ACC00000-1')
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post('/library-admin/', {
+                'action': 'edit_book', 'book_id': book.id, 'title': 'Renamed',
+                # the second copy id is malformed, so the edit fails after the first copy's update
+                'copy_id': [second.id, 'not-a-copy'], 'copy_status': ['Lost', 'Lost'],
+                'copy_location': ['Annex', 'Annex'],
+            })
+        self.assertContains(response, 'Error updating book')
+        self.assertEqual(callbacks, [])
+        self.assertEqual(get_catalog_version(), version)
+        book.refresh_from_db()
+        self.assertEqual((book.Title, book.available_copies), ('Sample Book 0', 2))
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.Location), ('Available', 'Shelf A'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/library-admin/', {
+                'action': 'edit_book', 'book_id': book.id, 'title': 'Renamed',
+                'copy_id': [second.id], 'copy_status': ['Lost'], 'copy_location': ['Annex'],
+            })
+        book.refresh_from_db()
+        self.assertEqual((book.Title, book.available_copies), ('Renamed', 1))
+        self.assertNotEqual(get_catalog_version(), version)
+
+    def test_dashboard_does_not_render_catalog_or_roster(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/library-admin/')
+        self.assertContains(response, 'data-url="/library-admin/panel/books/"')
+        self.assertNotContains(response, 'ACC00000-0')
+        self.assertNotContains(response, 'Student 00')
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertNotIn('"lims_app_bookcopy"."accessionNumber"', sql)
+        self.assertNotIn('"lims_app_students"."email"', sql)
+        self.assertLessEqual(len(ctx.captured_queries), 10)
+
+    def test_books_panel_pages_and_searches(self):
+        data = self.client.get('/library-admin/panel/books/?page_size=10').json()
+        self.assertEqual((data['total'], data['page'], data['has_next']), (30, 1, True))
+        self.assertEqual(len(data['books']), 10)
+        self.assertEqual(data['books'][0]['Title'], 'Sample Book 29')
+        self.assertEqual(len(data['books'][0]['copies']), 3)
+        self.assertIn('id', data['books'][0]['copies'][0])
+
+        last = self.client.get('/library-admin/panel/books/?page_size=10&page=3').json()
+        self.assertFalse(last['has_next'])
+        self.assertEqual(last['books'][-1]['Title'], 'Sample Book 0')
+
+        found = self.client.get('/library-admin/panel/books/?q=ACC00007-2').json()
+        self.assertEqual([book['Title'] for book in found['books']], ['Sample Book 7'])
+
+    def test_students_panel_filters_by_grade_and_search(self):
+        data = self.client.get('/library-admin/panel/students/').json()
+        self.assertEqual(data['total'], 12)
+        self.assertEqual(data['grade_counts'], {str(grade): 2 for grade in range(7, 13)})
+
+        grade = self.client.get('/library-admin/panel/students/?grade=9').json()
+        self.assertEqual([user['school_id'] for user in grade['students']], ['S-02', 'S-08'])
+
+        tesla = self.client.get('/library-admin/panel/students/?q=tesla&grade=7').json()
+        self.assertEqual(tesla['total'], 1)
+        self.assertEqual(tesla['grade_counts']['8'], 1)
+        self.assertEqual(tesla['students'][0]['name'], 'Student 06')
+
+        self.assertEqual(self.client.get('/library-admin/panel/nope/').status_code, 404)
+
+    def test_overdue_count_matches_is_overdue(self):
+        now = timezone.now()
+        student = students.objects.get(school_id='S-00')
+        late = make_borrow(BookCopy.objects.get(accessionNumber='ACC00001-1'), student, now - timedelta(days=6),
+                           return_date=now - timedelta(days=3))
+        on_time = make_borrow(BookCopy.objects.get(accessionNumber='ACC00002-1'), student, now)
+        make_borrow(BookCopy.objects.get(accessionNumber='ACC00003-1'), student, now - timedelta(days=9),
+                    returned=True, return_date=now - timedelta(days=5))
+        self.assertTrue(late.is_overdue())
+        self.assertFalse(on_time.is_overdue())
+
+        response = self.client.get('/library-admin/')
+        self.assertEqual(response.context['overdue_books_count'], 1)
+        self.assertContains(response, 'data-counter="overdue">1</span>')
+
+
+class QueryPlanTests(TestCase):
+
+    def test_main_queries_use_indexes(self):
+        make_books(3)
+        out = StringIO()
+        call_command('explain_queries', stdout=out)
+        output = out.getvalue()
+        self.assertNotIn('Missing index', output)
+        for index in ('borrow_open_due_idx', 'borrow_copy_open_idx', 'borrow_account_date_idx',
+                      'bookcopy_status_idx', 'bookcopy_location_idx'):
+            self.assertIn(index, output)
+        # only browsing the whole catalog reads a whole table
+        self.assertIn('1 of 12 queries read a whole table.', output)
+
+        out = StringIO()
+        call_command('explain_queries', '--query', 'overdue_list', stdout=out)
+        self.assertIn('SEARCH lims_app_borrowhistory USING INDEX borrow_open_due_idx', out.getvalue())
+        self.assertNotIn('records_browse', out.getvalue())
+
+
+class UpgradeSchemaTests(TransactionTestCase):
+
+    def test_adds_missing_schema_and_backfills(self):
+        make_books(2)
+        student = students.objects.create(name='Student One', school_id='S-1', email='s1@example.com', grade_Level=8)
+        make_borrow(BookCopy.objects.get(accessionNumber='ACC00000-1'), student, timezone.now() - timedelta(days=3))
+        # A database from before the counters, the rollup table and the indexes
+        with connection.schema_editor() as schema_editor:
+            for name in ('total_copies', 'available_copies', 'borrowed_copies'):
+                schema_editor.remove_field(Book, Book._meta.get_field(name))
+            schema_editor.delete_model(DailyCirculationStats)
+            schema_editor.remove_index(BookCopy, BookCopy._meta.indexes[0])
+            schema_editor.remove_field(BorrowHistory, BorrowHistory._meta.get_field('accountGrade'))
+
+        out = StringIO()
+        call_command('upgrade_schema', '--dry-run', stdout=out)
+        self.assertIn('Missing table lims_app_dailycirculationstats', out.getvalue())
+        self.assertIn('Missing column lims_app_book.available_copies', out.getvalue())
+        self.assertIn('Missing index lims_app_bookcopy.bookcopy_status_idx', out.getvalue())
+
+        call_command('upgrade_schema', stdout=StringIO())
+        self.assertEqual((schema.missing_tables(), schema.missing_columns(), schema.missing_indexes()), ([], [], []))
+        book = Book.objects.get(callNumber='QA00000')
+        self.assertEqual((book.total_copies, book.available_copies, book.borrowed_copies), (3, 2, 1))
+        self.assertEqual(rollups.period_totals(timezone.localdate() - timedelta(days=5), timezone.localdate())['borrows'], 1)
+        self.assertEqual(BorrowHistory.objects.get().accountGrade, 8)
+
+        out = StringIO()
+        call_command('upgrade_schema', stdout=out)
+        self.assertNotIn('Created', out.getvalue())
+
+
+class CirculationApiTests(TestCase):
+
+    def setUp(self):
+        self.staff = User.objects.create_superuser('librarian', 'lib@example.com', 'pw')
+        self.client.force_login(self.staff)
+        make_books(2)
+        students.objects.create(name='Student One', school_id='S-1', email='s1@example.com', grade_Level=9)
+
+    def checkout(self, accession, student_id='S-1'):
+        return self.client.post('/library-admin/circulation/checkout/', {'book_id': accession, 'student_id': student_id})
+
+    def test_checkout_returns_loan_and_counters(self):
+        response = self.checkout('ACC00000-1')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['message'], 'Book "Sample Book 0" (#ACC00000-1) checked out to student S-1.')
+        self.assertEqual(data['loan']['accessionNumber'], 'ACC00000-1')
+        self.assertEqual(data['loan']['accountName'], 'Student One')
+        self.assertFalse(data['loan']['returned'])
+        self.assertEqual(data['counters']['borrowed'], 1)
+        self.assertEqual(data['counters']['available'], 3)
+        self.assertEqual(data['counters']['book']['available_copies'], 1)
+        self.assertEqual(BookCopy.objects.get(accessionNumber='ACC00000-1').status, 'Borrowed')
+
+    def test_checkout_validation_errors(self):
+        self.assertEqual(self.checkout('ACC00000-0').json()['error'], 'Book "Sample Book 0" is not available for checkout.')
+        self.assertEqual(self.checkout('NOPE').status_code, 404)
+        response = self.checkout('ACC00000-1', student_id='S-404')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("No student found with school ID 'S-404'", response.json()['error'])
+        self.assertEqual(self.client.post('/library-admin/circulation/checkout/', {'book_id': 'ACC00000-1'}).status_code, 400)
+        self.assertFalse(BorrowHistory.objects.exists())
+        self.assertEqual(self.client.get('/library-admin/circulation/checkout/').status_code, 405)
+
+    def test_return_by_accession_and_by_loan(self):
+        first = self.checkout('ACC00000-1').json()['loan']
+        second = self.checkout('ACC00001-1').json()['loan']
+
+        data = self.client.post('/library-admin/circulation/return/', {'accession_number': 'ACC00000-1'}).json()
+        self.assertEqual(data['loan']['id'], first['id'])
+        self.assertTrue(data['loan']['returned'])
+        self.assertEqual(data['counters']['borrowed'], 1)
+
+        data = self.client.post(f"/library-admin/circulation/loans/{second['id']}/return/").json()
+        self.assertEqual(data['message'], 'Book returned successfully.')
+        self.assertEqual((data['counters']['borrowed'], data['counters']['available']), (0, 4))
+
+        again = self.client.post('/library-admin/circulation/return/', {'accession_number': 'ACC00000-1'})
+        self.assertEqual(again.status_code, 404)
+        self.assertEqual(again.json()['error'], 'No active borrow record found for accession number: ACC00000-1')
+        self.assertEqual(self.client.post(f"/library-admin/circulation/loans/{second['id']}/return/").status_code, 404)
+
+    def test_dashboard_form_uses_same_validation(self):
+        response = self.client.post('/library-admin/', {'action': 'checkout', 'book_id': 'ACC00000-0', 'student_id': 'S-1'})
+        self.assertContains(response, 'Book &quot;Sample Book 0&quot; is not available for checkout.')
+        response = self.client.post('/library-admin/', {'action': 'checkout', 'book_id': 'ACC00000-1', 'student_id': 'S-1'})
+        self.assertContains(response, 'checked out to student S-1.')
+        self.assertContains(response, 'data-api="/library-admin/circulation/loans/')
+
+
+class CirculationBatchTests(TestCase):
+
+    def setUp(self):
+        self.staff = User.objects.create_superuser('librarian', 'lib@example.com', 'pw')
+        self.client.force_login(self.staff)
+        make_books(8)
+        students.objects.create(name='Student One', school_id='S-1', email='s1@example.com', grade_Level=9)
+
+    def post(self, url, **data):
+        return self.client.post(url, data)
+
+    def test_batch_checkout_reports_each_item(self):
+        response = self.post('/library-admin/circulation/checkout/batch/', student_id='S-1',
+                             accession_numbers='ACC00000-1\nACC00001-1, ACC00000-0\nNOPE\nACC00000-1')
+        data = response.json()
+        self.assertEqual((data['succeeded'], data['failed']), (2, 2))
+        self.assertEqual([result['accessionNumber'] for result in data['results']],
+                         ['ACC00000-1', 'ACC00001-1', 'ACC00000-0', 'NOPE'])
+        self.assertEqual(data['results'][0]['loan']['accountName'], 'Student One')
+        self.assertEqual(data['results'][2]['error'], 'Book "Sample Book 0" is not available for checkout.')
+        self.assertEqual(data['results'][3]['error'], 'Book copy with accession number NOPE not found.')
+
+        self.assertEqual(data['counters']['borrowed'], 2)
+        self.assertEqual(Book.objects.get(Title='Sample Book 0').available_copies, 1)
+        self.assertEqual(BookCopy.objects.get(accessionNumber='ACC00001-1').student_id, 'S-1')
+        loan = BorrowHistory.objects.get(bookID='ACC00001-1')
+        self.assertEqual(loan.return_date, BorrowHistory.due_date_for(loan.borrow_date))
+        today = timezone.localdate()
+        self.assertEqual(rollups.period_totals(today, today)['borrows'], 2)
+
+        missing = self.post('/library-admin/circulation/checkout/batch/', student_id='S-404', accession_number='ACC00002-1')
+        self.assertEqual(missing.status_code, 400)
+
+    def test_batch_queries_do_not_grow_with_batch_size(self):
+        def checkout(accessions):
+            with CaptureQueriesContext(connection) as ctx:
+                self.post('/library-admin/circulation/checkout/batch/', student_id='S-1', accession_numbers=' '.join(accessions))
+            return len(ctx.captured_queries)
+
+        def give_back(accessions):
+            with CaptureQueriesContext(connection) as ctx:
+                self.post('/library-admin/circulation/return/batch/', accession_numbers=' '.join(accessions))
+            return len(ctx.captured_queries)
+
+        # the first write of the day creates the rollup row; measure after it
+        checkout(['ACC00005-1'])
+        give_back(['ACC00005-1'])
+        small = [f'ACC{i:05d}-1' for i in range(2)]
+        large = [f'ACC{i:05d}-2' for i in range(8)]
+        self.assertEqual(checkout(small), checkout(large))
+        self.assertEqual(give_back(small), give_back(large))
+
+    def test_batch_return(self):
+        self.post('/library-admin/circulation/checkout/batch/', student_id='S-1', accession_numbers='ACC00000-1 ACC00001-1')
+        data = self.post('/library-admin/circulation/return/batch/', accession_numbers='ACC00000-1 ACC00001-1 ACC00002-1').json()
+        self.assertEqual([result['ok'] for result in data['results']], [True, True, False])
+        self.assertTrue(data['results'][0]['loan']['returned'])
+        self.assertEqual(data['results'][2]['error'], 'No active borrow record found for accession number: ACC00002-1')
+        self.assertFalse(BorrowHistory.objects.filter(returned=False).exists())
+        self.assertEqual(BookCopy.objects.get(accessionNumber='ACC00000-1').status, 'Available')
+        self.assertEqual(Book.objects.get(Title='Sample Book 1').available_copies, 2)
+        today = timezone.localdate()
+        self.assertEqual(rollups.period_totals(today, today)['returns'], 2)
+
+        response = self.post('/library-admin/', action='return_batch', accession_numbers='ACC00000-1')
+        self.assertContains(response, 'No active borrow record found for accession number: ACC00000-1')
+
+
+class BorrowLogExportTests(TestCase):
+
+    def setUp(self):
+        self.staff = User.objects.create_superuser('librarian', 'lib@example.com', 'pw')
+        self.client.force_login(self.staff)
+        make_books(3)
+        self.student = students.objects.create(
+            name='Student One', school_id='S-1', email='s1@example.com', grade_Level=9, section='Ruby',
+        )
+        now = timezone.now()
+        copies = BookCopy.objects.order_by('accessionNumber')
+        for i, copy in enumerate(copies[:6]):
+            make_borrow(copy, self.student, now - timedelta(days=10 * i))
+
+    def export(self, **params):
+        response = self.client.get('/library-admin/analytics/export/borrow-log/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_joins_book_copy_and_student(self):
+        start = (timezone.localdate() - timedelta(days=25)).isoformat()
+        response, body = self.export(start_date=start)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(body.decode().splitlines()))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['accession_number'], 'ACC00000-2')
+        self.assertEqual(rows[-1]['title'], 'Sample Book 0')
+        self.assertEqual({row['grade_level'] for row in rows}, {'9'})
+        self.assertEqual({row['section'] for row in rows}, {'Ruby'})
+
+    def test_ndjson_gzip_streams_in_chunks(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response, body = self.export(format='ndjson', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(body).decode().splitlines()
+        self.assertEqual([json.loads(line)['student_name'] for line in lines], ['Student One'] * 6)
+        # one loan query plus one student lookup per chunk
+        loan_queries = [q for q in ctx.captured_queries if 'lims_app_borrowhistory' in q['sql']]
+        self.assertEqual(len(loan_queries), 1)
+
+    def test_rejects_bad_parameters(self):
+        url = '/library-admin/analytics/export/borrow-log/'
+        self.assertEqual(self.client.get(url, {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start_date': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start_date': '2025-02-01', 'end_date': '2025-01-01'}).status_code, 400)
+
+
+class ViewProfilingTests(TestCase):
+
+    def setUp(self):
+        profiling.reset_samples()
+        make_books(2)
+        self.staff = User.objects.create_superuser('librarian', 'lib@example.com', 'pw')
+
+    def test_staff_header_and_summary(self):
+        self.assertNotIn('Server-Timing', self.client.get('/records/'))
+        self.client.force_login(self.staff)
+        response = self.client.get('/records/')
+        self.assertIn('sql;dur=', response['Server-Timing'])
+
+        rows = {row['view']: row for row in self.client.get('/library-admin/performance/?format=json').json()['views']}
+        self.assertEqual(rows['records']['requests'], 2)
+        self.assertGreater(rows['records']['max_queries'], 0)
+        self.assertGreater(rows['records']['avg_template_ms'], 0)
+        self.assertContains(self.client.get('/library-admin/performance/'), 'records')
+
+    def test_budget_warning_and_log(self):
+        handle, path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        with override_settings(VIEW_QUERY_BUDGETS={'records_data': 0}, VIEW_PROFILE_LOG=path):
+            with self.assertLogs('lims_app.profiling', 'WARNING') as logs:
+                self.client.get('/records/data/')
+        self.assertIn('records_data', logs.output[0])
+        with open(path) as log_file:
+            sample = json.loads(log_file.readline())
+        self.assertEqual(sample['view'], 'records_data')
+        self.assertTrue(sample['over_budget'])
+
+    def test_streamed_queries_are_counted_when_the_stream_ends(self):
+        self.client.force_login(self.staff)
+        student = students.objects.create(name='Student One', school_id='S-1', email='s1@example.com', grade_Level=9)
+        make_borrow(BookCopy.objects.get(accessionNumber='ACC00000-1'), student, timezone.now())
+        profiling.reset_samples()
+        with override_settings(VIEW_QUERY_BUDGETS={'admin_borrow_log_export': 2}):
+            response = self.client.get('/library-admin/analytics/export/borrow-log/')
+            self.assertNotIn('Server-Timing', response)
+            self.assertEqual(profiling.summary(), [])  # nothing recorded before the body is sent
+            with self.assertLogs('lims_app.profiling', 'WARNING'):
+                b''.join(response.streaming_content)
+        [row] = profiling.summary()
+        self.assertEqual(row['view'], 'admin_borrow_log_export')
+        self.assertGreater(row['max_queries'], 2)  # session and user, then the loans and students while streaming
+
+    def test_template_timing_does_not_patch_django(self):
+        from django.template.backends.django import Template
+        self.assertNotIn('profiling', Template.render.__module__)
+        self.client.get('/records/')
+        self.assertGreater(profiling.summary()[0]['avg_template_ms'], 0)
+
+
+class SampleDataTests(TestCase):
+
+    def generate(self):
+        return sample_data.generate(
+            books=40, copies_per_book=2, student_count=30, years=2, loans_per_copy=8,
+            seed=7, until=timezone.localdate(),
+        )
+
+    def loans(self):
+        return list(BorrowHistory.objects.order_by('id').values_list(
+            'book_copy__accessionNumber', 'accountID', 'borrow_date', 'return_date', 'returned',
+        ))
+
+    def test_generation_is_deterministic_and_consistent(self):
+        counts = self.generate()
+        first = self.loans()
+        self.assertEqual(len(first), counts['loans'])
+        self.assertGreater(counts['loans'], counts['copies'])
+        self.assertGreater(counts['overdue_loans'], 0)
+
+        # at most one open loan per copy, and exactly the copies marked Borrowed
+        open_copies = list(BorrowHistory.objects.filter(returned=False).values_list('book_copy_id', flat=True))
+        self.assertEqual(len(open_copies), len(set(open_copies)))
+        self.assertEqual(set(open_copies), set(BookCopy.objects.filter(status='Borrowed').values_list('id', flat=True)))
+        self.assertEqual(
+            sum(Book.objects.values_list('borrowed_copies', flat=True)), len(open_copies),
+        )
+        self.assertEqual(rollups.period_totals(timezone.localdate() - timedelta(days=800), timezone.localdate())['borrows'],
+                         counts['loans'])
+
+        sample_data.clear_sample_data()
+        self.assertFalse(BorrowHistory.objects.exists())
+        self.generate()
+        self.assertEqual(self.loans(), first)
+
+
+class BenchmarkTests(TestCase):
+
+    def test_seeded_scenarios_and_compare(self):
+        counts = benchmarking.seed_database(60)
+        self.assertEqual(BookCopy.objects.count(), counts['copies'])
+        borrowed = BookCopy.objects.filter(status='Borrowed').count()
+
+        results = benchmarking.run_scenarios(iterations=2, scenarios=['records_browse', 'analytics_month', 'checkout'])
+        self.assertEqual(set(results), {'records_browse', 'analytics_month', 'checkout', 'return'})
+        self.assertGreater(results['checkout']['queries'], 0)
+        self.assertEqual(BookCopy.objects.filter(status='Borrowed').count(), borrowed)
+
+        report = {'scales': [{'scale': 60, 'results': results}]}
+        slower = {'scales': [{'scale': 60, 'results': {
+            name: {**result, 'p50_ms': result['p50_ms'] * 2 + 1} for name, result in results.items()
+        }}]}
+        self.assertEqual(benchmarking.compare(report, report), [])
+        self.assertEqual(len(benchmarking.compare(report, slower)), len(results))
+
+
+class ParallelPanelTests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        make_books(3)
+        student = students.objects.create(name='Student One', school_id='S-1', email='s1@example.com', grade_Level=8)
+        make_borrow(BookCopy.objects.get(accessionNumber='ACC00000-0'), student, timezone.now() - timedelta(days=3))
+
+    def test_thread_pool_matches_serial(self):
+        names = list(ANALYTICS_PANELS)
+        parallel, timings = compute_panels(names, {}, refresh=True, max_workers=4)
+        self.assertEqual(timings['workers'], 4)
+        self.assertEqual(set(timings['panels']), set(names))
+        self.assertEqual(timings['queries'], sum(t['queries'] for t in timings['panels'].values()))
+        self.assertGreater(timings['queries'], 0)
+
+        serial, timings = compute_panels(names, {}, refresh=True, max_workers=1)
+        self.assertEqual(timings['workers'], 1)
+        for name in names:
+            parallel[name].pop('computed_at')
+            serial[name].pop('computed_at')
+        self.assertEqual(parallel, serial)
+
+
+class CirculationStressTests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        make_books(2)
+        for i in range(4):
+            students.objects.create(name=f'Student {i}', school_id=f'S-{i}', email=f's{i}@example.com', grade_Level=8)
+
+    def test_concurrent_checkouts_and_returns_stay_consistent(self):
+        self.assertEqual(connection.cursor().execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        report = stress.run(threads=4, operations=40, copies=2, borrowers=1)
+        self.assertEqual(report['borrowers'], 1)
+        self.assertEqual(report['errors'], [])
+        self.assertEqual(report['problems'], [])
+        self.assertGreaterEqual(report['checkouts'] + report['returns'] + report['conflicts'], report['operations'])
+        self.assertGreater(report['checkouts'], 0)
+        self.assertGreater(report['ops_per_second'], 0)
+        # run() returns everything it borrowed
+        self.assertFalse(BorrowHistory.objects.filter(returned=False, accountID__startswith='S-').exists())
+        self.assertEqual(stress.check_consistency(['ACC00000-1', 'ACC00000-2']), [])
+
+    def race(self, *calls):
+        """Start every call at once on its own connection; their results or exceptions, in order."""
+        barrier = threading.Barrier(len(calls))
+        outcomes = [None] * len(calls)
+
+        def run(index, call):
+            try:
+                barrier.wait()
+                outcomes[index] = call()
+            except Exception as e:
+                outcomes[index] = e
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(index, call)) for index, call in enumerate(calls)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_same_student_same_copy_gets_one_loan(self):
+        for _ in range(5):
+            outcomes = self.race(
+                lambda: circulation.checkout('ACC00000-1', 'S-0'),
+                lambda: circulation.checkout('ACC00000-1', 'S-0'),
+            )
+            self.assertEqual(sum(isinstance(outcome, BorrowHistory) for outcome in outcomes), 1)
+            self.assertEqual(sum(isinstance(outcome, circulation.CirculationError) for outcome in outcomes), 1)
+            self.assertEqual(BorrowHistory.objects.filter(book_copy__accessionNumber='ACC00000-1', returned=False).count(), 1)
+            circulation.return_by_accession('ACC00000-1')
+
+    def test_same_student_racing_batches_never_shares_copies(self):
+        stack = ['ACC00000-1', 'ACC00000-2', 'ACC00001-1']
+        for _ in range(5):
+            outcomes = self.race(
+                lambda: circulation.checkout_many('S-0', stack),
+                lambda: circulation.checkout_many('S-0', stack),
+            )
+            won = [result['accessionNumber'] for results in outcomes for result in results if result['ok']]
+            self.assertEqual(sorted(won), sorted(stack))
+            for accession_number in stack:
+                self.assertEqual(
+                    BorrowHistory.objects.filter(book_copy__accessionNumber=accession_number, returned=False).count(), 1,
+                )
+            self.assertEqual(stress.check_consistency(stack), [])
+            circulation.return_many(stack)
+
+    def test_racing_admin_returns_close_the_loan_once(self):
+        staff = User.objects.create_superuser('librarian', 'lib@example.com', 'pw')
+        today = timezone.localdate()
+        for _ in range(5):
+            desks = [Client(), Client()]  # fresh sessions, so no messages carry over
+            for desk in desks:
+                desk.force_login(staff)
+            borrow = circulation.checkout('ACC00000-1', 'S-0')
+            returns_before = rollups.period_totals(today, today)['returns']
+            responses = self.race(*(
+                lambda desk=desk: desk.post('/library-admin/return/', {'borrow_id': borrow.id}) for desk in desks
+            ))
+            levels = sorted(
+                message.level_tag for response in responses for message in get_messages(response.wsgi_request)
+            )
+            self.assertEqual(levels, ['error', 'success'])
+            self.assertEqual(rollups.period_totals(today, today)['returns'], returns_before + 1)
+            self.assertEqual(Book.objects.get(callNumber='QA00000').available_copies, 2)
+            self.assertEqual(stress.check_consistency(['ACC00000-1']), [])
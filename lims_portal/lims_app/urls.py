@@ -15,7 +15,7 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.urls import path
-from .views import home, books, about, records, analytics, admin_login, admin_logout, admin_dashboard, admin_checkout, admin_return, admin_accounts, admin_books, admin_edit_book, admin_analytics_export
+from .views import home, books, about, records, records_data, records_suggest, records_facets, analytics, admin_login, admin_logout, admin_dashboard, admin_checkout, admin_return, admin_accounts, admin_books, admin_edit_book, admin_performance, admin_analytics_export, admin_borrow_log_export, analytics_panel, admin_sidebar_panel, circulation_checkout, circulation_return, circulation_return_loan, circulation_checkout_batch, circulation_return_batch
 
 urlpatterns = [
     path('', home, name='home'),
@@ -23,19 +23,31 @@ urlpatterns = [
     path('analytics/', analytics, name='analytics'),
     path('books/', books, name='books'),
     path('records/', records, name='records'),
+    path('records/data/', records_data, name='records_data'),
+    path('records/suggest/', records_suggest, name='records_suggest'),
+    path('records/facets/', records_facets, name='records_facets'),
     path('about/', about,  name='about'),
     
     # Library Admin Dashboard
     path('library-admin/login/', admin_login, name='admin_login'),
     path('library-admin/logout/', admin_logout, name='admin_logout'),
     path('library-admin/', admin_dashboard, name='admin_dashboard'),
+    path('library-admin/panel/<slug:name>/', admin_sidebar_panel, name='admin_sidebar_panel'),
+    path('library-admin/circulation/checkout/', circulation_checkout, name='circulation_checkout'),
+    path('library-admin/circulation/return/', circulation_return, name='circulation_return'),
+    path('library-admin/circulation/checkout/batch/', circulation_checkout_batch, name='circulation_checkout_batch'),
+    path('library-admin/circulation/return/batch/', circulation_return_batch, name='circulation_return_batch'),
+    path('library-admin/circulation/loans/<int:borrow_id>/return/', circulation_return_loan, name='circulation_return_loan'),
     path('library-admin/analytics/', analytics, name='admin_analytics'),
     path('library-admin/analytics/export/', admin_analytics_export, name='admin_analytics_export'),
+    path('library-admin/analytics/export/borrow-log/', admin_borrow_log_export, name='admin_borrow_log_export'),
+    path('library-admin/analytics/panel/<slug:name>/', analytics_panel, name='admin_analytics_panel'),
     path('library-admin/checkout/', admin_checkout, name='admin_checkout'),
     path('library-admin/return/', admin_return, name='admin_return'),
     path('library-admin/accounts/', admin_accounts, name='admin_accounts'),
     path('library-admin/books/', admin_books, name='admin_books'),
     path('library-admin/books/<int:book_id>/edit/', admin_edit_book, name='admin_edit_book'),
+    path('library-admin/performance/', admin_performance, name='admin_performance'),
 ]
 
 
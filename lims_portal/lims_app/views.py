@@ -1,19 +1,31 @@
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.utils.dateparse import parse_datetime, parse_date
 from django.utils import timezone
 from django.shortcuts import render, redirect
 from .models import Book, BookCopy, BorrowHistory, students
+from . import circulation, profiling, search
+from .signals import after_commit
+from .exports import borrow_log_rows, csv_stream, gzip_stream, ndjson_stream
+from .analytics import ANALYTICS_PANELS, ANALYTICS_PARAMS, get_analytics_metrics, get_panel
+from .catalog import (
+    BOOK_DETAIL_FIELDS, FACET_CACHE_TIMEOUT, bump_catalog_version, facet_counts_key, get_availability_version,
+    get_catalog_last_modified, get_catalog_version, get_facet_values, get_suggestion_index, make_snippet,
+    serialize_books,
+)
 from django.views.decorators.csrf import csrf_protect, ensure_csrf_cookie
 from django.db.models import Count, Q, Avg
 from django.db import transaction, IntegrityError
 from datetime import datetime, timedelta
 import csv
 import json
+import re
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.core.cache import cache
-from django.views.decorators.http import require_http_methods, require_POST
+from django.views.decorators.http import require_http_methods, require_POST, condition
+from django.views.decorators.cache import cache_control
+from django.views.decorators.vary import vary_on_headers
 from django.contrib import messages
 from django.core.management import call_command
 from io import StringIO
@@ -28,9 +40,34 @@ def home(request):
 def about(request):
     return render(request, "about.html", context={"current_tab": "about"})
 
+
+def _catalog_etag(request, *args, **kwargs):
+    # records answers both the page and XHR JSON from the same URL
+    variant = 'xhr' if request.headers.get("X-Requested-With") == "XMLHttpRequest" else 'page'
+    return f'catalog-{get_catalog_version()}-{get_availability_version()}-{variant}'
+
+
+def _catalog_last_modified(request, *args, **kwargs):
+    return get_catalog_last_modified()
+
+
+def catalog_conditional(view_func):
+    """Conditional GET for views that only depend on the catalog.
+
+    The ETag/Last-Modified come from the catalog version counter (a cache
+    read), so an unchanged catalog is answered with 304 before the view
+    runs any query. no-cache makes browsers revalidate on every load.
+    """
+    view_func = condition(etag_func=_catalog_etag, last_modified_func=_catalog_last_modified)(view_func)
+    view_func = cache_control(no_cache=True)(view_func)
+    return vary_on_headers("X-Requested-With")(view_func)
+
+
+@catalog_conditional
 def books(request):
-    authors = Book.objects.values_list('mainAuthor', flat=True).distinct()
-    locations = BookCopy.objects.values_list('Location', flat=True).distinct()
+    facets = get_facet_values()
+    authors = facets['authors']
+    locations = facets['locations']
 
     selected_author = request.GET.get('author')
     selected_location = request.GET.get('location')
@@ -57,31 +94,62 @@ def books(request):
             "search_query": search_query,
         }
     )
-def records(request):
-    # Capture user-selected filters
-    book_type = request.GET.get('book_type')
-    language = request.GET.get('language')
-    publisher = request.GET.get('publisher')
-    main_author = request.GET.get('main_author')
-    co_author = request.GET.get('co_author')
-    location = request.GET.get('location')
-    search_query = request.GET.get('search')
 
-    # Start with all books
+
+RECORDS_FILTER_KEYS = ('book_type', 'language', 'publisher', 'main_author', 'co_author', 'location', 'search')
+
+# DataTables column index -> ORM ordering field for the records table
+RECORDS_ORDER_COLUMNS = {
+    0: 'Title',
+    1: 'available_copies',
+}
+
+RECORDS_PAGE_MAX = 100
+
+
+def _get_records_filters(params):
+    """Pull the OPAC filter values out of a GET QueryDict."""
+    filters = {key: (params.get(key) or '').strip() or None for key in RECORDS_FILTER_KEYS}
+    # DataTables sends its own search box value as search[value]
+    if not filters['search']:
+        filters['search'] = (params.get('search[value]') or '').strip() or None
+    return filters
+
+
+def _uses_fulltext_search(filters):
+    return bool(filters['search']) and bool(search.build_match_query(filters['search'])) and search.search_ready()
+
+
+def _filter_records_queryset(filters):
+    """Apply the records filters to Book in SQL.
+
+    Copy-level conditions go through an id__in subquery instead of a join,
+    so the result never needs .distinct() and can be annotated safely.
+    Free-text search goes through the FTS5 index when it is available.
+    """
     books_query = Book.objects.all()
-    
-    # Apply filters to books
-    if book_type:
-        books_query = books_query.filter(Type=book_type)
-    if language:
-        books_query = books_query.filter(Language=language)
-    if publisher:
-        books_query = books_query.filter(Publisher=publisher)
-    if main_author:
-        books_query = books_query.filter(mainAuthor=main_author)
-    if co_author:
-        books_query = books_query.filter(coAuthor=co_author)
-    if search_query:
+
+    if filters['book_type']:
+        books_query = books_query.filter(Type=filters['book_type'])
+    if filters['language']:
+        books_query = books_query.filter(Language=filters['language'])
+    if filters['publisher']:
+        books_query = books_query.filter(Publisher=filters['publisher'])
+    if filters['main_author']:
+        books_query = books_query.filter(mainAuthor=filters['main_author'])
+    if filters['co_author']:
+        books_query = books_query.filter(coAuthor=filters['co_author'])
+
+    search_query = filters['search']
+    if _uses_fulltext_search(filters):
+        books_query = books_query.filter(id__in=search.matching_book_ids(search_query))
+    elif search_query:
+        matching_copies = BookCopy.objects.filter(
+            Q(accessionNumber__icontains=search_query) |
+            Q(Location__icontains=search_query) |
+            Q(status__icontains=search_query) |
+            Q(borrowed_by__icontains=search_query)
+        ).values('book_id')
         books_query = books_query.filter(
             Q(Title__icontains=search_query) | 
             Q(mainAuthor__icontains=search_query) | 
@@ -94,503 +162,311 @@ def records(request):
             Q(Language__icontains=search_query) |
             Q(Type__icontains=search_query) |
             Q(acquisitionStatus__icontains=search_query) |
-            Q(copies__accessionNumber__icontains=search_query) |
-            Q(copies__Location__icontains=search_query) |
-            Q(copies__status__icontains=search_query) |
-            Q(copies__borrowed_by__icontains=search_query)
-        ).distinct()
-    
+            Q(id__in=matching_copies)
+        )
+
     # If location filter, only include books that have copies in that location
-    if location:
-        books_query = books_query.filter(copies__Location=location).distinct()
-    
-    # Build grouped book data with copy information
-    all_books = []
-    for book in books_query.order_by('-id'):
-        copies = book.copies.all()
-        
-        # If location filter is set, only include copies from that location
-        if location:
-            copies = copies.filter(Location=location)
-        
-        # Calculate availability
-        total_copies = copies.count()
-        available_copies = copies.filter(status='Available').count()
-        
-        all_books.append({
-            'id': book.id,
-            'Title': book.Title,
-            'mainAuthor': book.mainAuthor,
-            'coAuthor': book.coAuthor,
-            'Publisher': book.Publisher,
-            'Edition': book.Edition,
-            'callNumber': book.callNumber,
-            'Language': book.Language,
-            'Type': book.Type,
-            'placeofPublication': book.placeofPublication,
-            'copyrightDate': str(book.copyrightDate) if book.copyrightDate else None,
-            'publicationDate': str(book.publicationDate) if book.publicationDate else None,
-            'Editors': book.Editors,
-            'acquisitionStatus': book.acquisitionStatus,
-            'total_copies': total_copies,
-            'available_copies': available_copies,
-            'borrowed_copies': total_copies - available_copies,
-            'copies': [{
-                'accessionNumber': c.accessionNumber,
-                'Location': c.Location,
-                'status': c.status,
-                'borrowed_by': c.borrowed_by,
-                'student_id': c.student_id,
-                'borrow_date': str(c.borrow_date) if c.borrow_date else None,
-                'return_date': str(c.return_date) if c.return_date else None
-            } for c in copies]
-        })
+    if filters['location']:
+        books_query = books_query.filter(
+            id__in=BookCopy.objects.filter(Location=filters['location']).values('book_id')
+        )
+
+    return books_query
+
+
+def _order_records(books_query, filters, *ordering):
+    """Order by the given fields, then by search relevance, then newest first."""
+    ordering = list(ordering)
+    if _uses_fulltext_search(filters):
+        books_query = books_query.annotate(search_rank=search.search_rank(filters['search']))
+        ordering.append('search_rank')
+    ordering.append('-id')
+    return books_query.order_by(*ordering)
+
+
+RECORDS_COPY_FIELDS = ('accessionNumber', 'Location', 'status', 'borrowed_by', 'student_id', 'borrow_date', 'return_date')
 
-    # Get distinct values for filter options
-    distinct_languages = Book.objects.values_list("Language", flat=True).distinct()
-    distinct_publishers = Book.objects.values_list("Publisher", flat=True).distinct()
-    distinct_authors = Book.objects.values_list("mainAuthor", flat=True).distinct()
-    distinct_coauthors = Book.objects.values_list("coAuthor", flat=True).distinct().exclude(coAuthor__isnull=True)
-    distinct_locations = BookCopy.objects.values_list("Location", flat=True).distinct()
-
-    selected_filters = {
-        "book_type": book_type,
-        "language": language,
-        "publisher": publisher,
-        "main_author": main_author,
-        "co_author": co_author,
-        "location": location,
-        "search": search_query,
-    }
+
+def _serialize_records(books_query, filters, start=None, stop=None):
+    """Records rows (book details + copies, counts limited to the location filter)."""
+    copy_filter = {'Location': filters['location']} if filters['location'] else None
+    return serialize_books(
+        books_query,
+        book_fields=BOOK_DETAIL_FIELDS,
+        copy_fields=RECORDS_COPY_FIELDS,
+        copy_filter=copy_filter,
+        start=start,
+        stop=stop,
+    )
+
+
+# (filter key, label, Book field) for the OPAC facets; location is per copy
+RECORDS_FACETS = (
+    ('book_type', 'Type', 'Type'),
+    ('language', 'Language', 'Language'),
+    ('location', 'Location', None),
+    ('publisher', 'Publisher', 'Publisher'),
+    ('main_author', 'Author', 'mainAuthor'),
+    ('co_author', 'Co-Author', 'coAuthor'),
+)
+
+RECORDS_FACET_LIMIT = 50
+
+
+def _records_facet_counts(filters):
+    """Counts for every facet value, given the search and the other filters.
+
+    Cached per filter combination until the catalog changes (see
+    facet_counts_key), so repeat page loads skip the grouped counts.
+    """
+    key = facet_counts_key(filters)
+    facets = cache.get(key)
+    if facets is None:
+        facets = _count_records_facets(filters)
+        cache.set(key, facets, FACET_CACHE_TIMEOUT)
+    return facets
+
+
+def _count_records_facets(filters):
+    """Live counts for every facet value, given the search and the other filters.
+
+    Each facet ignores its own selection (so the alternatives stay visible)
+    and is computed with one grouped aggregate, i.e. one query per facet.
+    Only the top values by count are returned, plus the selected one.
+    """
+    facets = []
+    for key, label, field in RECORDS_FACETS:
+        books_query = _filter_records_queryset(dict(filters, **{key: None}))
+        if field is None:
+            field = 'Location'
+            rows = BookCopy.objects.filter(book__in=books_query).values(field).annotate(
+                count=Count('book', distinct=True)
+            )
+        else:
+            rows = books_query.values(field).annotate(count=Count('id'))
+        rows = rows.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''}).order_by('-count', field)
+
+        selected = filters[key]
+        values = [
+            {'value': row[field], 'count': row['count'], 'selected': row[field] == selected}
+            for row in rows[:RECORDS_FACET_LIMIT]
+        ]
+        if selected and not any(v['selected'] for v in values):
+            selected_row = rows.filter(**{field: selected}).first()
+            values.append({
+                'value': selected,
+                'count': selected_row['count'] if selected_row else 0,
+                'selected': True,
+            })
+        facets.append({'key': key, 'label': label, 'selected': selected, 'values': values})
+    return facets
+
+
+@catalog_conditional
+def records(request):
+    # Capture user-selected filters
+    filters = _get_records_filters(request.GET)
+    books_query = _filter_records_queryset(filters)
 
     if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+        # Build grouped book data with copy information
+        all_books = _serialize_records(_order_records(books_query, filters), filters)
         return JsonResponse({"books": all_books})
 
+    # The table itself is filled page by page from records_data
     return render(request, "records.html", {
         "current_tab": "records",
-        "recorded_books": all_books,
-        "distinct_languages": distinct_languages,
-        "distinct_publishers": distinct_publishers,
-        "distinct_authors": distinct_authors,
-        "distinct_coauthors": distinct_coauthors,
-        "distinct_locations": distinct_locations,
-        "selected_filters": selected_filters,
+        "total_books": Book.objects.count(),
+        "selected_filters": filters,
+        "facets": _records_facet_counts(filters),
     })
-    
-def _build_analytics_context(request):
-    now = timezone.now()
-    
-    # ========== CORE METRICS ==========
-    total_books_count = Book.objects.count()
-    # Count all students
-    total_accounts = students.objects.count()
-    total_borrows_all_time = BorrowHistory.objects.count()
-    # count book copies marked as Borrowed in BookCopy.status
-    currently_borrowed = BookCopy.objects.filter(status='Borrowed').count()
-    available_books = BookCopy.objects.filter(status='Available').count()
-    
-    # Overdue books (borrow records not returned and past return_date)
-    overdue_books = BorrowHistory.objects.filter(
-        returned=False,
-        return_date__lt=timezone.now()
-    ).count()
-    
-    # ========== TIME-BASED FILTERS ==========
-    period = request.GET.get('period', 'month')
-    range_start_raw = request.GET.get('start_date', '')
-    range_end_raw = request.GET.get('end_date', '')
-
-    period_start_date = None
-    period_end_date = None
-    period_label = "This Month"
-
-    if period == 'range':
-        start_candidate = parse_date(range_start_raw) if range_start_raw else None
-        end_candidate = parse_date(range_end_raw) if range_end_raw else None
-        if start_candidate and end_candidate:
-            if start_candidate > end_candidate:
-                start_candidate, end_candidate = end_candidate, start_candidate
-            period_start_date = start_candidate
-            period_end_date = end_candidate
-            period_label = f"{start_candidate.strftime('%b %d, %Y')} - {end_candidate.strftime('%b %d, %Y')}"
-            range_start_raw = period_start_date
-            range_end_raw = period_end_date
-        else:
-            period = 'month'
-
-    if period != 'range':
-        if period == 'day':
-            period_start_date = now.date()
-            period_end_date = now.date()
-            period_label = "Today"
-        elif period == 'week':
-            period_start_date = (now - timedelta(days=now.weekday())).date()
-            period_end_date = now.date()
-            period_label = "This Week"
-        elif period == 'month':
-            period_start_date = now.replace(day=1).date()
-            period_end_date = now.date()
-            period_label = "This Month"
-        elif period == 'quarter':
-            quarter_month = ((now.month - 1) // 3) * 3 + 1
-            period_start_date = now.replace(month=quarter_month, day=1).date()
-            period_end_date = now.date()
-            period_label = "This Quarter"
-        elif period == 'year':
-            period_start_date = now.replace(month=1, day=1).date()
-            period_end_date = now.date()
-            period_label = "This Year"
-        else:
-            period_start_date = now.replace(day=1).date()
-            period_end_date = now.date()
-            period_label = "This Month"
-
-    range_start_value = None
-    range_end_value = None
-    if period == 'range' and period_start_date and period_end_date:
-        range_start_value = period_start_date
-        range_end_value = period_end_date
-
-    # Period-specific metrics
-    period_borrows = BorrowHistory.objects.filter(
-        borrow_date__date__range=(period_start_date, period_end_date)
-    ).count()
-    period_returns = BorrowHistory.objects.filter(
-        returned=True,
-        return_date__date__range=(period_start_date, period_end_date)
-    ).count()
-    # Count new students in period
-    period_new_accounts = students.objects.filter(
-        created_at__date__range=(period_start_date, period_end_date)
-    ).count()
-    
-    # ========== MONTHLY BORROWS (Last 7 months) ==========
-    def shift_month(year, month, delta):
-        month += delta
-        while month > 12:
-            month -= 12
-            year += 1
-        while month < 1:
-            month += 12
-            year -= 1
-        return year, month
-
-    monthly_labels = []
-    monthly_data = []
-    months_back = 6
-    for offset in range(months_back, -1, -1):
-        y, m = shift_month(now.year, now.month, -offset)
-        label = datetime(y, m, 1).strftime('%b %Y')
-        count = BorrowHistory.objects.filter(borrow_date__year=y, borrow_date__month=m).count()
-        monthly_labels.append(label)
-        monthly_data.append(count)
-
-    # ========== WEEKLY ACTIVITY (Last 7 days) ==========
-    weekly_labels = []
-    weekly_data = []
-    for offset in range(6, -1, -1):
-        day = now - timedelta(days=offset)
-        label = day.strftime('%a %m/%d')
-        count = BorrowHistory.objects.filter(borrow_date__date=day.date()).count()
-        weekly_labels.append(label)
-        weekly_data.append(count)
-
-    # ========== BOOK TYPE DISTRIBUTION ==========
-    type_qs = Book.objects.values('Type').annotate(count=Count('id')).order_by('-count')
-    type_labels = [t['Type'] for t in type_qs]
-    type_data = [t['count'] for t in type_qs]
-
-    # ========== LANGUAGE DISTRIBUTION ==========
-    language_qs = Book.objects.values('Language').annotate(count=Count('id')).order_by('-count')[:5]
-    language_labels = [lang['Language'] for lang in language_qs]
-    language_data = [lang['count'] for lang in language_qs]
-
-    # ========== TOP BORROWERS & MOST BORROWED ==========
-    top_borrowers = BorrowHistory.objects.values('accountName', 'accountID').annotate(borrow_count=Count('id')).order_by('-borrow_count')[:10]
-    most_borrowed = BorrowHistory.objects.values('bookTitle', 'bookID').annotate(borrow_count=Count('id')).order_by('-borrow_count')[:10]
-
-    # ========== LOCATION STATISTICS ==========
-    location_stats = BookCopy.objects.values('Location').annotate(
-        total=Count('id'),
-        borrowed=Count('id', filter=Q(status='Borrowed')),
-        available=Count('id', filter=Q(status='Available'))
-    ).order_by('-total')
-
-    # ========== GENDER STATISTICS ==========
-    # Overall gender proportions
-    overall_gender = {
-        'Male': students.objects.filter(gender='Male').count(),
-        'Female': students.objects.filter(gender='Female').count(),
-        'Other': students.objects.filter(gender='Other').count(),
-    }
-    total_students = sum(overall_gender.values())
-    overall_gender_proportions = {k: round((v / total_students * 100), 1) if total_students > 0 else 0 for k, v in overall_gender.items()}
-
-    # Pie chart data
-    overall_gender_labels = []
-    overall_gender_data = []
-    for label, value in overall_gender_proportions.items():
-        if value > 0:
-            overall_gender_labels.append(label)
-            overall_gender_data.append(value)
-
-    # Gender proportions per batch
-    batch_gender_stats = {}
-    for grade_num in range(7, 13):
-        grade_label = f'Grade {grade_num}'
-        batch_gender_stats[grade_label] = {
-            'Male': students.objects.filter(grade_Level=grade_num, gender='Male').count(),
-            'Female': students.objects.filter(grade_Level=grade_num, gender='Female').count(),
-            'Other': students.objects.filter(grade_Level=grade_num, gender='Other').count(),
-        }
-    for batch, genders in batch_gender_stats.items():
-        # Only include the gender keys (Male, Female, Other) - not 'total' or 'proportions'
-        gender_counts = {k: v for k, v in genders.items() if k in ['Male', 'Female', 'Other']}
-        total = sum(gender_counts.values())
-        batch_gender_stats[batch]['total'] = total
-        batch_gender_stats[batch]['proportions'] = {k: round((v / total * 100), 1) if total > 0 else 0 for k, v in gender_counts.items()}
-
-    # Pie chart data for batches
-    batch_gender_pie_data = {}
-    for batch, stats in batch_gender_stats.items():
-        filtered_labels = []
-        filtered_data = []
-        for label, value in stats['proportions'].items():
-            if value > 0:
-                filtered_labels.append(label)
-                filtered_data.append(value)
-        batch_gender_pie_data[batch] = {
-            'labels': filtered_labels,
-            'data': filtered_data
-        }
 
-    # Batch activity (borrows per batch)
-    batch_activity = {}
-    for grade_num in range(7, 13):
-        grade_label = f'Grade {grade_num}'
-        grade_school_ids = students.objects.filter(grade_Level=grade_num).values_list('school_id', flat=True)
-        batch_activity[grade_label] = BorrowHistory.objects.filter(accountID__in=grade_school_ids).count()
-    # Sort batch_activity by borrow count descending
-    sorted_batch_activity = []
-    for batch, count in sorted(batch_activity.items(), key=lambda x: x[1], reverse=True):
-        sorted_batch_activity.append({
-            'batch': batch,
-            'borrows': count,
-            'gender_proportions': batch_gender_stats[batch]['proportions'],
-            'total_students': batch_gender_stats[batch]['total']
-        })
 
-    # ========== BATCH STATISTICS ==========
-    # Batch statistics removed as Account model no longer exists
-    batch_stats = []
-
-    # ========== RECENT ACTIVITY & OVERDUE DETAILS ==========
-    recent_activity = BorrowHistory.objects.select_related().order_by('-borrow_date')[:15]
-    overdue_list = BorrowHistory.objects.filter(returned=False, return_date__lt=timezone.now()).order_by('return_date')[:10]
-
-    # ========== RETURN RATE CALCULATION ==========
-    returned_count = BorrowHistory.objects.filter(returned=True).count()
-    return_rate = (returned_count / total_borrows_all_time * 100) if total_borrows_all_time > 0 else 0.0
-
-    # ========== AVERAGE BORROW DURATION ==========
-    completed_borrows = BorrowHistory.objects.filter(returned=True, return_date__isnull=False)
-    if completed_borrows.exists():
-        total_duration = sum([
-            (b.return_date - b.borrow_date).days
-            for b in completed_borrows
-            if b.return_date and b.borrow_date
-        ])
-        avg_borrow_days = total_duration / completed_borrows.count()
-    else:
-        avg_borrow_days = 0.0
+@catalog_conditional
+def records_facets(request):
+    """Facet counts for the current search and filters, for live updates."""
+    filters = _get_records_filters(request.GET)
+    return JsonResponse({"facets": _records_facet_counts(filters)})
 
-    # ========== SIDEBAR DATA (Books/Students) ==========
-    all_books = []
-    for book in Book.objects.all().order_by('-id'):
-        copies_payload = [
-            {
-                'accessionNumber': c.accessionNumber,
-                'Location': c.Location,
-                'status': c.status,
-            }
-            for c in book.copies.all()
-        ]
-        all_books.append({
-            'id': book.id,
-            'Title': book.Title,
-            'mainAuthor': book.mainAuthor,
-            'coAuthor': book.coAuthor,
-            'Publisher': book.Publisher,
-            'Edition': book.Edition,
-            'callNumber': book.callNumber,
-            'Language': book.Language,
-            'Type': book.Type,
-            'total_copies': book.get_total_copies(),
-            'available_copies': book.get_available_copies(),
-            'borrowed_copies': book.get_borrowed_copies(),
-            'copies': copies_payload,
-        })
 
-    students_by_grade = {}
-    total_users_count = total_accounts
+@catalog_conditional
+def records_data(request):
+    """DataTables server-side endpoint for the records table.
 
-    for grade_num in range(7, 13):
-        grade_students = []
-        for user in students.objects.filter(grade_Level=grade_num).order_by('name'):
-            grade_students.append({
-                'name': user.name,
-                'school_id': user.school_id,
-                'email': user.email,
-                'grade': f'Grade {grade_num}',
-                'grade_num': grade_num,
-                'batch': user.batch or '',
-                'section': user.section or '',
+    Reads the standard draw/start/length/order/search parameters (plus the
+    regular records filters) and returns only the requested page, with the
+    paging, ordering and filtering all done in SQL.
+    """
+    def get_int(name, default):
+        try:
+            return int(request.GET.get(name, default))
+        except (TypeError, ValueError):
+            return default
+
+    draw = get_int('draw', 0)
+    start = max(get_int('start', 0), 0)
+    length = get_int('length', 10)
+    if length <= 0 or length > RECORDS_PAGE_MAX:
+        length = RECORDS_PAGE_MAX
+
+    filters = _get_records_filters(request.GET)
+    books_query = _filter_records_queryset(filters)
+
+    records_total = Book.objects.count()
+    records_filtered = books_query.count()
+
+    ordering = []
+    order_column = get_int('order[0][column]', -1)
+    if order_column in RECORDS_ORDER_COLUMNS:
+        direction = '-' if request.GET.get('order[0][dir]') == 'desc' else ''
+        ordering.append(f'{direction}{RECORDS_ORDER_COLUMNS[order_column]}')
+        if order_column == 1 and filters['location']:
+            # availability within one location isn't stored, so count it
+            books_query = books_query.annotate(
+                available_sort=Count('copies', filter=Q(copies__Location=filters['location'], copies__status='Available')),
+            )
+            ordering[-1] = f'{direction}available_sort'
+
+    page = _serialize_records(_order_records(books_query, filters, *ordering), filters, start, start + length)
+
+    return JsonResponse({
+        "draw": draw,
+        "recordsTotal": records_total,
+        "recordsFiltered": records_filtered,
+        "data": page,
+    })
+
+
+SUGGEST_MAX_RESULTS = 20
+
+
+@cache_control(no_store=True)
+def records_suggest(request):
+    """Typeahead suggestions for the portal search box.
+
+    Returns the top matches from the in-memory prefix index with only the
+    field that matched and a short snippet. The client's `seq` is echoed
+    back so it can drop responses that arrive after a newer keystroke.
+
+    Not catalog_conditional: the index lags the catalog version by up to
+    SUGGEST_INDEX_MIN_AGE, so a catalog ETag could pin a stale body.
+    """
+    query = (request.GET.get('q') or '').strip()
+    seq = request.GET.get('seq')
+    try:
+        limit = min(max(int(request.GET.get('limit', 8)), 1), SUGGEST_MAX_RESULTS)
+    except (TypeError, ValueError):
+        limit = 8
+
+    suggestions = []
+    if len(query) >= 2:
+        hits = get_suggestion_index().lookup(query, limit=limit)
+        counts = {
+            row['id']: row
+            for row in Book.objects.filter(id__in=[book_id for book_id, _, _ in hits]).values(
+                'id', 'Title', 'total_copies', 'available_copies',
+            )
+        }
+        for book_id, field, value in hits:
+            book = counts.get(book_id)
+            if book is None:
+                # Deleted since the index was built
+                continue
+            suggestions.append({
+                'id': book_id,
+                'Title': book['Title'],
+                'field': field,
+                'snippet': make_snippet(value, query),
+                'available_copies': book['available_copies'],
+                'total_copies': book['total_copies'],
             })
-        students_by_grade[grade_num] = grade_students
-
-    available_books_count = available_books
-
-    # ========== PERCENTAGES FOR UI (avoid template math) ==========
-    utilization_percent = int(currently_borrowed / total_books_count * 100) if total_books_count > 0 else 0
-    avg_borrow_percent = int(min((avg_borrow_days / 14) * 100, 100))  # relative to a 14-day baseline
-    return_rate_rounded = round(return_rate, 1)
-
-    # ========== CALENDAR HEATMAP DATA (Configurable Range & Navigation) ==========
-    heatmap_range = request.GET.get('heatmap_range', 'year')  # 'week', 'month', 'year'
-    heatmap_offset = int(request.GET.get('heatmap_offset', 0))
-    today = now.date()
-
-    if heatmap_range == 'week':
-        days = 7
-        heatmap_period_label = 'This Week'
-        heatmap_start_date = today - timedelta(days=(today.weekday() + 7 * heatmap_offset))
-        heatmap_end_date = heatmap_start_date + timedelta(days=6)
-    elif heatmap_range == 'month':
-        # Go back N months
-        month = today.month - heatmap_offset
-        year = today.year
-        while month < 1:
-            month += 12
-            year -= 1
-        heatmap_start_date = datetime(year, month, 1).date()
-        # End of month
-        if month == 12:
-            heatmap_end_date = datetime(year + 1, 1, 1).date() - timedelta(days=1)
-        else:
-            heatmap_end_date = datetime(year, month + 1, 1).date() - timedelta(days=1)
-        days = (heatmap_end_date - heatmap_start_date).days + 1
-        heatmap_period_label = heatmap_start_date.strftime('%B %Y')
-    else:  # 'year' or default
-        # Go back N years
-        year = today.year - heatmap_offset
-        heatmap_start_date = datetime(year, 1, 1).date()
-        heatmap_end_date = datetime(year, 12, 31).date()
-        days = (heatmap_end_date - heatmap_start_date).days + 1
-        heatmap_period_label = str(year)
-
-    # Build heatmap data for the selected period
-    heatmap_data = []
-    for i in range(days):
-        date = heatmap_start_date + timedelta(days=i)
-        count = BorrowHistory.objects.filter(borrow_date__date=date).count()
-        heatmap_data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'count': count
-        })
 
-    # Navigation helpers
-    prev_offset = heatmap_offset + 1
-    next_offset = heatmap_offset - 1 if heatmap_offset > 0 else 0
-    can_go_next = heatmap_offset > 0
-
-    # ========== PACKAGE METRICS JSON ==========
-    metrics = {
-        "monthlyLabels": monthly_labels,
-        "monthlyData": monthly_data,
-        "weeklyLabels": weekly_labels,
-        "weeklyData": weekly_data,
-        "typeLabels": type_labels,
-        "typeData": type_data,
-        "languageLabels": language_labels,
-        "languageData": language_data,
-        "periodLabel": period_label,
-        "heatmapData": heatmap_data,
-        "heatmapRange": heatmap_range,
-        "heatmapOffset": heatmap_offset,
-        "heatmapPeriodLabel": heatmap_period_label,
-        "heatmapCanGoNext": can_go_next,
-    }
+    return JsonResponse({"seq": seq, "query": query, "suggestions": suggestions})
+
+
+ANALYTICS_LAZY_PANELS = ('trends', 'collection', 'leaders', 'demographics', 'activity', 'heatmap')
+
+# camelCase chart series exported under "metrics"
+ANALYTICS_EXPORT_METRICS = (
+    'monthlyLabels', 'monthlyData', 'weeklyLabels', 'weeklyData',
+    'typeLabels', 'typeData', 'languageLabels', 'languageData',
+    'durationLabels', 'durationData',
+    'heatmapData', 'heatmapRange', 'heatmapOffset', 'heatmapPeriodLabel', 'heatmapCanGoNext',
+)
+
+
+def _analytics_params(request):
+    return {name: request.GET.get(name, '').strip() for name in ANALYTICS_PARAMS}
 
-    context = {
-        "current_tab": "analytics",
-        # Core counts
-        "total_books_count": total_books_count,
-        "total_accounts": total_accounts,
-        "total_borrows_all_time": total_borrows_all_time,
-        "currently_borrowed": currently_borrowed,
-        "available_books": available_books,
-        "available_books_count": available_books_count,
-        "overdue_books": overdue_books,
-        "total_users_count": total_users_count,
-
-        # Percent / UI helpers
-        "utilization_percent": utilization_percent,
-        "avg_borrow_percent": avg_borrow_percent,
-        "return_rate": return_rate_rounded,
-
-        # Period-specific
-        "period_borrows": period_borrows,
-        "period_returns": period_returns,
-        "period_new_accounts": period_new_accounts,
-        "period_label": period_label,
-        "period_value": period,
-
-        # Lists / details
-        "top_borrowers": list(top_borrowers),
-        "most_borrowed": list(most_borrowed),
-        "location_stats": list(location_stats),
-        "batch_stats": list(batch_stats),
-        "all_books": all_books,
-        "students_by_grade": students_by_grade,
-
-        # Gender statistics
-        "overall_gender_proportions": overall_gender_proportions,
-        "overall_gender_labels": overall_gender_labels,
-        "overall_gender_data": overall_gender_data,
-        "batch_gender_stats": batch_gender_stats,
-        "batch_gender_pie_data": batch_gender_pie_data,
-        "sorted_batch_activity": sorted_batch_activity,
-
-        # Recent activity & overdue
-        "borrowed_books": recent_activity,
-        "overdue_list": overdue_list,
-
-        # Chart data
-        "metrics_json": json.dumps(metrics),
-        "heatmap_range": heatmap_range,
-        "heatmap_offset": heatmap_offset,
-        "heatmap_period_label": heatmap_period_label,
-        "heatmap_can_go_next": can_go_next,
-        "heatmap_prev_offset": prev_offset,
-        "heatmap_next_offset": next_offset,
-        "range_start": range_start_value,
-        "range_end": range_end_value,
-        "avg_borrow_days": avg_borrow_days,
-        "export_query": request.GET.urlencode(),
-    }
 
-    return context
+def _analytics_refresh(request):
+    """Staff can pass ?refresh=1 to recompute instead of reading the cache."""
+    return bool(request.GET.get('refresh')) and request.user.is_staff
+
+
+def _analytics_sidebar_books():
+    return serialize_books()
+
+
+def _analytics_sidebar_students():
+    students_by_grade = {grade_num: [] for grade_num in range(7, 13)}
+    rows = students.objects.filter(grade_Level__in=students_by_grade).order_by('name').values(
+        'name', 'school_id', 'email', 'grade_Level', 'batch', 'section',
+    )
+    for user in rows:
+        grade_num = user['grade_Level']
+        students_by_grade[grade_num].append({
+            'name': user['name'],
+            'school_id': user['school_id'],
+            'email': user['email'],
+            'grade': f'Grade {grade_num}',
+            'grade_num': grade_num,
+            'batch': user['batch'] or '',
+            'section': user['section'] or '',
+        })
+    return students_by_grade
 
 
 @staff_member_required
 def analytics(request):
-    context = _build_analytics_context(request)
+    """Render the page shell and KPI cards; every other panel is fetched by the page."""
+    context = dict(get_panel('kpis', _analytics_params(request), refresh=_analytics_refresh(request)))
+
+    query = request.GET.copy()
+    query.pop('refresh', None)
+    refresh_query = query.copy()
+    refresh_query['refresh'] = '1'
+    context.update({
+        "current_tab": "analytics",
+        "analytics_panels": ANALYTICS_LAZY_PANELS,
+        "export_query": query.urlencode(),
+        "panel_query": query.urlencode(),
+        "refresh_query": refresh_query.urlencode(),
+        "refresh_panels": _analytics_refresh(request),
+        "duration_chart": {
+            "labels": context["durationLabels"],
+            "data": context["durationData"],
+        },
+    })
     return render(request, "analytics.html", context)
 
 
+@staff_member_required
+def analytics_panel(request, name):
+    """JSON for one analytics panel, or for the lazily loaded sidebar lists."""
+    if name == 'books':
+        return JsonResponse({'books': _analytics_sidebar_books()})
+    if name == 'students':
+        return JsonResponse({'students_by_grade': _analytics_sidebar_students()})
+    if name not in ANALYTICS_PANELS:
+        return JsonResponse({'error': f'Unknown panel "{name}"'}, status=404)
+    data = get_panel(name, _analytics_params(request), refresh=_analytics_refresh(request))
+    return JsonResponse(data)
+
+
 @staff_member_required
 def admin_analytics_export(request):
-    context = _build_analytics_context(request)
+    context = get_analytics_metrics(_analytics_params(request), refresh=_analytics_refresh(request))
     export_format = (request.GET.get('format') or 'csv').lower()
     timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
     filename_base = f"library-analytics-{timestamp}"
@@ -611,42 +487,25 @@ def admin_analytics_export(request):
         "period_borrows": context.get("period_borrows"),
         "period_returns": context.get("period_returns"),
         "period_new_accounts": context.get("period_new_accounts"),
+        "period_overdue": context.get("period_overdue"),
         "return_rate": context.get("return_rate"),
         "avg_borrow_days": context.get("avg_borrow_days"),
+        "median_borrow_days": context.get("median_borrow_days"),
+        "p90_borrow_days": context.get("p90_borrow_days"),
     }
 
     if export_format == 'json':
-        recent_activity_export = []
-        for item in context.get("borrowed_books", []):
-            recent_activity_export.append({
-                "book_title": item.bookTitle,
-                "account_name": item.accountName,
-                "account_id": item.accountID,
-                "borrow_date": item.borrow_date.isoformat() if item.borrow_date else None,
-                "return_date": item.return_date.isoformat() if item.return_date else None,
-                "returned": item.returned,
-            })
-
-        overdue_export = []
-        for item in context.get("overdue_list", []):
-            overdue_export.append({
-                "book_title": item.bookTitle,
-                "account_name": item.accountName,
-                "account_id": item.accountID,
-                "borrow_date": item.borrow_date.isoformat() if item.borrow_date else None,
-                "return_date": item.return_date.isoformat() if item.return_date else None,
-                "days_overdue": (timezone.now().date() - item.return_date.date()).days if item.return_date else None,
-            })
-
         payload = {
             "generated_at": timezone.now().isoformat(),
+            "computed_at": context["computed_at"].isoformat(),
+            "timings": context["timings"],
             "summary": summary,
-            "metrics": json.loads(context.get("metrics_json") or '{}'),
+            "metrics": {key: context.get(key) for key in ANALYTICS_EXPORT_METRICS},
             "top_borrowers": context.get("top_borrowers", []),
             "most_borrowed": context.get("most_borrowed", []),
             "location_stats": context.get("location_stats", []),
-            "recent_activity": recent_activity_export,
-            "overdue_list": overdue_export,
+            "recent_activity": context.get("recent_activity", []),
+            "overdue_list": context.get("overdue_list", []),
             "overall_gender_proportions": context.get("overall_gender_proportions", {}),
             "batch_gender_stats": context.get("batch_gender_stats", {}),
         }
@@ -662,8 +521,8 @@ def admin_analytics_export(request):
         'period_label', 'period_start', 'period_end',
         'total_books_count', 'total_accounts', 'total_borrows_all_time',
         'currently_borrowed', 'available_books', 'overdue_books',
-        'period_borrows', 'period_returns', 'period_new_accounts',
-        'return_rate', 'avg_borrow_days'
+        'period_borrows', 'period_returns', 'period_new_accounts', 'period_overdue',
+        'return_rate', 'avg_borrow_days', 'median_borrow_days', 'p90_borrow_days'
     ])
     writer.writerow([
         summary['period_label'],
@@ -678,12 +537,66 @@ def admin_analytics_export(request):
         summary['period_borrows'],
         summary['period_returns'],
         summary['period_new_accounts'],
+        summary['period_overdue'],
         summary['return_rate'],
         summary['avg_borrow_days'],
+        summary['median_borrow_days'],
+        summary['p90_borrow_days'],
     ])
     return response
 
 
+BORROW_LOG_FORMATS = {
+    # format: (encoder, content type, file extension)
+    'csv': (csv_stream, 'text/csv', 'csv'),
+    'ndjson': (ndjson_stream, 'application/x-ndjson', 'ndjson'),
+}
+
+
+@staff_member_required
+def admin_borrow_log_export(request):
+    """Stream every loan borrowed between start_date and end_date (inclusive, local dates)."""
+    export_format = (request.GET.get('format') or 'csv').lower()
+    if export_format not in BORROW_LOG_FORMATS:
+        return JsonResponse({'error': f'Unsupported format "{export_format}"'}, status=400)
+
+    bounds = {}
+    for param in ('start_date', 'end_date'):
+        raw = request.GET.get(param)
+        if not raw:
+            bounds[param] = None
+            continue
+        try:
+            day = parse_date(raw)
+        except ValueError:
+            day = None
+        if day is None:
+            return JsonResponse({'error': f'{param} must be YYYY-MM-DD'}, status=400)
+        bounds[param] = day
+    start_day, end_day = bounds['start_date'], bounds['end_date']
+    if start_day and end_day and start_day > end_day:
+        return JsonResponse({'error': 'start_date is after end_date'}, status=400)
+
+    def local_midnight(day):
+        return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+    rows = borrow_log_rows(
+        start=local_midnight(start_day) if start_day else None,
+        end=local_midnight(end_day + timedelta(days=1)) if end_day else None,
+    )
+    encoder, content_type, extension = BORROW_LOG_FORMATS[export_format]
+    chunks = encoder(rows)
+    filename = f"borrow-log-{start_day or 'start'}-to-{end_day or timezone.localdate()}.{extension}"
+    if request.GET.get('gzip') in ('1', 'true', 'yes'):
+        chunks = gzip_stream(chunks)
+        content_type = 'application/gzip'
+        filename += '.gz'
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 # Admin Views
 def admin_login(request):
     if request.method == 'POST':
@@ -712,6 +625,17 @@ def admin_logout(request):
     logout(request)
     return redirect('admin_login')
 
+
+# Success messages for the dashboard's circulation actions, shared with the JSON endpoints
+CIRCULATION_MESSAGES = {
+    'checkout': lambda borrow: f'Book "{borrow.bookTitle}" (#{borrow.bookID}) checked out to student {borrow.accountID}.',
+    'return': lambda borrow: 'Book returned successfully.',
+    'return_barcode': lambda borrow: (
+        f'Book "{borrow.book_copy.book.Title}" (#{borrow.book_copy.accessionNumber}) returned successfully.'
+    ),
+}
+
+
 @staff_member_required
 def admin_dashboard(request):
     # Track which view to show after navigation or POST processing.
@@ -729,115 +653,88 @@ def admin_dashboard(request):
             accession_number = request.POST.get('book_id', '').strip()
             student_id = request.POST.get('student_id', '').strip()
             try:
-                # Find the book copy by accession number
-                book_copy = BookCopy.objects.get(accessionNumber=accession_number)
-                if book_copy.status != 'Available':
-                    messages.error(request, f'Book "{book_copy.book.Title}" is not available for checkout.')
-                else:
-                    # Create borrow history
-                    borrow = BorrowHistory(
-                        book_copy=book_copy,
-                        bookID=accession_number,  # Keep for backward compatibility
-                        accountID=student_id,
-                        bookTitle=book_copy.book.Title,
-                        accountName=student_id  # Could look up student name here
-                    )
-                    borrow.save()
-                    
-                    # Update book copy status
-                    book_copy.status = 'Borrowed'
-                    book_copy.borrowed_by = student_id
-                    book_copy.student_id = student_id
-                    book_copy.borrow_date = timezone.now()
-                    book_copy.save()
-                    
-                    messages.success(request, f'Book "{book_copy.book.Title}" (#{accession_number}) checked out to student {student_id}.')
-            except BookCopy.DoesNotExist:
-                messages.error(request, f'Book copy with accession number {accession_number} not found.')
+                borrow = circulation.checkout(accession_number, student_id)
+                messages.success(request, CIRCULATION_MESSAGES['checkout'](borrow))
+            except circulation.CirculationError as e:
+                messages.error(request, str(e))
             except Exception as e:
                 messages.error(request, f'Error checking out book: {str(e)}')
                 
         elif action == 'return':
             borrow_id = request.POST.get('borrow_id')
             try:
-                borrow = BorrowHistory.objects.get(id=borrow_id, returned=False)
-                borrow.returned = True
-                borrow.return_date = timezone.now()
-                borrow.save()
-                
-                # Update book copy status
-                book_copy = borrow.book_copy
-                book_copy.status = 'Available'
-                book_copy.borrowed_by = None
-                book_copy.student_id = None
-                book_copy.borrow_date = None
-                book_copy.return_date = None
-                book_copy.save()
-                
-                messages.success(request, 'Book returned successfully.')
-            except BorrowHistory.DoesNotExist:
-                messages.error(request, 'Borrow record not found.')
+                borrow = circulation.return_by_borrow_id(borrow_id)
+                messages.success(request, CIRCULATION_MESSAGES['return'](borrow))
+            except circulation.CirculationError as e:
+                messages.error(request, str(e))
             except Exception as e:
                 messages.error(request, str(e))
         
         elif action == 'return_barcode':
             accession_number = request.POST.get('accession_number', '').strip()
             try:
-                # Find the book copy
-                book_copy = BookCopy.objects.get(accessionNumber=accession_number)
-                
-                # Find the active borrow record for this copy
-                borrow = BorrowHistory.objects.get(book_copy=book_copy, returned=False)
-                borrow.returned = True
-                borrow.return_date = timezone.now()
-                borrow.save()
-                
-                # Update book copy status
-                book_copy.status = 'Available'
-                book_copy.borrowed_by = None
-                book_copy.student_id = None
-                book_copy.borrow_date = None
-                book_copy.return_date = None
-                book_copy.save()
-                
-                messages.success(request, f'Book "{book_copy.book.Title}" (#{accession_number}) returned successfully.')
-            except BookCopy.DoesNotExist:
-                messages.error(request, f'Book copy with accession number {accession_number} not found.')
-            except BorrowHistory.DoesNotExist:
-                messages.error(request, f'No active borrow record found for accession number: {accession_number}')
+                borrow = circulation.return_by_accession(accession_number)
+                messages.success(request, CIRCULATION_MESSAGES['return_barcode'](borrow))
+            except circulation.CirculationError as e:
+                messages.error(request, str(e))
             except Exception as e:
                 messages.error(request, f'Error returning book: {str(e)}')
         
+        elif action in ('checkout_batch', 'return_batch'):
+            try:
+                if action == 'checkout_batch':
+                    results = circulation.checkout_many(
+                        request.POST.get('student_id', '').strip(), _posted_accession_numbers(request.POST),
+                    )
+                else:
+                    results = circulation.return_many(_posted_accession_numbers(request.POST))
+            except circulation.CirculationError as e:
+                messages.error(request, str(e))
+            else:
+                done = sum(1 for result in results if result['ok'])
+                verb = 'Checked out' if action == 'checkout_batch' else 'Returned'
+                if done:
+                    messages.success(request, f'{verb} {done} of {len(results)} books.')
+                for result in results:
+                    if not result['ok']:
+                        messages.error(request, result['error'])
+        
         elif action == 'edit_book':
             book_id = request.POST.get('book_id')
             try:
-                book = Book.objects.get(id=book_id)
-                book.Title = request.POST.get('title', book.Title)
-                book.mainAuthor = request.POST.get('main_author', book.mainAuthor)
-                book.coAuthor = request.POST.get('co_author', book.coAuthor)
-                book.Publisher = request.POST.get('publisher', book.Publisher)
-                book.Edition = request.POST.get('edition', book.Edition)
-                book.callNumber = request.POST.get('call_number', book.callNumber)
-                book.Language = request.POST.get('language', book.Language)
-                book.Type = request.POST.get('type', book.Type)
-                book.save()
-
-                # Update copies (status/location) from modal, if present
-                copy_ids = request.POST.getlist('copy_id')
-                copy_statuses = request.POST.getlist('copy_status')
-                copy_locations = request.POST.getlist('copy_location')
-
-                if copy_ids:
-                    allowed_status = {'Available', 'Unavailable', 'Borrowed', 'Lost'}
-                    for i, copy_id in enumerate(copy_ids):
-                        status = copy_statuses[i] if i < len(copy_statuses) else 'Available'
-                        location = copy_locations[i] if i < len(copy_locations) else ''
-                        if status not in allowed_status:
-                            status = 'Available'
-                        BookCopy.objects.filter(id=copy_id, book=book).update(
-                            status=status,
-                            Location=(location or '').strip(),
-                        )
+                # All or nothing, so a failure partway never commits (or reindexes) half an edit
+                with transaction.atomic():
+                    book = Book.objects.get(id=book_id)
+                    book.Title = request.POST.get('title', book.Title)
+                    book.mainAuthor = request.POST.get('main_author', book.mainAuthor)
+                    book.coAuthor = request.POST.get('co_author', book.coAuthor)
+                    book.Publisher = request.POST.get('publisher', book.Publisher)
+                    book.Edition = request.POST.get('edition', book.Edition)
+                    book.callNumber = request.POST.get('call_number', book.callNumber)
+                    book.Language = request.POST.get('language', book.Language)
+                    book.Type = request.POST.get('type', book.Type)
+                    book.save()
+
+                    # Update copies (status/location) from modal, if present
+                    copy_ids = request.POST.getlist('copy_id')
+                    copy_statuses = request.POST.getlist('copy_status')
+                    copy_locations = request.POST.getlist('copy_location')
+
+                    if copy_ids:
+                        allowed_status = {'Available', 'Unavailable', 'Borrowed', 'Lost'}
+                        for i, copy_id in enumerate(copy_ids):
+                            status = copy_statuses[i] if i < len(copy_statuses) else 'Available'
+                            location = copy_locations[i] if i < len(copy_locations) else ''
+                            if status not in allowed_status:
+                                status = 'Available'
+                            BookCopy.objects.filter(id=copy_id, book=book).update(
+                                status=status,
+                                Location=(location or '').strip(),
+                            )
+                        # .update() skips the post_save signals, so refresh the counters and index here
+                        Book.recount_copies(Book.objects.filter(pk=book.pk))
+                        after_commit(search.index_book, book.id)
+                        after_commit(bump_catalog_version)
 
                 messages.success(request, f'Book "{book.Title}" updated successfully.')
             except Book.DoesNotExist:
@@ -1316,90 +1213,237 @@ def admin_dashboard(request):
         
         # Don't redirect - render the page with messages visible
     
-    borrowed_books = BorrowHistory.objects.filter(returned=False).select_related()
-    overdue_books = [b for b in borrowed_books if b.is_overdue()]
+    # title and borrower name are stored on the loan, so no joins are needed
+    borrowed_books = BorrowHistory.objects.filter(returned=False)
+    overdue_books_count = borrowed_books.filter(return_date__lt=circulation.overdue_cutoff()).count()
     available_books_count = BookCopy.objects.filter(status='Available').count()
-    available_book_copies = BookCopy.objects.filter(status='Available').select_related('book')
     recent_activity = BorrowHistory.objects.all().order_by('-borrow_date')[:10]
     
-    # Get total books and book copies
+    # The Books and Students panels fetch their lists from admin_sidebar_panel
+    # when opened; the page itself only needs the badge counts
     total_books_count = Book.objects.count()
-    total_copies_count = BookCopy.objects.count()
-    # Get all books with their copies information
-    all_books = []
-    for book in Book.objects.all().order_by('-id'):
-        copies = book.copies.all()
-        copies_payload = [
-            {
-                'id': c.id,
-                'accessionNumber': c.accessionNumber,
-                'status': c.status,
-                'Location': c.Location,
-                'borrowed_by': c.borrowed_by,
-                'student_id': c.student_id,
-            }
-            for c in copies
-        ]
-        all_books.append({
-            'id': book.id,
-            'Title': book.Title,
-            'mainAuthor': book.mainAuthor,
-            'coAuthor': book.coAuthor,
-            'Publisher': book.Publisher,
-            'Edition': book.Edition,
-            'callNumber': book.callNumber,
-            'Language': book.Language,
-            'Type': book.Type,
-            'total_copies': book.get_total_copies(),
-            'available_copies': book.get_available_copies(),
-            'borrowed_copies': book.get_borrowed_copies(),
-            'copies': copies_payload,
-            'copies_json': json.dumps(copies_payload),
-        })
-    
-    students_by_grade = {}
     total_users_count = students.objects.count()
-
-    for grade_num in range(7, 13):
-        grade_students = []
-        for user in students.objects.filter(grade_Level=grade_num).order_by('name'):
-            grade_students.append({
-                'name': user.name,
-                'school_id': user.school_id,
-                'email': user.email,
-                'grade': f'Grade {grade_num}',
-                'grade_num': grade_num,
-                'batch': user.batch or '',
-                'section': user.section or '',
-            })
-        students_by_grade[grade_num] = grade_students
     
     return render(request, 'cadmin.html', {
         'borrowed_books': borrowed_books,
-        'overdue_books': overdue_books,
+        'overdue_books_count': overdue_books_count,
         'available_books_count': available_books_count,
-        'available_books': available_book_copies,
         'recent_activity': recent_activity,
         'total_books_count': total_books_count,
-        'total_copies_count': total_copies_count,
-        'all_books': all_books,
         'total_users_count': total_users_count,
-        'students_by_grade': students_by_grade,
         'active_view': active_view,  # Pass the active view to template
         'date_now': timezone.now(),
     })
 
+
+SIDEBAR_PAGE_SIZE = 25
+SIDEBAR_MAX_PAGE_SIZE = 100
+SIDEBAR_COPY_FIELDS = ('id', 'accessionNumber', 'status', 'Location', 'borrowed_by', 'student_id')
+STUDENT_GRADES = range(7, 13)
+
+
+def _sidebar_page(params):
+    """(page, page_size, start, stop) from ?page=&page_size=, clamped to sane values."""
+    def get_int(name, default):
+        try:
+            return int(params.get(name, default))
+        except (TypeError, ValueError):
+            return default
+
+    page = max(get_int('page', 1), 1)
+    page_size = min(max(get_int('page_size', SIDEBAR_PAGE_SIZE), 1), SIDEBAR_MAX_PAGE_SIZE)
+    start = (page - 1) * page_size
+    return page, page_size, start, start + page_size
+
+
+def _sidebar_books(params):
+    """One page of the dashboard's Books panel, searched like the OPAC records."""
+    page, page_size, start, stop = _sidebar_page(params)
+    filters = dict.fromkeys(RECORDS_FILTER_KEYS)
+    filters['search'] = (params.get('q') or '').strip() or None
+    books_query = _filter_records_queryset(filters)
+    total = books_query.count()
+    books = serialize_books(
+        _order_records(books_query, filters), copy_fields=SIDEBAR_COPY_FIELDS, start=start, stop=stop,
+    )
+    return {
+        'books': books,
+        'page': page,
+        'page_size': page_size,
+        'total': total,
+        'has_next': stop < total,
+    }
+
+
+def _sidebar_students(params):
+    """One page of the dashboard's Students panel.
+
+    ?q= matches name, school ID, batch or section; ?grade= narrows to one
+    grade. grade_counts are for the search across all grades, so the grade
+    picker can show how many matches each grade has.
+    """
+    page, page_size, start, stop = _sidebar_page(params)
+    students_query = students.objects.filter(grade_Level__in=STUDENT_GRADES)
+    search_query = (params.get('q') or '').strip()
+    if search_query:
+        students_query = students_query.filter(
+            Q(name__icontains=search_query) |
+            Q(school_id__icontains=search_query) |
+            Q(batch__icontains=search_query) |
+            Q(section__icontains=search_query)
+        )
+
+    grade_counts = {grade_num: 0 for grade_num in STUDENT_GRADES}
+    for row in students_query.values('grade_Level').annotate(count=Count('id')).order_by():
+        grade_counts[row['grade_Level']] = row['count']
+
+    try:
+        grade = int(params.get('grade') or 0)
+    except ValueError:
+        grade = 0
+    if grade in grade_counts:
+        students_query = students_query.filter(grade_Level=grade)
+        total = grade_counts[grade]
+    else:
+        grade = None
+        total = sum(grade_counts.values())
+
+    rows = students_query.order_by('grade_Level', 'name').values(
+        'name', 'school_id', 'email', 'grade_Level', 'batch', 'section',
+    )[start:stop]
+    return {
+        'students': [
+            {
+                'name': user['name'],
+                'school_id': user['school_id'],
+                'email': user['email'],
+                'grade': f"Grade {user['grade_Level']}",
+                'grade_num': user['grade_Level'],
+                'batch': user['batch'] or '',
+                'section': user['section'] or '',
+            }
+            for user in rows
+        ],
+        'grade': grade,
+        'grade_counts': grade_counts,
+        'page': page,
+        'page_size': page_size,
+        'total': total,
+        'has_next': stop < total,
+    }
+
+
+SIDEBAR_PANELS = {
+    'books': _sidebar_books,
+    'students': _sidebar_students,
+}
+
+
+@staff_member_required
+def admin_sidebar_panel(request, name):
+    """JSON page for the dashboard's Books or Students slide-in panel."""
+    if name not in SIDEBAR_PANELS:
+        return JsonResponse({'error': f'Unknown panel "{name}"'}, status=404)
+    return JsonResponse(SIDEBAR_PANELS[name](request.GET))
+
+
+def _circulation_response(action, operation, *args):
+    """Run a circulation operation and answer with the loan and fresh counters."""
+    try:
+        borrow = operation(*args)
+    except circulation.CirculationError as e:
+        return JsonResponse({'ok': False, 'error': str(e)}, status=e.status)
+    return JsonResponse({
+        'ok': True,
+        'message': CIRCULATION_MESSAGES[action](borrow),
+        'loan': circulation.loan_data(borrow),
+        'counters': circulation.counters(borrow.book_copy.book_id),
+    })
+
+
+@staff_member_required
+@require_POST
+def circulation_checkout(request):
+    """JSON checkout: POST book_id (accession number) and student_id."""
+    accession_number = request.POST.get('book_id', '').strip()
+    student_id = request.POST.get('student_id', '').strip()
+    if not accession_number or not student_id:
+        return JsonResponse({'ok': False, 'error': 'Both book_id and student_id are required.'}, status=400)
+    return _circulation_response('checkout', circulation.checkout, accession_number, student_id)
+
+
+@staff_member_required
+@require_POST
+def circulation_return(request):
+    """JSON return by barcode: POST accession_number."""
+    accession_number = request.POST.get('accession_number', '').strip()
+    if not accession_number:
+        return JsonResponse({'ok': False, 'error': 'accession_number is required.'}, status=400)
+    return _circulation_response('return_barcode', circulation.return_by_accession, accession_number)
+
+
+@staff_member_required
+@require_POST
+def circulation_return_loan(request, borrow_id):
+    """JSON return of one open loan by its id."""
+    return _circulation_response('return', circulation.return_by_borrow_id, borrow_id)
+
+
+def _posted_accession_numbers(data):
+    """Accession numbers from repeated accession_number fields and/or an
+    accession_numbers text box (one per line, or separated by commas/spaces)."""
+    accession_numbers = list(data.getlist('accession_number'))
+    accession_numbers += re.split(r'[\s,]+', data.get('accession_numbers', ''))
+    return [accession_number for accession_number in accession_numbers if accession_number.strip()]
+
+
+def _batch_response(operation, *args):
+    try:
+        results = operation(*args)
+    except circulation.CirculationError as e:
+        return JsonResponse({'ok': False, 'error': str(e)}, status=e.status)
+    done = sum(1 for result in results if result['ok'])
+    return JsonResponse({
+        'ok': done > 0,
+        'succeeded': done,
+        'failed': len(results) - done,
+        'results': results,
+        'counters': circulation.counters(),
+    })
+
+
+@staff_member_required
+@require_POST
+def circulation_checkout_batch(request):
+    """JSON batch checkout: POST student_id plus accession numbers; one result per book."""
+    student_id = request.POST.get('student_id', '').strip()
+    accession_numbers = _posted_accession_numbers(request.POST)
+    if not student_id or not accession_numbers:
+        return JsonResponse({'ok': False, 'error': 'A student_id and at least one accession number are required.'}, status=400)
+    return _batch_response(circulation.checkout_many, student_id, accession_numbers)
+
+
+@staff_member_required
+@require_POST
+def circulation_return_batch(request):
+    """JSON batch return: POST accession numbers; one result per book."""
+    accession_numbers = _posted_accession_numbers(request.POST)
+    if not accession_numbers:
+        return JsonResponse({'ok': False, 'error': 'At least one accession number is required.'}, status=400)
+    return _batch_response(circulation.return_many, accession_numbers)
+
 @staff_member_required
 @require_http_methods(["GET", "POST"])
 def admin_checkout(request):
     if request.method == 'POST':
-        book_id = request.POST.get('book_id')
-        student_id = request.POST.get('student_id')
+        book_id = request.POST.get('book_id', '').strip()
+        student_id = request.POST.get('student_id', '').strip()
         try:
-            borrow = BorrowHistory(bookID=book_id, accountID=student_id)
-            borrow.save()
+            circulation.checkout(book_id, student_id)
             messages.success(request, 'Book checked out successfully.')
             return redirect('admin_dashboard')
+        except circulation.CirculationError as e:
+            messages.error(request, str(e))
         except Exception as e:
             messages.error(request, str(e))
     book_copies = BookCopy.objects.filter(status='Available').select_related('book')
@@ -1409,38 +1453,13 @@ def admin_checkout(request):
 @require_http_methods(["GET", "POST"])
 def admin_return(request):
     if request.method == 'POST':
-        borrow_id = request.POST.get('borrow_id')
         try:
-            borrow = BorrowHistory.objects.get(id=borrow_id, returned=False)
-            borrow.returned = True
-            borrow.return_date = timezone.now()
-            borrow.save()
-            
-            # Update book copy status
-            if borrow.book_copy:
-                book_copy = borrow.book_copy
-                book_copy.status = 'Available'
-                book_copy.borrowed_by = None
-                book_copy.student_id = None
-                book_copy.borrow_date = None
-                book_copy.return_date = None
-                book_copy.save()
-            else:
-                # Fallback for legacy records without book_copy
-                try:
-                    book_copy = BookCopy.objects.get(accessionNumber=borrow.bookID)
-                    book_copy.status = 'Available'
-                    book_copy.borrowed_by = None
-                    book_copy.student_id = None
-                    book_copy.borrow_date = None
-                    book_copy.return_date = None
-                    book_copy.save()
-                except BookCopy.DoesNotExist:
-                    pass
-            
+            # Closes the loan with a conditional UPDATE, so a second desk
+            # returning the same loan gets "Borrow record not found."
+            circulation.return_by_borrow_id(request.POST.get('borrow_id'))
             messages.success(request, 'Book returned successfully.')
-        except BorrowHistory.DoesNotExist:
-            messages.error(request, 'Borrow record not found.')
+        except circulation.CirculationError as e:
+            messages.error(request, str(e))
         except Exception as e:
             messages.error(request, str(e))
         return redirect('admin_dashboard')
@@ -1467,6 +1486,21 @@ def admin_books(request):
         )
     return render(request, 'admin_books.html', {'books': books, 'search_query': search_query})
 
+@staff_member_required
+def admin_performance(request):
+    """Rolling per-view timing summary collected by profiling.ViewProfilingMiddleware."""
+    if request.method == 'POST':
+        profiling.reset_samples()
+        return redirect('admin_performance')
+    rows = profiling.summary()
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'window': profiling.PROFILE_SAMPLES, 'views': rows})
+    return render(request, 'admin_performance.html', {
+        'rows': rows,
+        'window': profiling.PROFILE_SAMPLES,
+        'log_path': getattr(settings, 'VIEW_PROFILE_LOG', None),
+    })
+
 @staff_member_required
 def admin_edit_book(request, book_id):
     try:
@@ -47,6 +47,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'lims_app.profiling.ViewProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -55,7 +56,8 @@ ROOT_URLCONF = 'lims_portal.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that times renders for lims_app/profiling.py
+        'BACKEND': 'lims_app.profiling.ProfiledDjangoTemplates',
         'DIRS': [str(Path(__file__).resolve().parent.parent / 'lims_app' / 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -80,9 +82,45 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # WAL lets readers (e.g. the analytics panel workers) run alongside a writer
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            'timeout': 20,
+            # atomic() blocks take the write lock at BEGIN, so they wait on
+            # 'timeout' instead of failing with "database is locked" when a
+            # read inside them has to be upgraded to a write
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # Tests run on a file too, so they get WAL and concurrent writers
+        # (StressTests) like production; the in-memory default cannot
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Per-view profiling (lims_app/profiling.py): a Server-Timing header for
+# staff, a summary at /library-admin/performance/ and, when set, a
+# JSON-lines log of every request. Views running more queries than their
+# budget (keyed by URL name) log a warning.
+VIEW_PROFILING = True
+VIEW_PROFILE_LOG = None  # e.g. BASE_DIR / 'view_profile.jsonl'
+VIEW_QUERY_BUDGETS = {
+    'records': 15,
+    'records_data': 15,
+    'books': 10,
+    'admin_analytics': 20,
+    'admin_analytics_panel': 10,
+    'admin_dashboard': 30,  # checkout/return POSTs; a plain GET runs about 7
+    'admin_sidebar_panel': 10,
+    'circulation_checkout': 30,
+    'circulation_return': 30,
+    'circulation_return_loan': 30,
+    'circulation_checkout_batch': 30,
+    'circulation_return_batch': 30,
+}
+
+# Threads used to compute analytics panels concurrently (1 = serial)
+ANALYTICS_MAX_WORKERS = 4
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators